@@ -0,0 +1,347 @@
+"""
+admission.py
+
+This module is an optional admission controller that sheds load before it
+reaches the routes.
+
+Without it every request is accepted and competes for the same event loop,
+threadpool and database: a burst of logins (each holding a bcrypt worker for
+tens of milliseconds) or a client hammering `GET /feed` slows every other
+route down with it. With `ADMISSION_CONTROL` enabled, every route belongs to
+a cost class, declared next to it with the `cost_class` decorator:
+
+- `cheap`: health and statistics endpoints, never limited by default so they
+  stay reachable under load;
+- `standard`: the default, regular reads and writes;
+- `expensive`: password hashing and batch endpoints;
+- `streaming`: long downloads such as exports, kept apart so that a slow
+  client holds one of their slots rather than one of the logins'.
+
+Each class has two limits, configured with `ADMISSION_<CLASS>_*`:
+
+- a per-client token bucket (`RATE` requests per second, bursts of `BURST`).
+  A client over its rate gets `429 Too Many Requests`, with a `Retry-After`
+  telling when its next token is due. Clients are told apart by address;
+  behind a proxy, run uvicorn with `--proxy-headers` so that the address is
+  the forwarded one. Buckets are kept for the `ADMISSION_MAX_CLIENTS` most
+  recent clients;
+- a concurrency limit (`CONCURRENCY` requests in flight) with a bounded
+  waiting queue (`QUEUE` requests). A request waits at most
+  `ADMISSION_QUEUE_TIMEOUT_MS` for a slot; when the queue is full or the wait
+  times out, it gets `503 Service Unavailable` with `Retry-After`.
+
+Both checks run before the request body is read or the user authenticated,
+so a shed request costs a route match and a few dictionary updates. A limit
+of 0 disables that check. All the state lives on the event loop, so it needs
+no lock; like the other in-memory structures, it is per process.
+
+In-flight requests, queue depths and rejections per class are served at
+`GET /admission` and exported at `GET /metrics`.
+"""
+
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Optional
+
+from fastapi.responses import ORJSONResponse
+from starlette.routing import Match
+
+from . import config
+
+# Cost class of the routes that do not declare one
+DEFAULT_CLASS = "standard"
+
+
+@dataclass(frozen=True, slots=True)
+class Limits:
+    """
+    Admission limits of a cost class.
+
+    Attributes:
+        concurrency (int): Requests in flight, 0 for no limit.
+        queue (int): Requests waiting for a slot beyond `concurrency`.
+        rate (float): Requests per second and per client, 0 for no limit.
+        burst (int): Requests a client may send at once before its rate applies.
+    """
+
+    concurrency: int
+    queue: int
+    rate: float
+    burst: int
+
+
+def cost_class(name: str):
+    """
+    Declares the cost class of a route. Apply it below the router decorator.
+
+    Args:
+        name (str): One of `config.ADMISSION_CLASSES`.
+
+    Example:
+        @router.post("/token")
+        @cost_class("expensive")
+        async def login(...):
+    """
+    if name not in config.ADMISSION_CLASSES:
+        raise ValueError(
+            f"Unknown cost class {name!r}, expected one of {config.ADMISSION_CLASSES}"
+        )
+
+    def decorator(endpoint):
+        endpoint.cost_class = name
+        return endpoint
+
+    return decorator
+
+
+class Rejected(Exception):
+    """
+    Raised when a request is shed.
+
+    Attributes:
+        status (int): 429 or 503.
+        retry_after (int): Seconds the client should wait before retrying.
+        detail (str): Message of the response.
+    """
+
+    def __init__(self, status: int, retry_after: int, detail: str):
+        super().__init__(detail)
+        self.status = status
+        self.retry_after = retry_after
+        self.detail = detail
+
+
+class CostClass:
+    """
+    Concurrency limit, waiting queue and per-client token buckets of a cost class.
+
+    Attributes:
+        name (str): Name of the class.
+        limits (Limits): Its limits.
+        queue_timeout (float): Seconds a request may wait for a slot.
+        max_clients (int): Token buckets kept, least recently used evicted first.
+    """
+
+    def __init__(
+        self, name: str, limits: Limits, queue_timeout: float, max_clients: int
+    ):
+        self.name = name
+        self.limits = limits
+        self.queue_timeout = queue_timeout
+        self.max_clients = max_clients
+        self.in_flight = 0
+        self._waiters: deque = deque()
+        # client -> (tokens, monotonic time they were counted at)
+        self._buckets: OrderedDict = OrderedDict()
+        self.admitted = 0
+        self.rejected = {"rate": 0, "busy": 0, "timeout": 0}
+
+    def check_rate(self, client: str, now: float):
+        """
+        Takes a token from the client's bucket.
+
+        Args:
+            client (str): Address of the client.
+            now (float): Current monotonic time.
+
+        Raises:
+            Rejected: 429 if the bucket is empty.
+        """
+        rate, burst = self.limits.rate, self.limits.burst
+        if rate <= 0:
+            return
+
+        tokens, counted_at = self._buckets.pop(client, (burst, now))
+        tokens = min(burst, tokens + (now - counted_at) * rate)
+        if tokens < 1:
+            self._buckets[client] = (tokens, now)
+            self.rejected["rate"] += 1
+            raise Rejected(
+                429,
+                math.ceil((1 - tokens) / rate),
+                "Too many requests, slow down",
+            )
+
+        self._buckets[client] = (tokens - 1, now)
+        if len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+
+    async def acquire(self):
+        """
+        Takes a concurrency slot, waiting in the queue if none is free.
+
+        Raises:
+            Rejected: 503 if the queue is full or the wait timed out.
+        """
+        limit = self.limits.concurrency
+        if limit <= 0 or (self.in_flight < limit and not self._waiters):
+            self.in_flight += 1
+            self.admitted += 1
+            return
+
+        if len(self._waiters) >= self.limits.queue:
+            self.rejected["busy"] += 1
+            raise Rejected(503, 1, "Server busy, try again later")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._forget(waiter)
+            self.rejected["timeout"] += 1
+            raise Rejected(503, 1, "Server busy, try again later")
+        except asyncio.CancelledError:
+            self._forget(waiter)
+            raise
+        self.admitted += 1
+
+    def _forget(self, waiter: asyncio.Future):
+        if waiter.done() and not waiter.cancelled():
+            # The slot was handed over just as the wait ended: pass it on
+            self.release()
+        elif waiter in self._waiters:
+            # Unless a release already skipped it
+            self._waiters.remove(waiter)
+
+    def release(self):
+        """
+        Gives a slot back, handing it to the oldest waiting request if any.
+        """
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # The slot changes hands: `in_flight` stays the same
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def stats(self) -> dict:
+        """
+        Returns the limits, queue depth and counters of the class, for monitoring.
+
+        Returns:
+            dict: in-flight and queued requests, limits, tracked clients,
+            admitted requests and rejections by reason.
+        """
+        return {
+            "in_flight": self.in_flight,
+            "queued": len(self._waiters),
+            "concurrency_limit": self.limits.concurrency,
+            "queue_limit": self.limits.queue,
+            "rate": self.limits.rate,
+            "burst": self.limits.burst,
+            "clients": len(self._buckets),
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+        }
+
+
+classes = {
+    name: CostClass(
+        name,
+        Limits(*config.ADMISSION_LIMITS[name]),
+        config.ADMISSION_QUEUE_TIMEOUT,
+        config.ADMISSION_MAX_CLIENTS,
+    )
+    for name in config.ADMISSION_CLASSES
+}
+
+
+def stats() -> dict:
+    """
+    Returns the statistics of every cost class.
+
+    Returns:
+        dict: Whether admission control is enabled, and `CostClass.stats` by class.
+    """
+    return {
+        "enabled": config.ADMISSION_CONTROL,
+        "classes": {name: cost.stats() for name, cost in classes.items()},
+    }
+
+
+def render() -> str:
+    """
+    Renders the admission gauges and counters in the Prometheus text format.
+
+    Returns:
+        str: The exposition, empty when admission control is disabled.
+    """
+    if not config.ADMISSION_CONTROL:
+        return ""
+
+    snapshot = {name: cost.stats() for name, cost in classes.items()}
+    lines = []
+    for name, kind, description, key in (
+        ("bog_admission_in_flight", "gauge", "Requests in flight", "in_flight"),
+        ("bog_admission_queue_depth", "gauge", "Requests waiting", "queued"),
+        ("bog_admission_admitted_total", "counter", "Requests admitted", "admitted"),
+    ):
+        lines += [
+            f"# HELP {name} {description}, by cost class.",
+            f"# TYPE {name} {kind}",
+        ]
+        for cost, values in snapshot.items():
+            lines.append(f'{name}{{class="{cost}"}} {values[key]}')
+
+    lines += [
+        "# HELP bog_admission_rejected_total Requests shed, by cost class and reason.",
+        "# TYPE bog_admission_rejected_total counter",
+    ]
+    for cost, values in snapshot.items():
+        for reason, count in values["rejected"].items():
+            lines.append(
+                f'bog_admission_rejected_total{{class="{cost}",reason="{reason}"}} {count}'
+            )
+    return "\n".join(lines) + "\n"
+
+
+def _route(routes: list, scope) -> tuple[Optional[object], dict]:
+    # Same matching as the router; it runs after this middleware
+    for route in routes:
+        match, child_scope = route.matches(scope)
+        if match == Match.FULL:
+            return route, child_scope
+    return None, {}
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware admitting or shedding every request by its route's cost class.
+    """
+
+    def __init__(self, app, routes: list):
+        self.app = app
+        # The router's own list, so routes included later are seen too
+        self.routes = routes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        route, child_scope = _route(self.routes, scope)
+        name = getattr(getattr(route, "endpoint", None), "cost_class", DEFAULT_CLASS)
+        cost = classes[name]
+        client = scope["client"][0] if scope.get("client") else "unknown"
+
+        try:
+            cost.check_rate(client, time.monotonic())
+            await cost.acquire()
+        except Rejected as rejection:
+            # Lets the metrics label the rejection with its route
+            scope.update(child_scope)
+            response = ORJSONResponse(
+                {"detail": rejection.detail},
+                status_code=rejection.status,
+                headers={"Retry-After": str(rejection.retry_after)},
+            )
+            return await response(scope, receive, send)
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            cost.release()
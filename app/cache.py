@@ -0,0 +1,217 @@
+"""
+cache.py
+
+This module provides the cache backends of the application.
+
+`CacheBackend` is the interface every backend implements, so that a cache can
+be moved out of process (for example to a local cache server) without
+touching its callers; `load_backend` builds one from a configuration string.
+`LRUCache` is the in-process implementation: bounded, with per-entry TTL,
+thread-safe, and never blocking across IO. Every operation holds the lock
+only for a few dictionary operations, so it is safe to use from both
+threadpool workers and the event loop.
+
+Classes:
+- CacheBackend: interface of a key-value cache with statistics.
+- LRUCache: size- and TTL-bounded least-recently-used cache with hit/miss statistics.
+- NullCache: backend that stores nothing, to disable a cache.
+"""
+
+import importlib
+import threading
+import time
+from collections import OrderedDict
+
+# Returned by `LRUCache.get` when a key is absent or expired
+MISSING = object()
+
+
+class CacheBackend:
+    """
+    Interface of a cache backend.
+
+    Callers that may be configured with a backend outside the process use
+    string keys and int, string or bytes values, which such a backend can
+    store as they are. Implementations must be safe to call from several
+    threads.
+    """
+
+    def get(self, key):
+        """
+        Looks up a key.
+
+        Returns:
+            Any: The cached value, or `MISSING` if absent or expired.
+        """
+        raise NotImplementedError
+
+    def set(self, key, value):
+        """
+        Stores a value.
+        """
+        raise NotImplementedError
+
+    def delete(self, key):
+        """
+        Removes a key if present.
+        """
+        raise NotImplementedError
+
+    def clear(self):
+        """
+        Removes every entry.
+        """
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        """
+        Returns the backend statistics, at least hits, misses and evictions.
+        """
+        raise NotImplementedError
+
+
+class LRUCache(CacheBackend):
+    """
+    Size- and TTL-bounded LRU cache.
+
+    Attributes:
+        maxsize (int): Maximum number of entries before the least recently used is evicted.
+        ttl (float): Lifetime of an entry in seconds.
+        hits (int): Number of lookups that found a live entry.
+        misses (int): Number of lookups that found nothing or an expired entry.
+        evictions (int): Number of entries dropped to respect `maxsize`.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Looks up a key and marks it as recently used.
+
+        Args:
+            key (Hashable): Cache key.
+
+        Returns:
+            Any: The cached value, or `MISSING` if absent or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return MISSING
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        """
+        Stores a value, evicting the least recently used entries if full.
+
+        Args:
+            key (Hashable): Cache key.
+            value (Any): Value to store.
+        """
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        """
+        Removes a key if present.
+
+        Args:
+            key (Hashable): Cache key.
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """
+        Removes every entry. Statistics are kept.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """
+        Returns a snapshot of the cache statistics.
+
+        Returns:
+            dict: size, maxsize, hits, misses, evictions and hit_ratio.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class NullCache(CacheBackend):
+    """
+    Backend that stores nothing: every lookup is a miss.
+    """
+
+    def __init__(self):
+        self.misses = 0
+
+    def get(self, key):
+        self.misses += 1
+        return MISSING
+
+    def set(self, key, value):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+    def stats(self) -> dict:
+        return {"size": 0, "hits": 0, "misses": self.misses, "evictions": 0}
+
+
+def load_backend(spec: str, maxsize: int, ttl: float) -> CacheBackend:
+    """
+    Builds a cache backend from a configuration string.
+
+    Args:
+        spec (str): "memory" for an `LRUCache`, "none" for a `NullCache`, or
+            "package.module:factory" for a custom backend; the factory is
+            called with `maxsize` and `ttl`.
+        maxsize (int): Maximum number of entries.
+        ttl (float): Lifetime of an entry in seconds.
+
+    Returns:
+        CacheBackend: The backend.
+
+    Raises:
+        ValueError: If the spec is not recognised.
+    """
+    if spec == "memory":
+        return LRUCache(maxsize=maxsize, ttl=ttl)
+    if spec == "none":
+        return NullCache()
+    if ":" in spec:
+        module, factory = spec.split(":", 1)
+        return getattr(importlib.import_module(module), factory)(maxsize, ttl)
+
+    raise ValueError(f"Unknown cache backend {spec!r}")
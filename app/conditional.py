@@ -0,0 +1,238 @@
+"""
+conditional.py
+
+This module adds conditional GET support (ETag / Last-Modified / 304) to
+read routes.
+
+A route opts in by depending on `conditional(version)`, where `version` is a
+dependency returning a `Version` of the resource: a cheap token that changes
+whenever the resource does, and the time of that change. The dependency runs
+before the route body, sets `ETag`, `Last-Modified` and `Cache-Control` on the
+response, and answers `304 Not Modified` when the client's `If-None-Match` (or,
+failing that, `If-Modified-Since`) shows its copy is current, so the route
+itself never runs and no rows are loaded.
+
+The ETag also covers the query string, so every page or variant of a
+resource gets its own tag.
+
+The post listing of a user is versioned by the `postsVersion` and
+`postsModified` columns of `Users`, bumped with `touch` / `touch_author` in
+the same transaction as every write that changes what the listing shows
+(posts created, updated or deleted, likes added or removed). When posts are
+sharded, the version lives in the `listing_versions` table of the author's
+shard instead, so that likes never write to the directory (see `sharding.py`).
+"""
+
+import hashlib
+import time
+from dataclasses import dataclass
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Depends, HTTPException, Request, Response, status
+from sqlalchemy import literal, select, true, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from . import feedcache, sharding
+from .database import SessionRunner, get_read_db
+from .models import Post, User, listing_versions
+
+
+@dataclass(frozen=True, slots=True)
+class Version:
+    """
+    Version of a resource.
+
+    Attributes:
+        tag (str): Opaque token that changes whenever the resource changes.
+        modified (int): Unix time of the last change.
+    """
+
+    tag: str
+    modified: int
+
+
+def touch(db: Session, user_id: int):
+    """
+    Bumps the version of a user's post listing. The caller owns the commit.
+
+    Args:
+        db (Session): SQLAlchemy session.
+        user_id (int): ID of the author whose posts changed.
+    """
+    if sharding.ENABLED:
+        _touch_listing(db, select(literal(user_id)).where(true()))
+        return
+
+    db.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(postsVersion=User.postsVersion + 1, postsModified=int(time.time()))
+    )
+
+
+def touch_author(db: Session, post_id: int):
+    """
+    Bumps the version of the post listing that contains a post.
+
+    Args:
+        db (Session): SQLAlchemy session.
+        post_id (int): ID of the post that changed.
+    """
+    if sharding.ENABLED:
+        _touch_listing(db, select(Post.author).where(Post.id == post_id))
+        return
+
+    author = select(Post.author).where(Post.id == post_id).scalar_subquery()
+    db.execute(
+        update(User)
+        .where(User.id == author)
+        .values(postsVersion=User.postsVersion + 1, postsModified=int(time.time()))
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _touch_listing(db: Session, authors):
+    # Upserts the shard-side version of the authors selected by `authors`
+    now = int(time.time())
+    statement = insert(listing_versions).from_select(
+        ["author", "version", "modified"],
+        authors.add_columns(literal(1), literal(now)),
+    )
+    db.execute(
+        statement.on_conflict_do_update(
+            index_elements=["author"],
+            set_={"version": listing_versions.c.version + 1, "modified": now},
+        )
+    )
+
+
+def touch_all(db: Session):
+    """
+    Bumps the version of every post listing, after data was loaded in bulk.
+
+    Args:
+        db (Session): SQLAlchemy session.
+    """
+    db.execute(
+        update(User)
+        .values(postsVersion=User.postsVersion + 1, postsModified=int(time.time()))
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def userPostsVersion(
+    username: str, db: SessionRunner = Depends(get_read_db)
+) -> Version:
+    """
+    Dependency returning the version of a user's post listing.
+
+    With shards, the user is resolved in the directory and the version read
+    from the author's shard.
+
+    Raises:
+        HTTPException: 404 if the user does not exist.
+    """
+    if not sharding.ENABLED:
+        return await db.run_sync(_userPostsVersion, username)
+
+    user_id = await db.run_sync(feedcache.user_id, username)
+    if user_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
+        )
+
+    return await sharding.run(
+        db, sharding.shard_of_author(user_id), _listingVersion, user_id
+    )
+
+
+def _userPostsVersion(db: Session, username: str) -> Version:
+    row = db.execute(
+        select(User.id, User.postsVersion, User.postsModified).where(
+            User.username == username
+        )
+    ).first()
+
+    if row is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
+        )
+
+    return Version(tag=f"u{row.id}.{row.postsVersion}", modified=row.postsModified)
+
+
+def _listingVersion(db: Session, user_id: int) -> Version:
+    row = db.execute(
+        select(listing_versions.c.version, listing_versions.c.modified).where(
+            listing_versions.c.author == user_id
+        )
+    ).first()
+    version, modified = row or (0, 0)
+
+    return Version(tag=f"u{user_id}.{version}", modified=modified)
+
+
+def _etag(version: Version, query: str) -> str:
+    tag = version.tag
+    if query:
+        tag += "." + hashlib.blake2s(query.encode(), digest_size=8).hexdigest()
+    return f'"{tag}"'
+
+
+def _matches(if_none_match: str, etag: str) -> bool:
+    # If-None-Match uses the weak comparison: W/ prefixes are ignored
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or any(
+        candidate.removeprefix("W/") == etag for candidate in candidates
+    )
+
+
+def _not_modified_since(if_modified_since: str, modified: int) -> bool:
+    try:
+        return modified <= parsedate_to_datetime(if_modified_since).timestamp()
+    except (TypeError, ValueError):
+        return False
+
+
+def conditional(version):
+    """
+    Builds a dependency that makes a GET route conditional.
+
+    Args:
+        version (Callable): Dependency returning the `Version` of the resource.
+
+    Returns:
+        Callable: Dependency to add to the route; it returns the `Version`.
+
+    Example:
+        @router.get("/{username}")
+        async def getPosts(..., _: Version = Depends(conditional(userPostsVersion))):
+    """
+
+    async def dependency(
+        request: Request, response: Response, current: Version = Depends(version)
+    ) -> Version:
+        etag = _etag(current, request.url.query)
+        headers = {
+            "ETag": etag,
+            "Last-Modified": formatdate(current.modified, usegmt=True),
+            "Cache-Control": "no-cache",
+        }
+
+        if_none_match: Optional[str] = request.headers.get("if-none-match")
+        if_modified_since = request.headers.get("if-modified-since")
+        if (if_none_match is not None and _matches(if_none_match, etag)) or (
+            if_none_match is None
+            and if_modified_since is not None
+            and _not_modified_since(if_modified_since, current.modified)
+        ):
+            raise HTTPException(
+                status_code=status.HTTP_304_NOT_MODIFIED, headers=headers
+            )
+
+        response.headers.update(headers)
+        return current
+
+    return dependency
@@ -0,0 +1,183 @@
+"""
+config.py
+
+This module reads the runtime configuration of the application from
+environment variables, so deployments can be tuned without code changes.
+
+Variables:
+- DATABASE_URL: SQLAlchemy URL of the database (default "sqlite:///blog.db").
+- ASYNC_DATABASE_URL: URL used in async mode (default: DATABASE_URL with the
+  aiosqlite driver).
+- DATABASE_PROFILE: SQLite tuning profile, "default" (SQLite's own settings)
+  or "production" (WAL, synchronous=NORMAL, 64 MiB page cache, 256 MiB mmap,
+  5 s busy timeout).
+- SQLITE_JOURNAL_MODE, SQLITE_SYNCHRONOUS, SQLITE_CACHE_SIZE, SQLITE_MMAP_SIZE,
+  SQLITE_BUSY_TIMEOUT: Override a single pragma of the selected profile.
+- DB_POOL_SIZE / DB_MAX_OVERFLOW: Connection pool bounds (default 5 / -1).
+  Overflow must stay unbounded (-1) in sync mode, see `database.py`.
+- DB_READ_POOL: When "1"/"true", GET routes use a separate pool of
+  read-only connections (default off).
+- DB_READ_POOL_SIZE: Size of the read-only pool (default: DB_POOL_SIZE).
+- SHARDS: Number of SQLite files posts and likes are partitioned across, by
+  author (default 0: everything stays in DATABASE_URL). With shards, the
+  DATABASE_URL database is the directory of users, follows and timelines;
+  see `sharding.py`.
+- SHARD_URL: URL of the shard files, with a `{shard}` placeholder (default:
+  DATABASE_URL with `.shard{shard}` before the extension, e.g.
+  "sqlite:///blog.shard0.db").
+- DATABASE_MODE: "sync" (default) runs database work on FastAPI's threadpool
+  with the blocking SQLAlchemy session; "async" runs it on an `AsyncSession`
+  over the aiosqlite driver, without occupying threadpool workers.
+- PRINCIPAL_CACHE_SIZE: Maximum number of authenticated users kept in the
+  principal cache (default 10000).
+- PRINCIPAL_CACHE_TTL: Seconds a cached principal stays valid (default 60).
+- AUTH_TRUST_TOKEN: When "1"/"true", principals missing from the cache are
+  built from the verified JWT claims instead of being loaded from the
+  database (default off).
+- FEED_CACHE_BACKEND: Backend of the user feed cache: "memory" (default, an
+  in-process LRU), "none" (disabled) or "package.module:factory" for a custom
+  `cache.CacheBackend`.
+- FEED_CACHE_SIZE: Maximum number of entries in the feed cache (default 10000).
+- FEED_CACHE_TTL: Seconds a feed cache entry stays valid (default 30).
+- METRICS_ENABLED: Request and SQL instrumentation served at `/metrics`
+  (default on; "0"/"false" disables it).
+- QUERY_GUARD: N+1 query detector for development and tests: "off"
+  (default), "log" (log requests over their query budget) or "raise" (also
+  raise `QueryBudgetExceeded`, failing the test that made the request).
+- QUERY_GUARD_REPEATS: Executions of one statement shape allowed per request
+  before it is reported as an N+1 query (default 2), unless the route's
+  budget says otherwise.
+- WRITE_QUEUE: When "1"/"true", likes, unlikes, follows and unfollows are
+  committed in batches by a single writer (default off, see `writequeue.py`).
+- WRITE_QUEUE_INTERVAL_MS: Milliseconds the writer waits for more writes to
+  join a batch (default 2).
+- WRITE_QUEUE_MAX_BATCH: Maximum writes committed in one transaction
+  (default 1000).
+- WRITE_QUEUE_LIMIT: Writes allowed to wait for the writer before new ones
+  are refused with 503 (default 10000).
+- BCRYPT_ROUNDS: bcrypt cost factor for new hashes (default 12). Stored hashes
+  with another cost are rehashed on the next successful login.
+- HASH_WORKERS: Number of processes that hash and verify passwords
+  (default: number of CPUs).
+- HASH_QUEUE_LIMIT: Hashing operations allowed to wait for a worker before
+  new ones are refused with 503 (default 64).
+- ADMISSION_CONTROL: When "1"/"true", requests are admitted by the cost class
+  of their route, and shed with 429 or 503 beyond its limits (default off,
+  see `admission.py`).
+- ADMISSION_<CLASS>_CONCURRENCY, ADMISSION_<CLASS>_QUEUE, ADMISSION_<CLASS>_RATE,
+  ADMISSION_<CLASS>_BURST: Limits of the CHEAP, STANDARD, EXPENSIVE and
+  STREAMING cost classes: requests in flight, requests waiting for a slot, requests per
+  second per client and burst size (defaults in `ADMISSION_DEFAULTS`; 0
+  disables a limit).
+- ADMISSION_QUEUE_TIMEOUT_MS: Milliseconds a request may wait for a slot
+  before it is refused with 503 (default 1000).
+- ADMISSION_MAX_CLIENTS: Clients whose rate is tracked per class (default 100000).
+"""
+
+import os
+
+
+def _flag(name: str, default: str = "") -> bool:
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///blog.db")
+ASYNC_DATABASE_URL = os.getenv(
+    "ASYNC_DATABASE_URL", DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1)
+)
+
+# None leaves SQLite's built-in default in place
+DATABASE_PROFILES = {
+    "default": {
+        "journal_mode": None,
+        "synchronous": None,
+        "cache_size": None,
+        "mmap_size": None,
+        "busy_timeout": None,
+    },
+    "production": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -65536,
+        "mmap_size": 268435456,
+        "busy_timeout": 5000,
+    },
+}
+
+DATABASE_PROFILE = os.getenv("DATABASE_PROFILE", "default").lower()
+
+if DATABASE_PROFILE not in DATABASE_PROFILES:
+    raise ValueError(
+        f"DATABASE_PROFILE must be one of {sorted(DATABASE_PROFILES)}, "
+        f"not {DATABASE_PROFILE!r}"
+    )
+
+SQLITE_PRAGMAS = {
+    name: os.getenv(f"SQLITE_{name.upper()}", value)
+    for name, value in DATABASE_PROFILES[DATABASE_PROFILE].items()
+}
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "-1"))
+DB_READ_POOL = _flag("DB_READ_POOL")
+DB_READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", str(DB_POOL_SIZE)))
+
+_root, _extension = os.path.splitext(DATABASE_URL)
+SHARDS = int(os.getenv("SHARDS", "0"))
+SHARD_URL = os.getenv("SHARD_URL", f"{_root}.shard{{shard}}{_extension}")
+
+DATABASE_MODE = os.getenv("DATABASE_MODE", "sync").lower()
+
+if DATABASE_MODE not in ("sync", "async"):
+    raise ValueError(f"DATABASE_MODE must be 'sync' or 'async', not {DATABASE_MODE!r}")
+
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+AUTH_TRUST_TOKEN = _flag("AUTH_TRUST_TOKEN")
+
+FEED_CACHE_BACKEND = os.getenv("FEED_CACHE_BACKEND", "memory")
+FEED_CACHE_SIZE = int(os.getenv("FEED_CACHE_SIZE", "10000"))
+FEED_CACHE_TTL = float(os.getenv("FEED_CACHE_TTL", "30"))
+
+METRICS_ENABLED = _flag("METRICS_ENABLED", "1")
+
+QUERY_GUARD = os.getenv("QUERY_GUARD", "off").lower()
+
+if QUERY_GUARD not in ("off", "log", "raise"):
+    raise ValueError(
+        f"QUERY_GUARD must be 'off', 'log' or 'raise', not {QUERY_GUARD!r}"
+    )
+
+QUERY_GUARD_REPEATS = int(os.getenv("QUERY_GUARD_REPEATS", "2"))
+
+WRITE_QUEUE = _flag("WRITE_QUEUE")
+WRITE_QUEUE_INTERVAL = float(os.getenv("WRITE_QUEUE_INTERVAL_MS", "2")) / 1000
+WRITE_QUEUE_MAX_BATCH = int(os.getenv("WRITE_QUEUE_MAX_BATCH", "1000"))
+WRITE_QUEUE_LIMIT = int(os.getenv("WRITE_QUEUE_LIMIT", "10000"))
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(os.cpu_count() or 1)))
+HASH_QUEUE_LIMIT = int(os.getenv("HASH_QUEUE_LIMIT", "64"))
+
+ADMISSION_CONTROL = _flag("ADMISSION_CONTROL")
+
+# (concurrency, queue, rate, burst) of each cost class
+ADMISSION_DEFAULTS = {
+    "cheap": (0, 0, 0, 0),
+    "standard": (64, 256, 50, 100),
+    "expensive": (HASH_WORKERS * 2, HASH_QUEUE_LIMIT, 1, 5),
+    # Long downloads, which hold their slot until the client has read them
+    "streaming": (4, 0, 0.1, 2),
+}
+ADMISSION_CLASSES = tuple(ADMISSION_DEFAULTS)
+ADMISSION_LIMITS = {
+    name: (
+        int(os.getenv(f"ADMISSION_{name.upper()}_CONCURRENCY", str(concurrency))),
+        int(os.getenv(f"ADMISSION_{name.upper()}_QUEUE", str(queue))),
+        float(os.getenv(f"ADMISSION_{name.upper()}_RATE", str(rate))),
+        int(os.getenv(f"ADMISSION_{name.upper()}_BURST", str(burst))),
+    )
+    for name, (concurrency, queue, rate, burst) in ADMISSION_DEFAULTS.items()
+}
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_MS", "1000")) / 1000
+ADMISSION_MAX_CLIENTS = int(os.getenv("ADMISSION_MAX_CLIENTS", "100000"))
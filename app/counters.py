@@ -0,0 +1,136 @@
+"""
+counters.py
+
+This module maintains the denormalized counters stored on `User` and `Post`.
+
+Every write to the `follow` or `likes` association tables, and every post
+creation or deletion, adjusts the matching counters with a relative
+`UPDATE ... SET x = x + :delta` in the same transaction, so reading a count
+is a column read instead of loading a whole relationship.
+
+`recompute` rebuilds every counter from the source tables in bulk, and can be
+run from the command line after imports or manual edits:
+
+    python -m app.manage reconcile-counters
+"""
+
+from sqlalchemy import func, select, true, update
+from sqlalchemy.orm import Session
+
+from .models import Post, User, follow, likes
+
+
+def adjust_follow(db: Session, follower_id: int, followee_id: int, delta: int):
+    """
+    Adjusts the counters affected by a follow (delta=1) or unfollow (delta=-1).
+
+    Args:
+        db (Session): SQLAlchemy session.
+        follower_id (int): ID of the user following or unfollowing.
+        followee_id (int): ID of the user being followed or unfollowed.
+        delta (int): Amount to add to both counters.
+    """
+    db.execute(
+        update(User)
+        .where(User.id == follower_id)
+        .values(followingCount=User.followingCount + delta)
+    )
+    db.execute(
+        update(User)
+        .where(User.id == followee_id)
+        .values(followersCount=User.followersCount + delta)
+    )
+
+
+def adjust_posts(db: Session, author_id: int, delta: int):
+    """
+    Adjusts the post counter of an author.
+
+    Args:
+        db (Session): SQLAlchemy session.
+        author_id (int): ID of the author.
+        delta (int): Amount to add to the counter.
+    """
+    db.execute(
+        update(User)
+        .where(User.id == author_id)
+        .values(postsCount=User.postsCount + delta)
+    )
+
+
+def adjust_likes(db: Session, post_id: int, delta: int):
+    """
+    Adjusts the like counter of a post.
+
+    Args:
+        db (Session): SQLAlchemy session.
+        post_id (int): ID of the post.
+        delta (int): Amount to add to the counter.
+    """
+    db.execute(
+        update(Post)
+        .where(Post.id == post_id)
+        .values(likesCount=Post.likesCount + delta)
+    )
+
+
+def recompute(db: Session):
+    """
+    Recomputes every counter from the association tables in bulk.
+
+    Each counter is rebuilt with a single correlated `UPDATE`, so the cost is
+    one pass per counter rather than one query per row. The caller owns the commit.
+
+    Args:
+        db (Session): SQLAlchemy session.
+    """
+    recompute_follows(db)
+    recompute_posts(db)
+
+
+def recompute_follows(db: Session):
+    """
+    Recomputes the follower and following counters. The caller owns the commit.
+
+    Args:
+        db (Session): SQLAlchemy session.
+    """
+    followers = (
+        select(func.count()).where(follow.c.followee == User.id).scalar_subquery()
+    )
+    following = (
+        select(func.count()).where(follow.c.follower == User.id).scalar_subquery()
+    )
+
+    db.execute(
+        update(User)
+        .values(followersCount=followers, followingCount=following)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def recompute_posts(db: Session, authors=true()):
+    """
+    Recomputes the post counters of authors and the like counters of posts.
+    The caller owns the commit.
+
+    Args:
+        db (Session): SQLAlchemy session.
+        authors (ColumnElement): Condition on `Users` selecting the authors
+            whose posts the session holds (all of them without shards, see
+            `sharding.authors_of`).
+    """
+    posts = select(func.count()).where(Post.author == User.id).scalar_subquery()
+    liked = select(func.count()).where(likes.c.likedPost == Post.id).scalar_subquery()
+
+    db.execute(
+        update(User)
+        .where(authors)
+        .values(postsCount=posts)
+        .execution_options(synchronize_session=False)
+    )
+    db.execute(
+        update(Post)
+        .values(likesCount=liked)
+        .execution_options(synchronize_session=False)
+    )
@@ -5,32 +5,242 @@ This module sets up the SQLAlchemy database engine, sessionmaker, and base class
 for ORM models. It provides a dependency function `get_db` to be used with FastAPI
 routes for managing database sessions.
 
-Database: SQLite (blog.db)
+Database: SQLite (blog.db), or any URL given in `DATABASE_URL`.
 
 Also it offers the flexibility to use what ever the database server we want like Postgres, etc.
+
+SQLite connections are tuned through connect-event hooks with the pragmas of the
+selected `DATABASE_PROFILE` (journal mode, synchronous, cache and mmap size, busy
+timeout). GET routes can use a separate read-only pool through `get_read_db`.
+Every engine is instrumented with the SQL timers of `metrics.py`, and with the
+N+1 detector of `queryguard.py` when it is enabled. When posts are sharded
+(`SHARDS`), this engine serves the directory database and `sharding.py` builds
+one more engine per shard with the same helper.
+
+Two execution modes are available, selected by `DATABASE_MODE` (see `config.py`):
+- sync:  the blocking `SessionLocal` runs on FastAPI's threadpool.
+- async: an `AsyncSession` over aiosqlite runs on the event loop.
+
+Route handlers are written once for both: they are `async def` and run their
+database work as a plain function of a sync `Session` through `db.run_sync(...)`,
+which `AsyncSession` and `ThreadedSession` both provide.
 """
 
-from sqlalchemy import create_engine
+import re
+from contextlib import asynccontextmanager
+from typing import Optional, Union
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base, sessionmaker
+from starlette.concurrency import run_in_threadpool
+
+from . import config, metrics, queryguard
 
 Base = declarative_base()
-engine = create_engine("sqlite:///blog.db", connect_args={"check_same_thread": False})
+
+_PRAGMA_VALUE = re.compile(r"^-?[A-Za-z0-9]+$")
+
+
+# Pragmas that apply to one database file of a connection, not the whole connection
+_SCHEMA_PRAGMAS = ("journal_mode", "synchronous", "cache_size", "mmap_size")
+
+
+def _pragma_hook(read_only: bool, attach: Optional[str] = None):
+    """
+    Builds a connect-event listener applying the configured SQLite pragmas.
+
+    Args:
+        read_only (bool): Also set `query_only`, rejecting every write on the connection.
+        attach (Optional[str]): Path of a database file to attach as `directory`
+            (see `sharding.py`); the file pragmas are applied to it too.
+
+    Returns:
+        Callable: Listener for the engine's `connect` event.
+    """
+    pragmas = {
+        name: str(value)
+        for name, value in config.SQLITE_PRAGMAS.items()
+        if value is not None
+    }
+    for name, value in pragmas.items():
+        if not _PRAGMA_VALUE.match(value):
+            raise ValueError(f"Invalid value for SQLite pragma {name}: {value!r}")
+    if read_only:
+        pragmas["query_only"] = "ON"
+
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if attach is not None:
+            cursor.execute("ATTACH DATABASE ? AS directory", (attach,))
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+            if attach is not None and name in _SCHEMA_PRAGMAS:
+                cursor.execute(f"PRAGMA directory.{name}={value}")
+        cursor.close()
+
+    return on_connect
+
+
+def make_engine(
+    url: str,
+    pool_size: int,
+    read_only: bool = False,
+    is_async=False,
+    attach: Optional[str] = None,
+):
+    """
+    Creates an engine with the configured pool bounds and, for SQLite, pragmas.
+
+    A request holds its connection across several threadpool hops (dependencies,
+    handler, close). In sync mode a bounded pool could leave every worker thread
+    waiting on a checkout while the holders wait for a thread, which is why
+    `DB_MAX_OVERFLOW` defaults to unbounded.
+
+    Args:
+        url (str): SQLAlchemy database URL.
+        pool_size (int): Number of connections kept open.
+        read_only (bool): Open connections in query-only mode (SQLite only).
+        is_async (bool): Create an `AsyncEngine`.
+        attach (Optional[str]): Database file to attach to every connection as
+            `directory` (SQLite only).
+
+    Returns:
+        Engine | AsyncEngine: The configured engine.
+    """
+    is_sqlite = url.startswith("sqlite")
+    options = {"pool_size": pool_size, "max_overflow": config.DB_MAX_OVERFLOW}
+    if is_sqlite and (":memory:" in url or url.split("://", 1)[1] in ("", "/")):
+        # In-memory databases use a single shared connection, not a queue pool
+        options = {}
+
+    if is_async:
+        new_engine = create_async_engine(url, **options)
+        sync_engine = new_engine.sync_engine
+    else:
+        if is_sqlite:
+            options["connect_args"] = {"check_same_thread": False}
+        new_engine = sync_engine = create_engine(url, **options)
+
+    if is_sqlite:
+        event.listen(sync_engine, "connect", _pragma_hook(read_only, attach))
+    if config.METRICS_ENABLED:
+        metrics.instrument_engine(sync_engine)
+    if config.QUERY_GUARD != "off":
+        queryguard.instrument_engine(sync_engine)
+    return new_engine
+
+
+engine = make_engine(config.DATABASE_URL, config.DB_POOL_SIZE)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+read_engine = engine
+ReadSessionLocal = SessionLocal
+
+if config.DB_READ_POOL:
+    read_engine = make_engine(
+        config.DATABASE_URL, config.DB_READ_POOL_SIZE, read_only=True
+    )
+    ReadSessionLocal = sessionmaker(autoflush=False, bind=read_engine)
+
+async_engine = None
+AsyncSessionLocal = None
+AsyncReadSessionLocal = None
+
+if config.DATABASE_MODE == "async":
+    async_engine = make_engine(
+        config.ASYNC_DATABASE_URL, config.DB_POOL_SIZE, is_async=True
+    )
+    # Objects outlive the greenlet that loaded them, so they must not expire on
+    # commit: a later attribute access would need IO outside of `run_sync`.
+    AsyncSessionLocal = async_sessionmaker(
+        async_engine, autoflush=False, expire_on_commit=False
+    )
+    AsyncReadSessionLocal = AsyncSessionLocal
 
-def get_db():
+    if config.DB_READ_POOL:
+        AsyncReadSessionLocal = async_sessionmaker(
+            make_engine(
+                config.ASYNC_DATABASE_URL,
+                config.DB_READ_POOL_SIZE,
+                read_only=True,
+                is_async=True,
+            ),
+            autoflush=False,
+            expire_on_commit=False,
+        )
+
+
+class ThreadedSession:
+    """
+    Wraps a blocking `Session` with the `run_sync` interface of `AsyncSession`.
+
+    Database work is sent to FastAPI's threadpool, so `async def` routes can use
+    the sync engine without blocking the event loop.
+
+    Attributes:
+        sync_session (Session): The wrapped SQLAlchemy session.
+    """
+
+    def __init__(self, sync_session):
+        self.sync_session = sync_session
+
+    async def run_sync(self, fn, *args, **kwargs):
+        """
+        Runs `fn(session, *args, **kwargs)` on the threadpool and returns its result.
+        """
+        return await run_in_threadpool(fn, self.sync_session, *args, **kwargs)
+
+    async def close(self):
+        """
+        Closes the wrapped session on the threadpool.
+        """
+        await run_in_threadpool(self.sync_session.close)
+
+
+SessionRunner = Union[AsyncSession, ThreadedSession]
+
+
+async def _session(async_factory, sync_factory):
+    if async_factory is not None:
+        async with async_factory() as db:
+            yield db
+        return
+
+    db = ThreadedSession(sync_factory())
+    try:
+        yield db
+    finally:
+        await db.close()
+
+
+# `_session` as an `async with` block, for sessions opened outside of dependencies
+open_session = asynccontextmanager(_session)
+
+
+async def get_db():
     """
     Dependency function that yields a database session.
 
     Ensures that the session is closed after the request is processed.
-    Should be used with FastAPI's `Depends()`.
+    Should be used with FastAPI's `Depends()`. The yielded object exposes
+    `run_sync(fn, *args)`, which calls `fn` with a sync `Session`.
 
     Example:
-        def route(db: Session = Depends(get_db)):
-            ...
+        async def route(db: SessionRunner = Depends(get_db)):
+            return await db.run_sync(lambda session: ...)
     """
-    db = SessionLocal()
-    try:
+    async for db in _session(AsyncSessionLocal, SessionLocal):
+        yield db
+
+
+async def get_read_db():
+    """
+    Dependency function that yields a session for read-only routes.
+
+    With `DB_READ_POOL` enabled the session draws from a separate pool of
+    query-only connections, so reads never wait behind the write pool;
+    otherwise it is equivalent to `get_db`.
+    """
+    async for db in _session(AsyncReadSessionLocal, ReadSessionLocal):
         yield db
-    finally:
-        db.close()
@@ -0,0 +1,114 @@
+"""
+feedcache.py
+
+This module caches the data behind `GET /feed/{username}`: the
+username -> user id mapping, and the serialized JSON of every requested page.
+
+A few accounts receive most of the feed traffic, so their pages are served
+from a read-through cache instead of being queried and serialized again on
+every request. The backend is chosen with `FEED_CACHE_BACKEND` (see
+`cache.py`).
+
+Pages are invalidated per author with a generation token: every page key
+contains the author's current generation, and `invalidate` replaces it, so
+all pages of that author become unreachable at once while other authors'
+pages stay cached. The routes that change a listing (creating, updating and
+deleting posts, liking and unliking) call `invalidate` after committing. If
+the generation entry itself is evicted, a fresh one is drawn, which also just
+orphans the old pages, so a stale page is never served.
+"""
+
+import secrets
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from . import config
+from .cache import MISSING, load_backend
+from .models import User
+
+feed_cache = load_backend(
+    config.FEED_CACHE_BACKEND, config.FEED_CACHE_SIZE, config.FEED_CACHE_TTL
+)
+
+
+def user_id(db: Session, username: str) -> Optional[int]:
+    """
+    Resolves a username to a user id, reading through the cache.
+
+    Args:
+        db (Session): SQLAlchemy session, used on a miss.
+        username (str): Username to resolve.
+
+    Returns:
+        Optional[int]: ID of the user, or None if there is no such user.
+    """
+    key = f"user:{username}"
+    id = feed_cache.get(key)
+    if id is MISSING:
+        id = db.scalar(select(User.id).where(User.username == username))
+        if id is None:
+            return None
+        feed_cache.set(key, id)
+    return id
+
+
+def _generation(author_id: int) -> str:
+    key = f"gen:{author_id}"
+    generation = feed_cache.get(key)
+    if generation is MISSING:
+        generation = secrets.token_hex(4)
+        feed_cache.set(key, generation)
+    return generation
+
+
+def page_key(
+    author_id: int, limit: int, cursor: Optional[str], fields: str = ""
+) -> str:
+    """
+    Returns the cache key of a page of an author's posts.
+
+    Compute the key before querying the page: if the author's posts change
+    in between, the page is then stored under the old generation, where it is
+    never read.
+
+    Args:
+        author_id (int): ID of the author.
+        limit (int): Page size.
+        cursor (Optional[str]): Cursor of the page.
+        fields (str): Fields returned, for sparse fieldsets and views.
+    """
+    return f"feed:{author_id}:{_generation(author_id)}:{limit}:{cursor or ''}:{fields}"
+
+
+def get_page(key: str) -> Optional[bytes]:
+    """
+    Returns a cached serialized page, or None on a miss.
+
+    Args:
+        key (str): Key from `page_key`.
+    """
+    body = feed_cache.get(key)
+    return None if body is MISSING else body
+
+
+def set_page(key: str, body: bytes):
+    """
+    Stores a serialized page.
+
+    Args:
+        key (str): Key from `page_key`.
+        body (bytes): JSON body of the page.
+    """
+    feed_cache.set(key, body)
+
+
+def invalidate(author_id: int):
+    """
+    Drops every cached page of an author. Call after the change is committed.
+
+    Args:
+        author_id (int): ID of the author whose posts changed.
+    """
+    feed_cache.set(f"gen:{author_id}", secrets.token_hex(4))
@@ -0,0 +1,348 @@
+"""
+followgraph.py
+
+This module keeps the follow graph in memory as compact integer arrays and
+answers "who to follow" from it.
+
+Suggestions are friends of friends: the users followed by the people a user
+follows, ranked by how many of those people follow them (the mutual-follow
+count). Walking `User.following` through the ORM would load thousands of
+objects per request; here the graph is held in CSR form:
+
+- `targets` is an `array` of every followee id, grouped by follower;
+- `offsets[u]` and `offsets[u + 1]` delimit the followees of user `u`.
+
+An edge costs 4 bytes plus 8 per user id for the offsets, so a graph of
+millions of follows fits in tens of megabytes, and reading the followees of a
+user is a slice of a flat array. Counting the followees of followees is done
+by `collections.Counter` in C.
+
+The arrays are rebuilt from the `follow` table every `REBUILD_INTERVAL`
+seconds, which also picks up writes from other processes. Between rebuilds,
+the follow routes report each change after committing it (`update`), and the
+change is kept in a small overlay applied on top of the arrays; a rebuild is
+brought forward once the overlay exceeds `MAX_OVERLAY` edges. A rebuild runs
+in a background thread with its own session (reading millions of edges takes
+seconds); requests keep answering from the current arrays and overlay until
+the new arrays are swapped in, and changes made meanwhile are replayed onto
+them. The first build runs at application startup, before requests are
+served (`startup`); should it fail, suggestions answer 503 until a background
+build succeeds, rather than an empty list.
+
+Functionalities:
+- Build the CSR arrays from the `follow` table.
+- Apply follows and unfollows as they are committed.
+- Rank follow suggestions by mutual-follow count.
+- Report the size and memory footprint of the index.
+
+Measure build time, memory and latency with `python -m benchmarks.followgraph`.
+"""
+
+import heapq
+import logging
+import random
+import sys
+import threading
+import time
+from array import array
+from collections import Counter
+from typing import Callable, Iterable, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from .database import ReadSessionLocal
+from .models import follow
+
+# Seconds after which the arrays are rebuilt from the database
+REBUILD_INTERVAL = 300.0
+
+# Overlay edges that bring the next rebuild forward
+MAX_OVERLAY = 50000
+
+# Followees walked per suggestion request; larger sets are sampled
+MAX_SCANNED = 2000
+
+# Upper bound on the number of suggestions a single request may ask for
+MAX_SUGGESTIONS = 50
+
+# Rows fetched per round trip while building
+_BUILD_CHUNK = 50000
+
+logger = logging.getLogger(__name__)
+
+
+class FollowGraph:
+    """
+    In-memory CSR index of the follow graph.
+
+    Attributes:
+        rebuild_interval (float): Lifetime of the arrays in seconds.
+        max_overlay (int): Overlay size that triggers an early rebuild.
+    """
+
+    def __init__(
+        self,
+        rebuild_interval: float = REBUILD_INTERVAL,
+        max_overlay: int = MAX_OVERLAY,
+    ):
+        self.rebuild_interval = rebuild_interval
+        self.max_overlay = max_overlay
+        # (offsets, targets), swapped together so readers never mix two builds
+        self._csr = (array("q", [0]), array("i"))
+        # follower -> {followee: following?}, changes not in the arrays yet
+        self._overlay: dict[int, dict[int, bool]] = {}
+        self._overlay_size = 0
+        # Changes made while a rebuild reads the table, replayed after it
+        self._journal: Optional[list] = None
+        self._built_at = float("-inf")
+        self._build_seconds = 0.0
+        self._builds = 0
+        self._build_lock = threading.Lock()
+        self._builder: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def build(self, edges: Iterable[tuple[int, int]]):
+        """
+        Replaces the arrays with the given edges. The overlay is reset, except
+        for the changes journaled during a rebuild.
+
+        Args:
+            edges (Iterable[tuple[int, int]]): (follower, followee) pairs,
+                ordered by follower.
+        """
+        offsets = array("q", [0])
+        targets = array("i")
+        for follower, followee in edges:
+            # Users without follows between two followers get empty rows
+            while len(offsets) <= follower:
+                offsets.append(len(targets))
+            targets.append(followee)
+        offsets.append(len(targets))
+        self._swap(offsets, targets)
+
+    def _rebuild(self, db: Session):
+        """
+        Rebuilds the arrays from the `follow` table.
+
+        The table is read in primary-key order, (follower, followee), so
+        followees come grouped by follower without sorting.
+
+        Args:
+            db (Session): SQLAlchemy session.
+        """
+        start = time.perf_counter()
+        with self._lock:
+            self._journal = []
+
+        rows = db.execute(
+            select(follow.c.follower, follow.c.followee)
+            .order_by(follow.c.follower, follow.c.followee)
+            .execution_options(yield_per=_BUILD_CHUNK)
+        )
+        self.build(rows.tuples())
+        self._build_seconds = time.perf_counter() - start
+
+    def _swap(self, offsets: array, targets: array):
+        with self._lock:
+            journal, self._journal = self._journal or [], None
+            self._csr = (offsets, targets)
+            self._overlay, self._overlay_size = {}, 0
+            for follower, followee, following in journal:
+                self._apply(follower, followee, following)
+            self._built_at = time.monotonic()
+            self._builds += 1
+
+    def ensure_fresh(self, session_factory: Callable[[], Session]):
+        """
+        Starts a background rebuild if the arrays expired or the overlay grew
+        too large. Returns at once; the current arrays keep being served.
+
+        Args:
+            session_factory (Callable[[], Session]): Opens the blocking session
+                the rebuild reads the `follow` table with.
+        """
+        # Never wait for the lock, as in `sampler.py`: a rebuild already
+        # running will pick up the same changes.
+        expired = time.monotonic() - self._built_at > self.rebuild_interval
+        if expired or self._overlay_size > self.max_overlay:
+            if self._build_lock.acquire(blocking=False):
+                self._builder = threading.Thread(
+                    target=self._rebuild_in_background,
+                    args=(session_factory,),
+                    name="followgraph-rebuild",
+                    daemon=True,
+                )
+                self._builder.start()
+
+    def _rebuild_in_background(self, session_factory: Callable[[], Session]):
+        try:
+            self._rebuild_with(session_factory)
+        finally:
+            self._build_lock.release()
+
+    def _rebuild_with(self, session_factory: Callable[[], Session]):
+        try:
+            with session_factory() as db:
+                self._rebuild(db)
+        except Exception:
+            # The current arrays stay; the next request retries
+            with self._lock:
+                self._journal = None
+            logger.exception("Follow graph rebuild failed")
+
+    def ensure_built(self, session_factory: Callable[[], Session]):
+        """
+        Builds the arrays unless a build already completed. Blocks until done:
+        call it before serving requests, off the event loop.
+
+        Args:
+            session_factory (Callable[[], Session]): Opens the blocking session
+                the build reads the `follow` table with.
+        """
+        with self._build_lock:
+            if not self.ready:
+                self._rebuild_with(session_factory)
+
+    @property
+    def ready(self) -> bool:
+        """
+        Tells whether a build completed, i.e. whether the arrays hold the graph.
+        """
+        return self._builds > 0
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Waits for the rebuild in progress, if any, to finish.
+
+        Args:
+            timeout (Optional[float]): Seconds to wait at most, None for no limit.
+
+        Returns:
+            bool: True if no rebuild is running anymore.
+        """
+        builder = self._builder
+        if builder is not None:
+            builder.join(timeout)
+            return not builder.is_alive()
+        return True
+
+    def update(self, follower_id: int, followee_id: int, following: bool):
+        """
+        Records a committed follow or unfollow. Call after the commit.
+
+        Args:
+            follower_id (int): ID of the user following or unfollowing.
+            followee_id (int): ID of the other user.
+            following (bool): True for a follow, False for an unfollow.
+        """
+        with self._lock:
+            if self._journal is not None:
+                self._journal.append((follower_id, followee_id, following))
+            self._apply(follower_id, followee_id, following)
+
+    def _apply(self, follower_id: int, followee_id: int, following: bool):
+        changes = self._overlay.setdefault(follower_id, {})
+        if followee_id not in changes:
+            self._overlay_size += 1
+        changes[followee_id] = following
+
+    def _row(self, user_id: int):
+        offsets, targets = self._csr
+        if user_id + 1 >= len(offsets):
+            return targets[:0]
+        return targets[offsets[user_id] : offsets[user_id + 1]]
+
+    def following(self, user_id: int) -> set:
+        """
+        Returns the ids of the users a user follows.
+
+        Args:
+            user_id (int): ID of the follower.
+
+        Returns:
+            set[int]: Followee ids.
+        """
+        followees = set(self._row(user_id))
+        # Copied in one step, as follows may change the overlay meanwhile
+        for followee, following in list(self._overlay.get(user_id, {}).items()):
+            if following:
+                followees.add(followee)
+            else:
+                followees.discard(followee)
+        return followees
+
+    def _followees(self, user_id: int):
+        # The raw row when there is no overlay for it, avoiding a set
+        if user_id in self._overlay:
+            return self.following(user_id)
+        return self._row(user_id)
+
+    def suggestions(self, user_id: int, limit: int) -> list[tuple[int, int]]:
+        """
+        Ranks the users followed by a user's followees that the user does not
+        follow yet, by the number of followees following them.
+
+        Args:
+            user_id (int): ID of the user to suggest follows to.
+            limit (int): Maximum number of suggestions.
+
+        Returns:
+            list[tuple[int, int]]: (user id, mutual-follow count) pairs, highest
+            count first, ties broken by lowest id.
+        """
+        followed = self.following(user_id)
+        scanned = list(followed)
+        if len(scanned) > MAX_SCANNED:
+            scanned = random.sample(scanned, MAX_SCANNED)
+
+        counts = Counter()
+        for followee in scanned:
+            counts.update(self._followees(followee))
+
+        counts.pop(user_id, None)
+        for followee in followed:
+            counts.pop(followee, None)
+
+        return heapq.nlargest(
+            limit, counts.items(), key=lambda item: (item[1], -item[0])
+        )
+
+    def stats(self) -> dict:
+        """
+        Returns the size and memory footprint of the index, for monitoring.
+
+        Returns:
+            dict: users (rows), edges, overlay edges, bytes used by the arrays
+            and by the overlay, age of the arrays and duration of the last build.
+        """
+        offsets, targets = self._csr
+        overlay = self._overlay
+        overlay_bytes = sys.getsizeof(overlay) + sum(
+            sys.getsizeof(changes) for changes in list(overlay.values())
+        )
+        return {
+            "users": len(offsets) - 1,
+            "edges": len(targets),
+            "overlay_edges": self._overlay_size,
+            "offsets_bytes": len(offsets) * offsets.itemsize,
+            "targets_bytes": len(targets) * targets.itemsize,
+            "overlay_bytes": overlay_bytes,
+            "age_seconds": (
+                round(time.monotonic() - self._built_at, 1) if self._builds else None
+            ),
+            "build_seconds": round(self._build_seconds, 3),
+            "builds": self._builds,
+        }
+
+
+follow_graph = FollowGraph()
+
+
+async def startup():
+    """
+    Builds the follow graph on the threadpool. Registered as an application
+    startup handler, so that suggestions are served from the whole graph.
+    """
+    await run_in_threadpool(follow_graph.ensure_built, ReadSessionLocal)
@@ -0,0 +1,135 @@
+"""
+hashing.py
+
+This module runs bcrypt password hashing and verification in a dedicated,
+bounded process pool.
+
+A bcrypt check holds the CPU for tens of milliseconds. Running it on the event
+loop stalls every other request, and running it on the threadpool competes
+with request handlers for workers and the GIL. Here it runs in separate
+processes instead, with a fixed number of workers and a bounded queue: when
+more than `HASH_WORKERS + HASH_QUEUE_LIMIT` operations are in flight, new ones
+are refused with `503 Service Unavailable` rather than piling up.
+
+The bcrypt cost is configurable with `BCRYPT_ROUNDS`. Hashes created with a
+different cost are transparently upgraded on the next successful login.
+"""
+
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from . import config
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=config.BCRYPT_ROUNDS
+)
+
+_executor = None
+_in_flight = 0
+
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify_and_update(password: str, hashed: str):
+    return pwd_context.verify_and_update(password, hashed)
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # spawn, not fork: the server process runs threads (threadpool, aiosqlite)
+        # that must not be duplicated into the workers.
+        _executor = ProcessPoolExecutor(
+            max_workers=config.HASH_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _executor
+
+
+async def _submit(fn, *args):
+    """
+    Runs `fn(*args)` in the pool, refusing work beyond the queue limit.
+
+    Only called from the event loop, so the in-flight counter needs no lock.
+
+    Raises:
+        HTTPException: 503 with `Retry-After` if the pool is saturated.
+    """
+    global _in_flight
+    if _in_flight >= config.HASH_WORKERS + config.HASH_QUEUE_LIMIT:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many concurrent authentication requests",
+            headers={"Retry-After": "1"},
+        )
+
+    _in_flight += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_executor(), fn, *args)
+    finally:
+        _in_flight -= 1
+
+
+async def hash_password(password: str) -> str:
+    """
+    Hashes a password with the configured bcrypt cost.
+
+    Args:
+        password (str): Raw password.
+
+    Returns:
+        str: bcrypt hash.
+
+    Raises:
+        HTTPException: 503 if the hashing pool is saturated.
+    """
+    return await _submit(_hash, password)
+
+
+async def verify_password(password: str, hashed: str):
+    """
+    Verifies a password and reports whether its hash should be upgraded.
+
+    Args:
+        password (str): Raw password provided by the client.
+        hashed (str): Stored bcrypt hash.
+
+    Returns:
+        tuple[bool, str | None]: Whether the password matches, and a new hash
+        to store if the stored one uses an outdated cost.
+
+    Raises:
+        HTTPException: 503 if the hashing pool is saturated.
+    """
+    return await _submit(_verify_and_update, password, hashed)
+
+
+def stats() -> dict:
+    """
+    Returns the current load of the hashing pool.
+
+    Returns:
+        dict: workers, queue_limit and in_flight.
+    """
+    return {
+        "workers": config.HASH_WORKERS,
+        "queue_limit": config.HASH_QUEUE_LIMIT,
+        "in_flight": _in_flight,
+    }
+
+
+def shutdown():
+    """
+    Stops the worker processes. Registered as an application shutdown handler.
+    """
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(cancel_futures=True)
+        _executor = None
@@ -0,0 +1,202 @@
+"""
+loader.py
+
+This module bulk loads users, posts, follows and likes from NDJSON or CSV
+files, bypassing the API.
+
+Going through the API costs one request, one transaction and (for users) one
+bcrypt hash per row. The loader instead streams the file and inserts rows in
+large chunks, one transaction and one `executemany` per chunk, reporting
+progress and throughput as it goes. Once the rows are in, the denormalized
+counters, home timelines and search index are rebuilt in bulk.
+
+Files are read line by line, so their size is not bounded by memory. Each
+row is an object (NDJSON) or a line (CSV with a header) whose keys are the
+columns of the target table:
+
+- users: username, email, gender, password (an already hashed password,
+  unless `hash_passwords` is set), optionally id
+- posts: author, title, content, optionally id and createdAt (Unix time)
+- follows: follower, followee
+- likes: likedBy, likedPost, optionally createdAt (Unix time)
+
+Rows without `createdAt` are stamped with the time of the load.
+
+Duplicate follows and likes are skipped; duplicate users or posts abort the
+chunk that contains them. The loader writes the single-file layout: with
+`SHARDS` set, load with `SHARDS=0` first, then run `reshard` (see `sharding.py`).
+
+Usage:
+    python -m app.manage load posts archive/posts.ndjson
+"""
+
+import csv
+import json
+import sys
+import time
+from typing import Iterable, Iterator
+
+from sqlalchemy import Integer, insert
+
+from . import conditional, counters, search, sharding, timeline
+from .database import SessionLocal, engine
+from .hashing import pwd_context
+from .models import Post, User, follow, likes
+
+DEFAULT_CHUNK_SIZE = 10000
+
+# Target table, required columns and optional columns of each kind of row
+KINDS = {
+    "users": (User.__table__, ("username", "email", "gender", "password"), ("id",)),
+    "posts": (Post.__table__, ("author", "title", "content"), ("id", "createdAt")),
+    "follows": (follow, ("follower", "followee"), ()),
+    "likes": (likes, ("likedBy", "likedPost"), ("createdAt",)),
+}
+
+
+def read_rows(path: str, file_format: str | None = None) -> Iterator[dict]:
+    """
+    Streams the rows of an NDJSON or CSV file as dictionaries.
+
+    Args:
+        path (str): Path of the file.
+        file_format (str | None): "ndjson" or "csv". Guessed from the extension if None.
+
+    Yields:
+        dict: One row per non-empty line (NDJSON) or record (CSV).
+
+    Raises:
+        ValueError: If the format cannot be guessed.
+    """
+    if file_format is None:
+        if path.endswith(".csv"):
+            file_format = "csv"
+        elif path.endswith((".ndjson", ".jsonl", ".json")):
+            file_format = "ndjson"
+        else:
+            raise ValueError(f"Cannot guess the format of {path}, pass --format")
+
+    with open(path, newline="", encoding="utf-8") as file:
+        if file_format == "csv":
+            yield from csv.DictReader(file)
+        else:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def _chunks(rows: Iterable[dict], size: int) -> Iterator[list]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _prepare(kind: str, row: dict, number: int, hash_passwords: bool) -> dict:
+    table, required, optional = KINDS[kind]
+
+    missing = [column for column in required if row.get(column) in (None, "")]
+    if missing:
+        raise ValueError(f"{kind} row {number}: missing {', '.join(missing)}")
+
+    # Optional columns are always present so that every row of a chunk has the
+    # same keys; a NULL id lets SQLite assign one. An empty CSV cell is
+    # missing, a 0 is kept.
+    values = {column: row[column] for column in required}
+    values.update(
+        {
+            column: None if row.get(column) in (None, "") else row[column]
+            for column in optional
+        }
+    )
+    if "createdAt" in values and values["createdAt"] is None:
+        values["createdAt"] = int(time.time())
+
+    # CSV yields strings; convert the integer columns explicitly
+    for column, value in values.items():
+        if value is not None and isinstance(table.c[column].type, Integer):
+            values[column] = int(value)
+
+    if hash_passwords and kind == "users":
+        values["password"] = pwd_context.hash(values["password"])
+
+    return values
+
+
+def load(
+    kind: str,
+    rows: Iterable[dict],
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    hash_passwords: bool = False,
+    out=sys.stderr,
+) -> int:
+    """
+    Inserts rows of one kind in chunked transactions.
+
+    Each chunk is validated, then inserted with a single `executemany` and
+    committed, so a failure only loses the chunk it happened in.
+
+    Args:
+        kind (str): "users", "posts", "follows" or "likes".
+        rows (Iterable[dict]): Rows to insert, for example from `read_rows`.
+        chunk_size (int): Rows per transaction.
+        hash_passwords (bool): Hash the `password` column of users with bcrypt.
+        out (TextIO): Where progress lines are written.
+
+    Returns:
+        int: Number of rows processed.
+
+    Raises:
+        ValueError: If a row misses a required column, or posts are sharded.
+    """
+    if sharding.ENABLED:
+        raise ValueError("Bulk loads need SHARDS=0, reshard afterwards")
+
+    table = KINDS[kind][0]
+    statement = insert(table)
+    if kind in ("follows", "likes"):
+        statement = statement.prefix_with("OR IGNORE")
+
+    total = 0
+    start = time.perf_counter()
+    for chunk in _chunks(rows, chunk_size):
+        values = [
+            _prepare(kind, row, total + number, hash_passwords)
+            for number, row in enumerate(chunk, start=1)
+        ]
+
+        with engine.begin() as connection:
+            connection.execute(statement, values)
+
+        total += len(values)
+        elapsed = time.perf_counter() - start
+        print(f"{kind}: {total} rows ({total / elapsed:,.0f} rows/s)", file=out)
+
+    return total
+
+
+def rebuild_derived(out=sys.stderr):
+    """
+    Recomputes the counters, home timelines and search index after a load.
+
+    Args:
+        out (TextIO): Where progress lines are written.
+    """
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        counters.recompute(db)
+        timeline.rebuild(db)
+        search.rebuild(db)
+        conditional.touch_all(db)
+        db.commit()
+        print(
+            f"counters, timelines and search index rebuilt in {time.perf_counter() - start:.1f}s",
+            file=out,
+        )
+    finally:
+        db.close()
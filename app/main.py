@@ -4,31 +4,62 @@ main.py
 This is the entry point of the FastAPI application.
 
 Functionalities:
-- Initializes FastAPI app.
-- Creates all database tables.
+- Initializes FastAPI app, with orjson as the default JSON encoder.
+- Creates all database tables (in the directory and the post shards, see `sharding.py`).
 - Defines root-level endpoints for API health check and authentication test.
-- Includes all modular routers: user registration, authentication, feed, follow, and posts.
+- Sheds load by cost class when `ADMISSION_CONTROL` is enabled (see `admission.py`).
+- Includes all modular routers: user registration, authentication, feed, follow, posts and export.
 
 Routes:
 - GET /               — Returns API health status.
 - GET /user           — Returns current authenticated user.
-- /users/*            — Handles user registration and following/unfollowing.
+- GET /metrics        — Request and SQL metrics in the Prometheus text format.
+- GET /admission      — In-flight requests, queue depths and rejections per cost class.
+- /users/*            — Handles user registration, following/unfollowing, follow suggestions and exports.
 - /auth/*             — Handles JWT login and token-based authentication.
 - /feed/*             — Fetches user and post feeds.
 - /posts/*            — Manages post creation, update, deletion, and likes.
 """
 
 from fastapi import Depends, FastAPI
+from fastapi.responses import ORJSONResponse, PlainTextResponse
 
-from .database import Base, engine
-from .routes import auth, feed, follow, posts, registerUser
-from .routes.auth import get_current_user
+from . import (
+    admission,
+    config,
+    followgraph,
+    hashing,
+    metrics,
+    queryguard,
+    sharding,
+    trending,
+    writequeue,
+)
+from .admission import cost_class
+from .principal import Principal
+from .routes import auth, export, feed, follow, posts, registerUser
+from .routes.auth import get_current_principal
 
-app = FastAPI()
-Base.metadata.create_all(bind=engine)
+# Every JSON response is encoded with orjson (see `projections.py` for the hot reads)
+app = FastAPI(default_response_class=ORJSONResponse)
+sharding.create_all()
+app.add_event_handler("startup", followgraph.startup)
+app.add_event_handler("startup", trending.startup)
+app.add_event_handler("shutdown", writequeue.shutdown)
+app.add_event_handler("shutdown", hashing.shutdown)
+
+# Added first, so that it runs inside the metrics and the query guard and
+# rejected requests are still measured
+if config.ADMISSION_CONTROL:
+    app.add_middleware(admission.AdmissionMiddleware, routes=app.router.routes)
+if config.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+if config.QUERY_GUARD != "off":
+    app.add_middleware(queryguard.QueryGuardMiddleware, mode=config.QUERY_GUARD)
 
 
 @app.get("/", summary="Gets API's status", tags=["Root"])
+@cost_class("cheap")
 def default():
     """
     Root endpoint to verify if the API is running.
@@ -40,12 +71,12 @@ def default():
 
 
 @app.get("/user", summary="Returns the authenticated user", tags=["Root"])
-def user(user: dict = Depends(get_current_user)):
+def user(user: Principal = Depends(get_current_principal)):
     """
     Returns the currently authenticated user from the JWT token.
 
     Args:
-        user (dict): Injected user object via token-based authentication.
+        user (Principal): Injected read-only user snapshot via token-based authentication.
 
     Returns:
         dict: Success message with user data.
@@ -53,9 +84,45 @@ def user(user: dict = Depends(get_current_user)):
     return {"message": "You are authorised", "user": user}
 
 
+@app.get(
+    "/metrics",
+    summary="Request and SQL metrics",
+    tags=["Root"],
+    response_class=PlainTextResponse,
+)
+@cost_class("cheap")
+async def getMetrics():
+    """
+    Exposes per-route latency histograms, SQL statement counts and timings, the
+    slowest normalized statements and the admission queues, in the Prometheus
+    text format.
+
+    Returns:
+        PlainTextResponse: The metrics exposition (empty when `METRICS_ENABLED` is off).
+    """
+    body = metrics.render() + admission.render()
+    return PlainTextResponse(
+        body, media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@app.get("/admission", summary="Admission control statistics", tags=["Root"])
+@cost_class("cheap")
+def getAdmission():
+    """
+    Returns the limits, in-flight requests, queue depths and rejections of every
+    cost class for monitoring.
+
+    Returns:
+        dict: See `admission.stats`.
+    """
+    return admission.stats()
+
+
 # Modularized functional Routers that make up the API
 app.include_router(registerUser.router)
 app.include_router(auth.router)
 app.include_router(feed.router)
 app.include_router(follow.router)
 app.include_router(posts.router)
+app.include_router(export.router)
@@ -0,0 +1,147 @@
+"""
+manage.py
+
+Command line entry point for maintenance tasks that run outside the API.
+
+Usage:
+    python -m app.manage <command>
+
+Commands:
+- reconcile-counters  — Recomputes the denormalized follower/following/post/like counters.
+- load                — Bulk loads users, posts, follows or likes from NDJSON/CSV files.
+- rebuild-search      — Rebuilds the full-text search index of posts.
+- reshard             — Moves posts and likes to another number of shard files.
+"""
+
+import argparse
+
+from . import loader, search, sharding
+
+
+def reconcile_counters(args):
+    """
+    Recomputes all denormalized counters from the source tables.
+
+    Args:
+        args (argparse.Namespace): Parsed command line arguments.
+    """
+    sharding.recompute_counters()
+
+    print("Counters reconciled")
+
+
+def rebuild_search(args):
+    """
+    Rebuilds the full-text search index from the posts table, on every shard.
+
+    Args:
+        args (argparse.Namespace): Parsed command line arguments.
+    """
+    for db in sharding.sync_sessions():
+        try:
+            search.rebuild(db)
+            db.commit()
+        finally:
+            db.close()
+
+    print("Search index rebuilt")
+
+
+def load(args):
+    """
+    Loads one or more NDJSON/CSV files, then rebuilds the derived data.
+
+    Args:
+        args (argparse.Namespace): Parsed command line arguments.
+    """
+    total = 0
+    for path in args.files:
+        rows = loader.read_rows(path, args.format)
+        total += loader.load(args.kind, rows, args.chunk_size, args.hash_passwords)
+
+    if not args.skip_rebuild:
+        loader.rebuild_derived()
+
+    print(f"Loaded {total} {args.kind}")
+
+
+def reshard(args):
+    """
+    Moves posts, likes and listing versions to a new number of shards.
+
+    Args:
+        args (argparse.Namespace): Parsed command line arguments.
+    """
+    sharding.reshard(args.shards, args.chunk_size)
+
+    print(f"Resharded, restart the app with SHARDS={args.shards}")
+
+
+def main(argv=None):
+    """
+    Parses the command line and dispatches to the selected command.
+
+    Args:
+        argv (list[str] | None): Arguments to parse, defaults to `sys.argv`.
+    """
+    parser = argparse.ArgumentParser(prog="python -m app.manage")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser(
+        "reconcile-counters", help="Recompute follower/following/post/like counters"
+    ).set_defaults(func=reconcile_counters)
+
+    commands.add_parser(
+        "rebuild-search", help="Rebuild the full-text search index of posts"
+    ).set_defaults(func=rebuild_search)
+
+    load_parser = commands.add_parser(
+        "load", help="Bulk load users, posts, follows or likes from NDJSON/CSV files"
+    )
+    load_parser.add_argument("kind", choices=sorted(loader.KINDS))
+    load_parser.add_argument("files", nargs="+", help="NDJSON or CSV files")
+    load_parser.add_argument(
+        "--format", choices=["ndjson", "csv"], help="Default: from the file extension"
+    )
+    load_parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=loader.DEFAULT_CHUNK_SIZE,
+        help="Rows per transaction",
+    )
+    load_parser.add_argument(
+        "--hash-passwords",
+        action="store_true",
+        help="Hash plain-text user passwords with bcrypt (slow)",
+    )
+    load_parser.add_argument(
+        "--skip-rebuild",
+        action="store_true",
+        help="Do not rebuild counters, timelines and the search index "
+        "(when loading several kinds in a row)",
+    )
+    load_parser.set_defaults(func=load)
+
+    reshard_parser = commands.add_parser(
+        "reshard",
+        help="Move posts and likes from the SHARDS layout to another number of "
+        "shards (0 for a single file), with the app stopped",
+    )
+    reshard_parser.add_argument("shards", type=int)
+    reshard_parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=loader.DEFAULT_CHUNK_SIZE,
+        help="Rows per transaction",
+    )
+    reshard_parser.set_defaults(func=reshard)
+
+    args = parser.parse_args(argv)
+    if args.command == "load" and sharding.ENABLED:
+        parser.error("load into a single file (SHARDS=0), then run reshard")
+    sharding.create_all()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
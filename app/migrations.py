@@ -0,0 +1,100 @@
+"""
+migrations.py
+
+This module brings the tables of a database created by an earlier version of
+the application up to date.
+
+`Base.metadata.create_all` creates the tables that are missing, with their
+indexes, but never changes a table that already exists: a column added to a
+model is simply absent from older databases, and every statement selecting
+it fails. `add_missing`, run by `sharding.create_all` at startup on the
+directory and on every shard, compares each existing table with its model
+and adds:
+
+- the missing columns, with `ALTER TABLE ... ADD COLUMN`. SQLite only takes a
+  constant default there, so a column gets its server default when that is a
+  constant, and 0 otherwise: existing posts and likes get a `createdAt` of 0,
+  i.e. they count as old;
+- the missing indexes.
+
+It is idempotent: on an up-to-date database it only reads the schema. Values
+derived from the source tables start at their default in the added columns,
+so `sharding.create_all` rebuilds them once, right after adding them:
+
+- the counters (`followersCount`, `followingCount`, `postsCount`,
+  `likesCount`), as `python -m app.manage reconcile-counters` does;
+- the home timelines, when the `timeline` table is created next to existing
+  users (see `timeline.rebuild`).
+
+Columns whose default is their right value for existing rows need nothing
+more: listing versions (`postsVersion`, `postsModified`) start at 0 and are
+bumped by the next write.
+"""
+
+from typing import Iterable
+
+from sqlalchemy import Column, Table, inspect, text
+from sqlalchemy.engine import Connection
+
+# Columns whose values are recomputed from the source tables once added
+COUNTER_COLUMNS = frozenset(
+    {
+        "Users.followersCount",
+        "Users.followingCount",
+        "Users.postsCount",
+        "Posts.likesCount",
+    }
+)
+
+
+def _definition(connection: Connection, column: Column) -> str:
+    dialect = connection.dialect
+    definition = (
+        f"{dialect.identifier_preparer.format_column(column)} "
+        f"{column.type.compile(dialect)}"
+    )
+    if not column.nullable:
+        constant = getattr(column.server_default, "arg", None)
+        if not isinstance(constant, str):
+            constant = "0"
+        definition += f" NOT NULL DEFAULT {constant}"
+    return definition
+
+
+def add_missing(connection: Connection, tables: Iterable[Table]) -> set[str]:
+    """
+    Adds the columns and indexes missing from the existing tables. Tables that
+    do not exist are left to `create_all`.
+
+    Args:
+        connection (Connection): Connection to the database, in a transaction.
+        tables (Iterable[Table]): Tables this database should hold.
+
+    Returns:
+        set[str]: `table.column` names of the columns added, and the names of
+        the tables that do not exist yet.
+    """
+    inspector = inspect(connection)
+    preparer = connection.dialect.identifier_preparer
+    added = set()
+
+    for table in tables:
+        if not inspector.has_table(table.name):
+            added.add(table.name)
+            continue
+
+        present = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in present:
+                connection.execute(
+                    text(
+                        f"ALTER TABLE {preparer.format_table(table)} "
+                        f"ADD COLUMN {_definition(connection, column)}"
+                    )
+                )
+                added.add(f"{table.name}.{column.name}")
+
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+    return added
@@ -9,19 +9,37 @@ Tables:
 - Posts
 - follow (association table for followers)
 - likes (association table for post likes)
+- timeline (materialized home timeline entries, one row per reader and post)
+- listing_versions (post listing versions, used instead of the `Users` columns
+  when posts are sharded)
 """
 
-from sqlalchemy import (Column, ForeignKey, Integer, String, Table,
-                        Text)
+import time
+
+from sqlalchemy import Column, ForeignKey, Index, Integer, String, Table, Text, text
 from sqlalchemy.orm import relationship
 
 from .database import Base
 
+# Unix time in seconds. The application sends it with every insert; SQLite
+# fills it in for rows inserted by hand. Columns added to existing databases
+# with ALTER TABLE cannot carry the SQL default, only a constant.
+_NOW = text("(CAST(strftime('%s', 'now') AS INTEGER))")
+
+
+def _now() -> int:
+    return int(time.time())
+
+
+# The primary keys serve lookups by follower and by liking user; the secondary
+# indexes serve the reverse direction (followers of a user, likes of a post),
+# used by fan-out and counter reconciliation.
 follow = Table(
     "follow",
     Base.metadata,
     Column("follower", Integer, ForeignKey("Users.id"), primary_key=True),
     Column("followee", Integer, ForeignKey("Users.id"), primary_key=True),
+    Index("ix_follow_followee", "followee", "follower"),
 )
 
 likes = Table(
@@ -29,6 +47,33 @@ likes = Table(
     Base.metadata,
     Column("likedBy", Integer, ForeignKey("Users.id"), primary_key=True),
     Column("likedPost", Integer, ForeignKey("Posts.id"), primary_key=True),
+    Column("createdAt", Integer, nullable=False, default=_now, server_default=_NOW),
+    Index("ix_likes_likedPost", "likedPost"),
+    # Serves the rebuild of trending scores from recent likes (see `trending.py`)
+    Index("ix_likes_createdAt", "createdAt"),
+)
+
+# Fan-out-on-write home timeline. The primary key (owner, post) makes reading
+# a timeline a single range scan; the secondary indexes serve pruning on
+# unfollow and removal on post deletion.
+timeline = Table(
+    "timeline",
+    Base.metadata,
+    Column("owner", Integer, ForeignKey("Users.id"), primary_key=True),
+    Column("post", Integer, ForeignKey("Posts.id"), primary_key=True),
+    Column("author", Integer, ForeignKey("Users.id"), nullable=False),
+    Index("ix_timeline_owner_author", "owner", "author"),
+    Index("ix_timeline_post", "post"),
+)
+
+# When posts are sharded, the version of an author's post listing lives on the
+# author's shard, so that likes never write to the directory database.
+listing_versions = Table(
+    "listing_versions",
+    Base.metadata,
+    Column("author", Integer, primary_key=True),
+    Column("version", Integer, nullable=False, default=0, server_default="0"),
+    Column("modified", Integer, nullable=False, default=0, server_default="0"),
 )
 
 
@@ -42,11 +87,17 @@ class User(Base):
         email (str): Email address of the user.
         gender (str): Gender of the user.
         password (str): Hashed password.
+        followersCount (int): Denormalized number of followers.
+        followingCount (int): Denormalized number of users followed.
+        postsCount (int): Denormalized number of posts authored.
+        postsVersion (int): Incremented whenever the user's posts change.
+        postsModified (int): Unix time of the last change to the user's posts.
         followers (List[User]): Users who follow this user.
         following (List[User]): Users this user is following.
         posts (List[Post]): Posts authored by the user.
         likedPosts (List[Post]): Posts liked by the user.
     """
+
     __tablename__ = "Users"
 
     id = Column(Integer, primary_key=True, index=True)
@@ -55,6 +106,16 @@ class User(Base):
     gender = Column(String)
     password = Column(String, nullable=False)
 
+    # Counters are kept in step with the association tables by `counters.py`,
+    # in the same transaction as the write they describe.
+    followersCount = Column(Integer, nullable=False, default=0, server_default="0")
+    followingCount = Column(Integer, nullable=False, default=0, server_default="0")
+    postsCount = Column(Integer, nullable=False, default=0, server_default="0")
+
+    # Version token of the user's post listing, bumped by `conditional.py`
+    postsVersion = Column(Integer, nullable=False, default=0, server_default="0")
+    postsModified = Column(Integer, nullable=False, default=0, server_default="0")
+
     followers = relationship(
         "User",
         secondary=follow,
@@ -77,15 +138,24 @@ class Post(Base):
         author (int): ID of the user who authored the post.
         title (str): Title of the post.
         content (str): Content body of the post.
+        likesCount (int): Denormalized number of likes.
+        createdAt (int): Unix time the post was created.
         users (User): Author of the post.
         liked (List[User]): Users who liked the post.
     """
+
     __tablename__ = "Posts"
+    __table_args__ = (
+        # Serves keyset pagination of a user's posts: WHERE author = ? AND id < ?
+        Index("ix_Posts_author_id", "author", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     author = Column(Integer, ForeignKey("Users.id"))
     title = Column(Text, nullable=False)
     content = Column(Text)
+    likesCount = Column(Integer, nullable=False, default=0, server_default="0")
+    createdAt = Column(Integer, nullable=False, default=_now, server_default=_NOW)
 
     users = relationship("User", back_populates="posts")
 
@@ -0,0 +1,98 @@
+"""
+pagination.py
+
+This module implements opaque cursors for keyset (seek) pagination.
+
+A cursor encodes the sort key of the last row a client has seen. The next
+page is fetched with `WHERE key < :cursor ORDER BY key DESC LIMIT :n`, which
+is an index seek, so the cost of a page does not depend on how deep the
+client has scrolled (unlike `OFFSET`, which has to skip every earlier row).
+"""
+
+import base64
+import binascii
+import json
+
+from fastapi import HTTPException, status
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# Range of SQLite's INTEGER; larger keys cannot be bound as parameters
+_MIN_KEY = -(2**63)
+_MAX_KEY = 2**63 - 1
+
+
+def encode_cursor(key: dict) -> str:
+    """
+    Encodes a keyset position into an opaque, URL-safe cursor.
+
+    Args:
+        key (dict): Sort key values of the last row on the page.
+
+    Returns:
+        str: Opaque cursor string.
+    """
+    raw = json.dumps(key, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str | None, *fields: str) -> dict | None:
+    """
+    Decodes a cursor produced by `encode_cursor`.
+
+    Args:
+        cursor (str | None): Cursor received from the client, if any.
+        *fields (str): Integer key fields the cursor is expected to carry,
+            each within the 64-bit range of the database.
+
+    Returns:
+        dict | None: The decoded key, or None when no cursor was given.
+
+    Raises:
+        HTTPException: 400 if the cursor is malformed or a key is out of range.
+    """
+    if cursor is None:
+        return None
+
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded))
+        if not isinstance(key, dict) or not all(
+            _is_key(key.get(field)) for field in fields
+        ):
+            raise ValueError(cursor)
+    except (ValueError, binascii.Error):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+        )
+
+    return key
+
+
+def _is_key(value) -> bool:
+    # bool is an int subclass, but never a key
+    return (
+        isinstance(value, int)
+        and not isinstance(value, bool)
+        and _MIN_KEY <= value <= _MAX_KEY
+    )
+
+
+def paginate(rows: list, limit: int, key) -> tuple[list, str | None]:
+    """
+    Splits a `limit + 1` row fetch into a page and the cursor of the next one.
+
+    Args:
+        rows (list): Rows fetched with `LIMIT limit + 1`.
+        limit (int): Requested page size.
+        key (Callable): Builds the cursor key dict from the last row of the page.
+
+    Returns:
+        tuple[list, str | None]: The page and the next cursor (None on the last page).
+    """
+    if len(rows) <= limit:
+        return rows, None
+
+    page = rows[:limit]
+    return page, encode_cursor(key(page[-1]))
@@ -0,0 +1,107 @@
+"""
+principal.py
+
+This module caches the authenticated principal of a request.
+
+Resolving the current user used to cost one `SELECT` on every authenticated
+request. Routes that only need to know who the caller is can depend on
+`get_current_principal` (see `routes/auth.py`) instead, which returns a
+read-only `Principal` snapshot served from a bounded TTL/LRU cache keyed by
+user id. The snapshot is dropped whenever the ORM flushes a change to the
+user, so it never outlives a profile or password update.
+
+With `AUTH_TRUST_TOKEN` enabled, a cache miss is answered from the verified
+JWT claims alone, so authentication never touches the database.
+"""
+
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import event, inspect
+
+from . import config
+from .cache import MISSING, LRUCache
+from .models import User
+
+
+@dataclass(frozen=True, slots=True)
+class Principal:
+    """
+    Read-only snapshot of an authenticated user.
+
+    Attributes:
+        id (int): ID of the user.
+        username (str): Username of the user.
+        email (Optional[str]): Email address, None when built from token claims.
+        gender (Optional[str]): Gender, None when built from token claims.
+    """
+
+    id: int
+    username: str
+    email: Optional[str] = None
+    gender: Optional[str] = None
+
+    @classmethod
+    def from_user(cls, user: User) -> "Principal":
+        """
+        Builds a snapshot from a loaded ORM user.
+        """
+        return cls(
+            id=user.id,  # type:ignore
+            username=user.username,  # type:ignore
+            email=user.email,  # type:ignore
+            gender=user.gender,  # type:ignore
+        )
+
+
+principal_cache = LRUCache(
+    maxsize=config.PRINCIPAL_CACHE_SIZE, ttl=config.PRINCIPAL_CACHE_TTL
+)
+
+
+def cached(user_id: int) -> Optional[Principal]:
+    """
+    Returns the cached principal of a user, or None on a miss.
+
+    Args:
+        user_id (int): ID of the user.
+    """
+    principal = principal_cache.get(user_id)
+    return None if principal is MISSING else principal
+
+
+def remember(principal: Principal):
+    """
+    Stores a principal in the cache.
+
+    Args:
+        principal (Principal): Snapshot to cache.
+    """
+    principal_cache.set(principal.id, principal)
+
+
+def invalidate(user_id: int):
+    """
+    Drops the cached principal of a user.
+
+    Args:
+        user_id (int): ID of the user.
+    """
+    principal_cache.delete(user_id)
+
+
+# Columns whose change must drop the snapshot. Counter or relationship-only
+# updates (follows, likes) leave the principal untouched.
+_SNAPSHOT_COLUMNS = ("username", "email", "gender", "password")
+
+
+@event.listens_for(User, "after_update")
+def _invalidate_on_update(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in _SNAPSHOT_COLUMNS):
+        invalidate(target.id)
+
+
+@event.listens_for(User, "after_delete")
+def _invalidate_on_delete(mapper, connection, target):
+    invalidate(target.id)
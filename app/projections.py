@@ -0,0 +1,164 @@
+"""
+projections.py
+
+This module holds the column projections and the JSON encoding of the hot
+read routes.
+
+Instead of loading ORM objects and validating them into Pydantic models
+before encoding, these routes select only the columns they return, as plain
+`Row` tuples, and encode them straight to JSON bytes with orjson. No ORM
+identity map, attribute instrumentation or model validation is involved, so
+the cost of a page is mostly the query itself (see
+`benchmarks/serialization.py`). The column labels match the fields of the
+response models in `schemas.py`, which stay declared on the routes for the
+OpenAPI documentation.
+
+Post listings accept sparse fieldsets: `?fields=id,title` returns only
+those fields and `?view=summary` replaces `content` with a `snippet`, its
+first `SNIPPET_LENGTH` characters cut by SQLite's `substr`. The choice is
+pushed down into the SELECT (see `post_projection`), so unrequested columns
+are never read or sent.
+
+Every other route returns its data through `ORJSONResponse`, the default
+response class of the app.
+"""
+
+from typing import Iterable, Literal, Optional
+
+import orjson
+from fastapi import HTTPException, Query, Response, status
+from sqlalchemy import func
+
+from .models import Post, User
+
+SNIPPET_LENGTH = 200
+
+# Every field a post listing can return, in response order
+POST_FIELD_COLUMNS = {
+    "id": Post.id,
+    "author": Post.author,
+    "title": Post.title,
+    "content": Post.content,
+    "snippet": func.substr(Post.content, 1, SNIPPET_LENGTH).label("snippet"),
+    "like_count": Post.likesCount.label("like_count"),
+}
+
+POST_VIEWS = {
+    # Columns of `schemas.postResponse`
+    "full": ("id", "author", "title", "content", "like_count"),
+    "summary": ("id", "author", "title", "snippet", "like_count"),
+}
+
+POST_COLUMNS = tuple(POST_FIELD_COLUMNS[field] for field in POST_VIEWS["full"])
+POST_FIELDS = POST_VIEWS["full"]
+
+# Columns of `schemas.userSummary`
+USER_SUMMARY_COLUMNS = (User.id, User.username, User.gender, User.followersCount)
+USER_SUMMARY_FIELDS = tuple(column.key for column in USER_SUMMARY_COLUMNS)
+
+
+def post_columns(fields: Optional[str] = None, view: str = "full") -> tuple:
+    """
+    Resolves a sparse fieldset or a view to the columns to select.
+
+    Args:
+        fields (Optional[str]): Comma-separated field names; overrides `view`.
+            `id` is always included, since cursors are built from it.
+        view (str): Name of a predefined set of fields, see `POST_VIEWS`.
+
+    Returns:
+        tuple: Columns of `POST_FIELD_COLUMNS`, in response order.
+
+    Raises:
+        HTTPException: 400 if a field is unknown.
+    """
+    if fields is None:
+        names = set(POST_VIEWS[view])
+    else:
+        names = {name.strip() for name in fields.split(",") if name.strip()}
+        unknown = names - POST_FIELD_COLUMNS.keys()
+        if unknown:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown fields: {', '.join(sorted(unknown))}. "
+                f"Available: {', '.join(POST_FIELD_COLUMNS)}",
+            )
+        names.add("id")
+
+    return tuple(column for name, column in POST_FIELD_COLUMNS.items() if name in names)
+
+
+def post_projection(
+    fields: Optional[str] = Query(
+        None,
+        description="Comma-separated fields to return: "
+        + ", ".join(POST_FIELD_COLUMNS),
+    ),
+    view: Literal["full", "summary"] = Query(
+        "full",
+        description=f"`summary` returns a {SNIPPET_LENGTH}-character `snippet` "
+        "instead of `content`",
+    ),
+) -> tuple:
+    """
+    Dependency reading the `fields` and `view` parameters of a post listing.
+
+    Returns:
+        tuple: Columns to select, see `post_columns`.
+    """
+    return post_columns(fields, view)
+
+
+def field_names(columns: tuple) -> tuple:
+    """
+    Returns the response field names of projected columns.
+    """
+    return tuple(column.key for column in columns)
+
+
+def as_dicts(rows: Iterable, fields: tuple) -> list:
+    """
+    Turns projected rows into dicts ready for encoding.
+
+    Args:
+        rows (Iterable[Row]): Rows whose leading columns are `fields`; any
+            further columns (such as a sort key) are left out.
+        fields (tuple[str]): Names of the leading columns.
+
+    Returns:
+        list[dict]: One dict per row.
+    """
+    return [dict(zip(fields, row)) for row in rows]
+
+
+def post_page(
+    rows: Iterable, next_cursor: Optional[str], fields: tuple = POST_FIELDS
+) -> bytes:
+    """
+    Encodes a page of projected posts, as `schemas.postPage`.
+
+    Args:
+        rows (Iterable[Row]): Rows of the page.
+        next_cursor (Optional[str]): Cursor of the next page.
+        fields (tuple[str]): Names of the projected columns (default: the full view).
+
+    Returns:
+        bytes: The JSON body.
+    """
+    return orjson.dumps({"posts": as_dicts(rows, fields), "next_cursor": next_cursor})
+
+
+def json_response(body, headers=None) -> Response:
+    """
+    Wraps a JSON body in a response, bypassing response-model validation.
+
+    Args:
+        body (bytes | Any): Encoded JSON, or data to encode with orjson.
+        headers (Optional[Mapping[str, str]]): Extra response headers.
+
+    Returns:
+        Response: An `application/json` response.
+    """
+    if not isinstance(body, bytes):
+        body = orjson.dumps(body)
+    return Response(body, media_type="application/json", headers=headers)
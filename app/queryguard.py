@@ -0,0 +1,241 @@
+"""
+queryguard.py
+
+This module is an opt-in N+1 query detector for development and test runs.
+
+With `QUERY_GUARD=log` or `QUERY_GUARD=raise`, every SQL statement run by a
+request is counted and reduced to its shape (see `metrics.normalize`). When
+the request ends, two rules are checked against the budget of its route:
+- the total number of statements must not exceed `statements`;
+- no statement shape may run more than `repeats` times. A shape repeated
+  once per row or per relationship access is the signature of an N+1 query.
+
+Budgets are declared next to the routes in `app/routes/` with the
+`query_budget` decorator; routes without one are only checked for repeats,
+against `QUERY_GUARD_REPEATS`. A violation is logged as a report listing the
+repeated shapes with the code locations that ran them; in raise mode,
+`QueryBudgetExceeded` is raised as well, which `TestClient` re-raises in the
+test, so a regression fails the suite. Budgets count the statements of one
+shard: the other branches of a cross-shard fan-out are left out.
+
+The guard walks the stack for every statement, so it is meant for
+development and tests only and is off by default.
+"""
+
+import logging
+import os
+import sys
+import sysconfig
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import event
+
+from . import config
+from .metrics import normalize
+
+logger = logging.getLogger(__name__)
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+LIBRARY_DIRS = tuple(
+    {
+        sysconfig.get_path(name)
+        for name in ("stdlib", "platstdlib", "purelib", "platlib")
+    }
+)
+
+# Code locations kept per statement shape for the report
+MAX_LOCATIONS = 3
+
+
+class QueryBudgetExceeded(Exception):
+    """
+    Raised in `QUERY_GUARD=raise` mode when a request exceeds its query budget.
+    """
+
+
+@dataclass(frozen=True, slots=True)
+class Budget:
+    """
+    SQL budget of a route.
+
+    Attributes:
+        statements (Optional[int]): Maximum statements per request, None for no limit.
+        repeats (Optional[int]): Maximum executions of one statement shape, None for no limit.
+    """
+
+    statements: Optional[int]
+    repeats: Optional[int]
+
+
+def query_budget(
+    statements: Optional[int], repeats: Optional[int] = config.QUERY_GUARD_REPEATS
+):
+    """
+    Declares the SQL budget of a route. Apply it below the router decorator.
+
+    Args:
+        statements (Optional[int]): Maximum statements per request, including
+            those of the route's dependencies; None for no limit.
+        repeats (Optional[int]): Maximum executions of one statement shape
+            (default `QUERY_GUARD_REPEATS`); None for routes that run one
+            statement per item of a bounded batch by design.
+
+    Example:
+        @router.post("/{user_id}/follow")
+        @query_budget(8)
+        async def follow(...):
+    """
+
+    def decorator(endpoint):
+        endpoint.query_budget = Budget(statements, repeats)
+        return endpoint
+
+    return decorator
+
+
+class _RequestQueries:
+    __slots__ = ("count", "shapes", "locations")
+
+    def __init__(self):
+        self.count = 0
+        self.shapes = Counter()
+        self.locations = defaultdict(list)
+
+
+_current: ContextVar[Optional[_RequestQueries]] = ContextVar(
+    "queryguard_request", default=None
+)
+
+
+@contextmanager
+def uncounted():
+    """
+    Leaves the statements run in the block out of the current request's budget.
+
+    Used for the extra branches of a cross-shard fan-out (see `sharding.py`):
+    the same statements run once per shard, and the budget of a route is
+    declared for one.
+    """
+    token = _current.set(None)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def _location(frame) -> str:
+    return f"{frame.f_code.co_filename}:{frame.f_lineno} in {frame.f_code.co_name}"
+
+
+def _caller() -> str:
+    # The innermost frame in the application, or else outside of libraries
+    frame = sys._getframe(2)
+    fallback = None
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(APP_DIR) and filename != __file__:
+            return (
+                f"{os.path.relpath(filename, os.path.dirname(APP_DIR))}:"
+                f"{frame.f_lineno} in {frame.f_code.co_name}"
+            )
+        if fallback is None and not filename.startswith(LIBRARY_DIRS):
+            fallback = _location(frame)
+        frame = frame.f_back
+    return fallback or "<unknown>"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    request = _current.get()
+    if request is None:
+        return
+
+    shape = normalize(statement)
+    request.count += 1
+    request.shapes[shape] += 1
+    locations = request.locations[shape]
+    if len(locations) < MAX_LOCATIONS:
+        location = _caller()
+        if location not in locations:
+            locations.append(location)
+
+
+def instrument_engine(engine):
+    """
+    Counts the statements of the current request on a (sync) engine.
+
+    Args:
+        engine (Engine): Engine to instrument; pass `AsyncEngine.sync_engine`
+            for async engines.
+    """
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+
+
+def check(route: str, budget: Budget, queries: _RequestQueries) -> Optional[str]:
+    """
+    Checks the statements of a request against a budget.
+
+    Args:
+        route (str): Method and route template, for the report.
+        budget (Budget): Budget of the route.
+        queries (_RequestQueries): Statements run by the request.
+
+    Returns:
+        Optional[str]: A report of the violations, or None if within budget.
+    """
+    problems = []
+    if budget.statements is not None and queries.count > budget.statements:
+        problems.append(f"{queries.count} statements, budget is {budget.statements}")
+
+    repeated = [
+        (shape, count)
+        for shape, count in queries.shapes.most_common()
+        if budget.repeats is not None and count > budget.repeats
+    ]
+    if repeated:
+        problems.append(
+            f"{len(repeated)} statement(s) repeated more than {budget.repeats} times"
+        )
+
+    if not problems:
+        return None
+
+    lines = [f"Query budget exceeded by {route}: {'; '.join(problems)}"]
+    for shape, count in repeated or queries.shapes.most_common(5):
+        lines.append(f"  {count}x {shape}")
+        lines.extend(f"      at {location}" for location in queries.locations[shape])
+    return "\n".join(lines)
+
+
+class QueryGuardMiddleware:
+    """
+    ASGI middleware checking every request against the budget of its route.
+    """
+
+    def __init__(self, app, mode: str = "log"):
+        self.app = app
+        self.mode = mode
+        self.default = Budget(None, config.QUERY_GUARD_REPEATS)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        queries = _RequestQueries()
+        token = _current.set(queries)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current.reset(token)
+
+        route = scope.get("route")
+        budget = getattr(getattr(route, "endpoint", None), "query_budget", None)
+        path = getattr(route, "path", None) or scope["path"]
+        report = check(f"{scope['method']} {path}", budget or self.default, queries)
+        if report is not None:
+            logger.warning(report)
+            if self.mode == "raise":
+                raise QueryBudgetExceeded(report)
@@ -0,0 +1,160 @@
+"""
+relations.py
+
+This module writes and checks follows and likes directly on the `follow` and
+`likes` association tables.
+
+Checking `user in current_user.following` or `post in user.likedPosts` loads
+the whole collection just to test membership, and `.append`/`.remove` go
+through the ORM collection. Here every check is a primary-key lookup, and
+every write is a single `INSERT OR IGNORE` or `DELETE` whose row count tells
+whether the relationship actually changed. Counters and home timelines are
+only touched when it did, so repeating a write is harmless.
+"""
+
+from typing import Iterable
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+
+from . import conditional, counters, timeline
+from .models import Post, follow, likes
+
+
+def following_among(db: Session, follower_id: int, user_ids: Iterable[int]) -> set:
+    """
+    Returns the subset of `user_ids` followed by a user, in one query.
+
+    Args:
+        db (Session): SQLAlchemy session.
+        follower_id (int): ID of the follower.
+        user_ids (Iterable[int]): Candidate followees.
+
+    Returns:
+        set[int]: IDs from `user_ids` that the user follows.
+    """
+    return set(
+        db.scalars(
+            select(follow.c.followee).where(
+                follow.c.follower == follower_id, follow.c.followee.in_(list(user_ids))
+            )
+        )
+    )
+
+
+def add_follow(db: Session, follower_id: int, followee_id: int) -> bool:
+    """
+    Creates a follow, then updates counters and backfills the home timeline.
+
+    Args:
+        db (Session): SQLAlchemy session.
+        follower_id (int): ID of the user following.
+        followee_id (int): ID of the user being followed.
+
+    Returns:
+        bool: True if the follow was created, False if it already existed.
+    """
+    result = db.execute(
+        insert(follow)
+        .values(follower=follower_id, followee=followee_id)
+        .prefix_with("OR IGNORE")
+    )
+    if not result.rowcount:
+        return False
+
+    counters.adjust_follow(db, follower_id, followee_id, 1)
+    timeline.backfill(db, follower_id, followee_id)
+    return True
+
+
+def remove_follow(db: Session, follower_id: int, followee_id: int) -> bool:
+    """
+    Deletes a follow, then updates counters and prunes the home timeline.
+
+    Args:
+        db (Session): SQLAlchemy session.
+        follower_id (int): ID of the user unfollowing.
+        followee_id (int): ID of the user being unfollowed.
+
+    Returns:
+        bool: True if the follow was deleted, False if it did not exist.
+    """
+    result = db.execute(
+        delete(follow).where(
+            follow.c.follower == follower_id, follow.c.followee == followee_id
+        )
+    )
+    if not result.rowcount:
+        return False
+
+    counters.adjust_follow(db, follower_id, followee_id, -1)
+    timeline.prune(db, follower_id, followee_id)
+    return True
+
+
+def add_like(db: Session, user_id: int, post_id: int) -> bool:
+    """
+    Records a like, increments the like counter and bumps the author's post listing version.
+
+    Args:
+        db (Session): SQLAlchemy session.
+        user_id (int): ID of the user liking the post.
+        post_id (int): ID of the liked post.
+
+    Returns:
+        bool: True if the like was recorded, False if it already existed.
+    """
+    result = db.execute(
+        insert(likes)
+        .values(likedBy=user_id, likedPost=post_id)
+        .prefix_with("OR IGNORE")
+    )
+    if not result.rowcount:
+        return False
+
+    counters.adjust_likes(db, post_id, 1)
+    conditional.touch_author(db, post_id)
+    return True
+
+
+def remove_like(db: Session, user_id: int, post_id: int) -> bool:
+    """
+    Deletes a like, decrements the like counter and bumps the author's post listing version.
+
+    Args:
+        db (Session): SQLAlchemy session.
+        user_id (int): ID of the user unliking the post.
+        post_id (int): ID of the unliked post.
+
+    Returns:
+        bool: True if the like was deleted, False if it did not exist.
+    """
+    result = db.execute(
+        delete(likes).where(likes.c.likedBy == user_id, likes.c.likedPost == post_id)
+    )
+    if not result.rowcount:
+        return False
+
+    counters.adjust_likes(db, post_id, -1)
+    conditional.touch_author(db, post_id)
+    return True
+
+
+def like_states(db: Session, user_id: int, post_ids: Iterable[int]) -> list:
+    """
+    Returns the like count of each post and whether a user liked it, in one query.
+
+    Args:
+        db (Session): SQLAlchemy session.
+        user_id (int): ID of the user.
+        post_ids (Iterable[int]): IDs of the posts. Unknown ids are skipped.
+
+    Returns:
+        list[tuple[int, int, bool]]: (post id, like count, liked) per existing post.
+    """
+    rows = db.execute(
+        select(Post.id, Post.likesCount, likes.c.likedBy.is_not(None))
+        .outerjoin(likes, (likes.c.likedPost == Post.id) & (likes.c.likedBy == user_id))
+        .where(Post.id.in_(list(post_ids)))
+    )
+    return [(id, count, bool(liked)) for id, count, liked in rows]
@@ -5,9 +5,11 @@ This module handles user authentication using JWT in a FastAPI application.
 
 Functionalities:
 - User login via username and password.
-- Secure password hashing and verification using bcrypt.
+- Secure password hashing and verification using bcrypt, off the event loop (see `hashing.py`).
 - JWT token generation for authenticated sessions.
 - Retrieval of the current user from a JWT token.
+- Optional retrieval of the current user for routes that also serve anonymous clients.
+- Cached, read-only principals for routes that only need the caller's identity.
 """
 
 from datetime import datetime, timedelta, timezone
@@ -16,11 +18,14 @@ from typing import Annotated
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from sqlalchemy.orm import Session
 
-from ..database import get_db
+from .. import config, hashing, principal
+from ..admission import cost_class
+from ..database import SessionRunner, get_db
 from ..models import User
+from ..principal import Principal
+from ..queryguard import query_budget
 from ..schemas import Token
 
 router = APIRouter(
@@ -29,7 +34,7 @@ router = APIRouter(
 )
 
 oauth2_bearer = OAuth2PasswordBearer("/auth/token")
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+oauth2_bearer_optional = OAuth2PasswordBearer("/auth/token", auto_error=False)
 
 SECRET_KEY = "sjgfnsfngsjdfnskndfglksndflgnsdlfgnlsdkngfsdlkfngslkdnfglskdnfgklsndflknsdlknldsknh"
 ALGORITHM = "HS256"
@@ -39,15 +44,18 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 60
 @router.post(
     "/token", response_model=Token, summary="Generates a JWT Token for the User"
 )
+@query_budget(2)
+@cost_class("expensive")
 async def login_for_access_token(
-    form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)
+    form_data: OAuth2PasswordRequestForm = Depends(),
+    db: SessionRunner = Depends(get_db),
 ):
     """
     Authenticates user credentials and returns a JWT access token.
 
     Args:
         form_data (OAuth2PasswordRequestForm): Form containing username and password.
-        db (Session): SQLAlchemy session dependency.
+        db (SessionRunner): Database session dependency.
 
     Returns:
         Token: JWT token and its type if authentication is successful.
@@ -55,7 +63,7 @@ async def login_for_access_token(
     Raises:
         HTTPException: If authentication fails.
     """
-    user = authenticate_user(form_data.username, form_data.password, db)
+    user = await authenticate_user(form_data.username, form_data.password, db)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -65,29 +73,51 @@ async def login_for_access_token(
     return {"access_token": access_token, "token_type": "bearer"}
 
 
-def authenticate_user(username: str, password: str, db):
+async def authenticate_user(username: str, password: str, db: SessionRunner):
     """
     Validates the username and password against the database.
 
+    The bcrypt check runs in the hashing process pool (see `hashing.py`), so it
+    never blocks the event loop. If the stored hash uses an outdated bcrypt
+    cost, it is replaced with a fresh one.
+
     Args:
         username (str): Username provided by the client.
         password (str): Raw password to verify.
-        db (Session): Database session.
+        db (SessionRunner): Database session.
 
     Returns:
         User: The authenticated user object.
 
     Raises:
-        HTTPException: If the user is not found or the password is incorrect.
+        HTTPException:
+            - 401 if the user is not found or the password is incorrect.
+            - 503 if the hashing pool is saturated.
     """
-    user = db.query(User).filter(User.username == username).first()
-    if not user or not pwd_context.verify(password, user.password):
+    user = await db.run_sync(
+        lambda session: session.query(User).filter(User.username == username).first()
+    )
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate user"
+        )
+
+    valid, new_hash = await hashing.verify_password(password, user.password)
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate user"
         )
+
+    if new_hash:
+        await db.run_sync(_rehash, user, new_hash)
     return user
 
 
+def _rehash(db: Session, user: User, new_hash: str):
+    user.password = new_hash  # type:ignore
+    db.commit()
+
+
 def create_access_token(username, id):
     """
     Creates a JWT token with the specified username and user ID.
@@ -107,34 +137,119 @@ def create_access_token(username, id):
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
-def get_current_user(
-    token: Annotated[str, Depends(oauth2_bearer)], db: Session = Depends(get_db)
-):
+def decode_token(token: str):
     """
-    Retrieves the current authenticated user from the JWT token.
+    Verifies a JWT token and extracts its claims.
 
     Args:
         token (str): JWT token extracted from the request header.
-        db (Session): SQLAlchemy session dependency.
 
     Returns:
-        User: Authenticated user object.
+        tuple[str, int]: The username and user ID carried by the token.
 
     Raises:
-        HTTPException: If the token is invalid or user not found.
+        HTTPException: If the token is invalid or lacks the expected claims.
     """
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username = payload.get("sub")
-        id = payload.get("id")
-        if username is None or id is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Could not validate user",
-            )
-        user = db.query(User).filter(User.id == id).first()
-        return user
     except JWTError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate user"
         )
+
+    username = payload.get("sub")
+    id = payload.get("id")
+    if username is None or id is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate user",
+        )
+    return username, id
+
+
+def load_user(db: Session, id: int):
+    """
+    Loads a user by primary key.
+
+    Args:
+        db (Session): SQLAlchemy session.
+        id (int): ID of the user.
+
+    Returns:
+        User | None: The user, or None if it does not exist.
+    """
+    return db.query(User).filter(User.id == id).first()
+
+
+async def get_current_principal(
+    token: Annotated[str, Depends(oauth2_bearer)],
+    db: SessionRunner = Depends(get_db),
+):
+    """
+    Retrieves a read-only snapshot of the current user, served from the principal cache.
+
+    On a cache miss the user is loaded once and cached; with `AUTH_TRUST_TOKEN`
+    the snapshot is built from the verified token claims instead, so the
+    database is never queried.
+
+    Args:
+        token (str): JWT token extracted from the request header.
+        db (SessionRunner): Database session dependency.
+
+    Returns:
+        Principal: Snapshot of the authenticated user.
+
+    Raises:
+        HTTPException: If the token is invalid or user not found.
+    """
+    username, id = decode_token(token)
+
+    snapshot = principal.cached(id)
+    if snapshot is not None:
+        return snapshot
+
+    if config.AUTH_TRUST_TOKEN:
+        return Principal(id=id, username=username)
+
+    user = await db.run_sync(load_user, id)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate user"
+        )
+    snapshot = Principal.from_user(user)
+    principal.remember(snapshot)
+    return snapshot
+
+
+async def get_optional_principal(
+    token: Annotated[str | None, Depends(oauth2_bearer_optional)],
+    db: SessionRunner = Depends(get_db),
+):
+    """
+    Retrieves the current principal if the request carries a token, None otherwise.
+
+    Args:
+        token (str | None): JWT token extracted from the request header, if any.
+        db (SessionRunner): Database session dependency.
+
+    Returns:
+        Principal | None: Snapshot of the authenticated user, or None for anonymous requests.
+
+    Raises:
+        HTTPException: If a token is present but invalid.
+    """
+    if token is None:
+        return None
+    return await get_current_principal(token, db)
+
+
+@router.get("/cache", summary="Principal cache statistics")
+@cost_class("cheap")
+def principalCacheStats():
+    """
+    Returns the size and hit ratio of the authenticated-principal cache for monitoring.
+
+    Returns:
+        dict: size, maxsize, hits, misses, evictions and hit_ratio.
+    """
+    return principal.principal_cache.stats()
@@ -0,0 +1,242 @@
+"""
+export.py
+
+This module streams the full history of a user as NDJSON.
+
+Endpoints:
+- GET /users/{user_id}/export: Streams the profile, posts, likes, followed
+  users and followers of the current user.
+
+Loading a whole history through the listing routes would materialize every
+post in memory at once. Here the response is a `StreamingResponse` fed by an
+async generator: each section is read in chunks of `EXPORT_CHUNK` rows, by
+seeking past the last key read on the index that serves it, and every chunk
+is encoded and sent before the next one is read. Memory use depends on the
+chunk size, not on the size of the account.
+
+Each chunk is read in its own short transaction rather than through one
+cursor held open for the whole download: on SQLite an open read transaction
+blocks writers (rollback journal) or checkpoints (WAL) for as long as the
+client takes to read the response. The export is therefore not a snapshot;
+rows written while it runs may or may not be included. With shards, posts
+are read from the author's shard and likes from every shard.
+
+Every line is a JSON object with a `type`: one `user` line, then `post`,
+`like`, `following` and `follower` lines, and a final `end` line with the
+number of rows of each section. A response without the `end` line was cut
+short.
+
+Measure memory use and throughput with `python -m benchmarks.export`.
+"""
+
+from typing import AsyncIterator, Callable, Optional
+
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .. import config, sharding
+from ..admission import cost_class
+from ..database import AsyncReadSessionLocal, ReadSessionLocal, open_session
+from ..models import Post, User, follow, likes
+from ..principal import Principal
+from ..queryguard import query_budget
+from .auth import get_current_principal
+
+# Rows read and sent per round trip
+EXPORT_CHUNK = 1000
+
+router = APIRouter(
+    prefix="/users",
+    tags=["Users"],
+)
+
+
+def _read_session(shard: Optional[int] = None):
+    # The read pool for the directory (and the single file), the shard otherwise
+    if shard is None or not sharding.ENABLED:
+        return open_session(AsyncReadSessionLocal, ReadSessionLocal)
+    return sharding.session(shard)
+
+
+def _posts(db: Session, user_id: int, after: int, limit: int) -> list:
+    return db.execute(
+        select(Post.id, Post.title, Post.content, Post.likesCount, Post.createdAt)
+        .where(Post.author == user_id, Post.id > after)
+        .order_by(Post.id)
+        .limit(limit)
+    ).all()
+
+
+def _likes(db: Session, user_id: int, after: int, limit: int) -> list:
+    return db.execute(
+        select(likes.c.likedPost, likes.c.createdAt)
+        .where(likes.c.likedBy == user_id, likes.c.likedPost > after)
+        .order_by(likes.c.likedPost)
+        .limit(limit)
+    ).all()
+
+
+def _following(db: Session, user_id: int, after: int, limit: int) -> list:
+    return db.execute(
+        select(follow.c.followee)
+        .where(follow.c.follower == user_id, follow.c.followee > after)
+        .order_by(follow.c.followee)
+        .limit(limit)
+    ).all()
+
+
+def _followers(db: Session, user_id: int, after: int, limit: int) -> list:
+    return db.execute(
+        select(follow.c.follower)
+        .where(follow.c.followee == user_id, follow.c.follower > after)
+        .order_by(follow.c.follower)
+        .limit(limit)
+    ).all()
+
+
+def _profile(db: Session, user_id: int):
+    return db.execute(
+        select(
+            User.id,
+            User.username,
+            User.email,
+            User.gender,
+            User.followersCount,
+            User.followingCount,
+            User.postsCount,
+        ).where(User.id == user_id)
+    ).first()
+
+
+# Section name, shards it is read from, chunk reader and line encoder. The
+# first column of every row is the key the next chunk seeks past.
+SECTIONS = (
+    (
+        "posts",
+        lambda user_id: [sharding.shard_of_author(user_id)],
+        _posts,
+        lambda row: {
+            "type": "post",
+            "id": row.id,
+            "title": row.title,
+            "content": row.content,
+            "like_count": row.likesCount,
+            "created_at": row.createdAt,
+        },
+    ),
+    (
+        "likes",
+        lambda user_id: list(range(config.SHARDS)),
+        _likes,
+        lambda row: {"type": "like", "post_id": row[0], "created_at": row[1]},
+    ),
+    (
+        "following",
+        lambda user_id: [None],
+        _following,
+        lambda row: {"type": "following", "user_id": row[0]},
+    ),
+    (
+        "followers",
+        lambda user_id: [None],
+        _followers,
+        lambda row: {"type": "follower", "user_id": row[0]},
+    ),
+)
+
+
+def _line(value: dict) -> bytes:
+    return orjson.dumps(value, option=orjson.OPT_APPEND_NEWLINE)
+
+
+async def _section(
+    user_id: int, shards: list, read: Callable, encode: Callable
+) -> AsyncIterator[tuple[int, bytes]]:
+    # Yields (rows, lines) per chunk
+    for shard in shards if sharding.ENABLED else [None]:
+        after = 0
+        while True:
+            async with _read_session(shard) as db:
+                rows = await db.run_sync(read, user_id, after, EXPORT_CHUNK)
+            if rows:
+                yield len(rows), b"".join(_line(encode(row)) for row in rows)
+            if len(rows) < EXPORT_CHUNK:
+                break
+            after = rows[-1][0]
+
+
+async def export_lines(profile) -> AsyncIterator[bytes]:
+    """
+    Yields the NDJSON export of a user, one chunk of lines at a time.
+
+    Args:
+        profile (Row): The user's profile, see `_profile`.
+
+    Yields:
+        bytes: Complete lines, at most `EXPORT_CHUNK` of them per chunk.
+    """
+    yield _line({"type": "user", **profile._asdict()})
+
+    counts = {}
+    for name, shards_of, read, encode in SECTIONS:
+        counts[name] = 0
+        async for rows, lines in _section(
+            profile.id, shards_of(profile.id), read, encode
+        ):
+            counts[name] += rows
+            yield lines
+
+    yield _line({"type": "end", **counts})
+
+
+@router.get(
+    "/{user_id}/export",
+    summary="Exports the history of a user",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"application/x-ndjson": {}}}},
+)
+# One statement per chunk, so the same shapes repeat with the size of the account
+@query_budget(None, repeats=None)
+@cost_class("streaming")
+async def exportUser(
+    user_id: int,
+    current_user: Principal = Depends(get_current_principal),
+):
+    """
+    Streams the profile, posts, likes, followed users and followers of the
+    current user as NDJSON, oldest posts first.
+
+    Args:
+        user_id (int): ID of the user to export; must be the current user.
+        current_user (Principal): Authenticated user.
+
+    Returns:
+        StreamingResponse: `application/x-ndjson` lines, see the module docstring.
+
+    Raises:
+        HTTPException:
+            - 403 if the user is not the current user.
+            - 404 if the user is not found.
+    """
+    if user_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You are not authorised to export this user",
+        )
+
+    async with _read_session() as db:
+        profile = await db.run_sync(_profile, user_id)
+
+    if profile is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
+        )
+
+    return StreamingResponse(
+        export_lines(profile),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="user{user_id}.ndjson"'},
+    )
@@ -2,28 +2,50 @@
 feed.py
 
 This module provides feed-related endpoints for the application,
-including fetching random users and retrieving posts for a specific user.
+including fetching random users, the home timeline of the current user
+and retrieving posts for a specific user.
 
 Endpoints:
-- GET /feed/users: Returns a list of random users for the feed.
-- GET /feed/users/{username}/posts: Returns all posts made by a given user.
+- GET /feed/users: Returns a list of random users for the feed (see `sampler.py`).
+- GET /feed/home: Returns posts from the users the current user follows.
+- GET /feed/trending: Returns the posts with the most recent likes (see `trending.py`).
+- GET /feed/trending/stats: Returns the statistics of the trending scores.
+- GET /feed/users/{username}/posts: Returns posts made by a given user, page by page.
+- GET /feed/cache: Returns the statistics of the user feed cache.
+
+Post listings use opaque-cursor keyset pagination (`limit`, `cursor` and
+`next_cursor`), see `pagination.py`. All routes here only read, so they use
+the read-only connection pool when `DB_READ_POOL` is enabled, and they select
+plain column projections encoded straight to JSON (see `projections.py`).
 """
 
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from sqlalchemy.sql.expression import func
 
-from ..database import get_db
-from ..models import Post, User
-from ..schemas import userSummary
+from .. import feedcache, projections, sharding, timeline, trending
+from ..admission import cost_class
+from ..conditional import Version, conditional, userPostsVersion
+from ..database import SessionRunner, get_read_db
+from ..models import Post
+from ..pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, paginate
+from ..principal import Principal
+from ..queryguard import query_budget
+from ..sampler import MAX_SAMPLE, sampler
+from ..schemas import postPage, trendingPage, userSummary
+from .auth import get_current_principal, get_optional_principal
 
 router = APIRouter(
     prefix="/feed",
     tags=["Feed"],
 )
 
+# Paths declared before `/{username}`, which would hide the posts of users
+# with these names; registration refuses them
+RESERVED_USERNAMES = frozenset({"home", "trending", "cache"})
+
 
 @router.get(
     "",
@@ -31,60 +53,289 @@ router = APIRouter(
     description="Fetches random users for the sake of the feed",
     response_model=List[userSummary],
 )
-def getUsers(db: Session = Depends(get_db)):
+@query_budget(5)
+async def getUsers(
+    count: int = Query(5, ge=1, le=MAX_SAMPLE),
+    exclude_followed: bool = False,
+    current_user: Optional[Principal] = Depends(get_optional_principal),
+    db: SessionRunner = Depends(get_read_db),
+):
     """
-    Fetches a random set of 5 users from the database to populate the feed.
+    Fetches a random set of users from the database to populate the feed.
+
+    Users are drawn by `sampler.py` from a periodically refreshed candidate
+    pool, so the cost does not grow with the size of the `Users` table.
+
+    Args:
+        count (int): Number of users to return.
+        exclude_followed (bool): Leave out the current user and the users they
+            already follow. Requires authentication.
+        current_user (Optional[Principal]): Authenticated user, if a token was sent.
+        db (SessionRunner): Database session.
 
     Returns:
         List[userSummary]: A list of user summaries including id, username, gender, and follower count.
 
+    Raises:
+        HTTPException: 401 if `exclude_followed` is requested anonymously.
+
     Notes:
-        - If there are fewer than 5 users in the database, it returns all available users.
+        - If there are fewer than `count` users available, it returns all of them.
     """
-    users = db.query(User).order_by(func.random()).limit(5).all()
-    result = [
-        userSummary(
-            id=user.id,  # type:ignore
-            username=user.username,  # type:ignore
-            gender=user.gender,  # type:ignore
-            followersCount=len(user.followers),
+    return await db.run_sync(_getUsers, count, exclude_followed, current_user)
+
+
+def _getUsers(
+    db: Session, count: int, exclude_followed: bool, current_user: Optional[Principal]
+):
+    if exclude_followed and current_user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate user",
         )
-        for user in users
-    ]
 
-    return result
+    users = sampler.sample(
+        db, count, current_user.id if exclude_followed else None  # type:ignore
+    )
+
+    return projections.json_response(
+        projections.as_dicts(users, projections.USER_SUMMARY_FIELDS)
+    )
+
+
+@router.get(
+    "/home",
+    summary="Fetches the home timeline",
+    description="Fetches posts from the users the current user follows",
+    response_model=postPage,
+)
+@query_budget(2)
+async def getHome(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    columns: tuple = Depends(projections.post_projection),
+    current_user: Principal = Depends(get_current_principal),
+    db: SessionRunner = Depends(get_read_db),
+):
+    """
+    Retrieves the current user's home timeline, newest posts first.
+
+    The timeline is materialized on write, so this is a single indexed
+    range read no matter how many users are followed.
+
+    With shards, the page of post ids is read from the directory and the
+    posts are fetched from their shards concurrently.
+
+    Args:
+        limit (int): Maximum number of posts to return.
+        cursor (Optional[str]): Opaque cursor returned as `next_cursor` by the previous page.
+        columns (tuple): Columns to return, from the `fields` and `view` parameters.
+        current_user (Principal): Authenticated user.
+        db (SessionRunner): Database session.
+
+    Returns:
+        postPage: Posts from followed users, ordered by descending id, and the next cursor.
+    """
+    if not sharding.ENABLED:
+        return await db.run_sync(_getHome, limit, cursor, columns, current_user)
+
+    key = decode_cursor(cursor, "id")
+    ids = await db.run_sync(
+        timeline.read_home_ids,
+        current_user.id,
+        limit + 1,
+        key["id"] if key else None,
+    )
+    ids, next_cursor = paginate(ids, limit, lambda id: {"id": id})
+    posts = await sharding.fetch_posts(db, ids, columns)
+
+    return projections.json_response(
+        projections.post_page(posts, next_cursor, projections.field_names(columns))
+    )
+
+
+def _getHome(
+    db: Session,
+    limit: int,
+    cursor: Optional[str],
+    columns: tuple,
+    current_user: Principal,
+):
+    key = decode_cursor(cursor, "id")
+    before = key["id"] if key else None
+
+    rows = timeline.read_home(
+        db, current_user.id, limit + 1, before, columns  # type:ignore
+    )
+    posts, next_cursor = paginate(rows, limit, lambda post: {"id": post.id})
+
+    return projections.json_response(
+        projections.post_page(posts, next_cursor, projections.field_names(columns))
+    )
+
+
+@router.get(
+    "/trending",
+    summary="Fetches the trending posts",
+    description="Fetches the posts with the most recent likes",
+    response_model=trendingPage,
+)
+@query_budget(2)
+async def getTrending(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=trending.MAX_TRENDING),
+    columns: tuple = Depends(projections.post_projection),
+    db: SessionRunner = Depends(get_read_db),
+):
+    """
+    Retrieves the posts with the highest time-decayed like score.
+
+    Scores are kept in memory and updated as likes are committed, so the
+    ranking costs no query; only the posts themselves are loaded, from
+    their shards. Once the scores expire, the request that notices it
+    starts rebuilding them from the recent likes in the background (see
+    `trending.py`).
+
+    Args:
+        limit (int): Maximum number of posts to return.
+        columns (tuple): Columns to return, from the `fields` and `view` parameters.
+        db (SessionRunner): Database session.
+
+    Returns:
+        trendingPage: The posts, highest score first, each with its `score`.
+    """
+    trending.refresh()
+    scores = dict(trending.trending.top(limit))
+    rows = await sharding.fetch_posts(db, list(scores), columns)
+
+    posts = projections.as_dicts(rows, projections.field_names(columns))
+    for post in posts:
+        post["score"] = scores[post["id"]]
+
+    return projections.json_response({"posts": posts})
+
+
+@router.get("/trending/stats", summary="Trending scores statistics")
+@cost_class("cheap")
+def trendingStats():
+    """
+    Returns the number of scored posts and the age of the scores for monitoring.
+
+    Returns:
+        dict: See `TrendingPosts.stats`.
+    """
+    return trending.trending.stats()
+
+
+@router.get("/cache", summary="Feed cache statistics")
+@cost_class("cheap")
+def feedCacheStats():
+    """
+    Returns the size, hit ratio and evictions of the user feed cache for monitoring.
+
+    Returns:
+        dict: Statistics of the configured backend (see `cache.py`).
+    """
+    return feedcache.feed_cache.stats()
 
 
 @router.get(
     "/{username}",
     summary="Fetches posts of a certain user",
+    response_model=postPage,
 )
-def getPosts(username: str, db: Session = Depends(get_db)):
+@query_budget(3)
+async def getPosts(
+    username: str,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    columns: tuple = Depends(projections.post_projection),
+    db: SessionRunner = Depends(get_read_db),
+    _: Version = Depends(conditional(userPostsVersion)),
+):
     """
-    Retrieves all posts made by a specific user.
+    Retrieves a page of posts made by a specific user, newest first.
+
+    Pages are fetched by seeking on the (author, id) index rather than with
+    OFFSET, so every page costs the same however deep the client scrolls.
+    The username lookup and the serialized page are cached (see
+    `feedcache.py`), so hot accounts are served without querying posts. With
+    shards, the page is read from the author's shard.
+
+    Responses carry an `ETag` and `Last-Modified` derived from the user's
+    post listing version. A request whose `If-None-Match` matches gets a
+    `304 Not Modified` without any post being loaded (see `conditional.py`).
 
     Args:
         username (str): The username whose posts should be fetched.
-        db (Session): SQLAlchemy database session.
+        response (Response): Carries the headers set by the conditional dependency.
+        limit (int): Maximum number of posts to return.
+        cursor (Optional[str]): Opaque cursor returned as `next_cursor` by the previous page.
+        columns (tuple): Columns to return, from the `fields` and `view` parameters.
+        db (SessionRunner): Database session.
 
     Returns:
-        List[Post]: A list of post objects authored by the user.
-        OR
-        Dict[str, str]: A message if no posts are found.
+        postPage: The page of posts and the cursor of the next page
+        (`next_cursor` is null on the last page).
 
     Raises:
-        HTTPException: 404 if the user is not found in the database.
+        HTTPException:
+            - 304 if the client's copy is current.
+            - 404 if the user is not found in the database.
+            - 400 if the cursor is malformed or a field is unknown.
     """
-    user = db.query(User).filter(User.username == username).first()
+    if not sharding.ENABLED:
+        body = await db.run_sync(_getPosts, username, limit, cursor, columns)
+    else:
+        user_id = await db.run_sync(_userId, username)
+        body = await sharding.run(
+            db,
+            sharding.shard_of_author(user_id),
+            _postsPage,
+            user_id,
+            limit,
+            cursor,
+            columns,
+        )
+
+    return projections.json_response(body, headers=response.headers)
 
-    if not user:
+
+def _getPosts(
+    db: Session, username: str, limit: int, cursor: Optional[str], columns: tuple
+):
+    return _postsPage(db, _userId(db, username), limit, cursor, columns)
+
+
+def _userId(db: Session, username: str) -> int:
+    user_id = feedcache.user_id(db, username)
+
+    if user_id is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
         )
 
-    posts = db.query(Post).filter(Post.author == user.id).all()
+    return user_id
+
+
+def _postsPage(
+    db: Session, user_id: int, limit: int, cursor: Optional[str], columns: tuple
+):
+    key = decode_cursor(cursor, "id")
+
+    fields = projections.field_names(columns)
+    cache_key = feedcache.page_key(user_id, limit, cursor, ",".join(fields))
+    body = feedcache.get_page(cache_key)
+    if body is not None:
+        return body
+
+    query = select(*columns).where(Post.author == user_id)
+    if key:
+        query = query.where(Post.id < key["id"])
 
-    if not posts:
-        return {"message": "The user has not posted anything yet"}
+    rows = db.execute(query.order_by(Post.id.desc()).limit(limit + 1)).all()
+    posts, next_cursor = paginate(rows, limit, lambda post: {"id": post.id})
 
-    return posts
+    body = projections.post_page(posts, next_cursor, fields)
+    feedcache.set_page(cache_key, body)
+    return body
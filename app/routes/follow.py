@@ -6,17 +6,32 @@ This module provides endpoints for user interactions such as following and unfol
 Routes:
 - POST /users/{user_id}/follow — Follow a user
 - DELETE /users/{user_id}/unfollow — Unfollow a user
+- POST /users/follow/bulk — Follow or unfollow a list of users in one transaction
+- GET /users/{user_id}/suggestions — Users to follow, ranked by mutual follows
+- GET /users/graph — Statistics of the in-memory follow graph
 
 Authentication:
-- Both routes require a valid JWT token to identify the current user.
+- All routes require a valid JWT token to identify the current user.
+
+With `SHARDS` set, a follow runs on the shard of the followed user, whose
+posts are backfilled into the home timeline (see `sharding.py`).
 """
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 
-from ..database import get_db
+from .. import config, projections, relations, sharding, writequeue
+from ..admission import cost_class
+from ..database import ReadSessionLocal, SessionRunner, get_db, get_read_db
+from ..followgraph import MAX_SUGGESTIONS, follow_graph
 from ..models import User
-from .auth import get_current_user
+from ..principal import Principal
+from ..queryguard import query_budget
+from ..schemas import bulkFollowRequest, bulkFollowResponse, followSuggestion
+from .auth import get_current_principal
 
 router = APIRouter(
     prefix="/users",
@@ -24,19 +39,42 @@ router = APIRouter(
 )
 
 
+def _counts(db: Session, user_id: int) -> dict:
+    following, followers = db.execute(
+        select(User.followingCount, User.followersCount).where(User.id == user_id)
+    ).one()
+    return {"following_count": following, "followers_count": followers}
+
+
+def _username(db: Session, user_id: int) -> str:
+    username = db.scalar(select(User.username).where(User.id == user_id))
+
+    if username is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
+        )
+
+    return username
+
+
 @router.post("/{user_id}/follow", summary="Follows a User")
-def follow(
+@query_budget(8)
+async def follow(
     user_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_principal),
+    db: SessionRunner = Depends(get_db),
 ):
     """
     Allows the current user to follow another user by user_id.
 
+    The followee's recent posts are backfilled into the current user's home timeline.
+    With `WRITE_QUEUE` enabled, the follow is committed in a batch with
+    concurrent likes and follows (see `writequeue.py`).
+
     Args:
         user_id (int): ID of the user to follow.
-        current_user (User): The authenticated user performing the follow.
-        db (Session): SQLAlchemy database session.
+        current_user (Principal): The authenticated user performing the follow.
+        db (SessionRunner): Database session.
 
     Returns:
         dict: Message indicating success and updated follower/following counts.
@@ -45,48 +83,73 @@ def follow(
         HTTPException:
             - 404 if the target user doesn't exist.
             - 400 if the user tries to follow themselves or already follows the user.
+            - 503 if too many queued writes are waiting.
     """
-    user_to_follow = db.query(User).filter(User.id == user_id).first()
+    if not config.WRITE_QUEUE:
+        return await sharding.run(
+            db, sharding.shard_of_author(user_id), _follow, user_id, current_user
+        )
+
+    username = await db.run_sync(_target, user_id, current_user, "follow")
+    outcome = await writequeue.submit("follow", current_user.id, user_id, True)
 
-    if not user_to_follow:
+    if not outcome.changed:
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="You are already following the user",
         )
 
-    if current_user == user_to_follow:
+    return {"message": f"You are now following {username}", **outcome.counts}
+
+
+def _target(db: Session, user_id: int, current_user: Principal, action: str) -> str:
+    username = _username(db, user_id)
+
+    if current_user.id == user_id:
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail="You cannot follow yourself"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"You cannot {action} yourself",
         )
 
-    if user_to_follow in current_user.following:
+    return username
+
+
+def _follow(db: Session, user_id: int, current_user: Principal):
+    username = _target(db, user_id, current_user, "follow")
+
+    if not relations.add_follow(db, current_user.id, user_id):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="You are already following the user",
         )
 
-    current_user.following.append(user_to_follow)
     db.commit()
+    follow_graph.update(current_user.id, user_id, True)
 
     return {
-        "message": f"You are now following {user_to_follow.username}",
-        "following_count": len(current_user.following),
-        "followers_count": len(current_user.followers),
+        "message": f"You are now following {username}",
+        **_counts(db, current_user.id),
     }
 
 
 @router.delete("/{user_id}/unfollow", summary="Unfollows a user")
-def unfollow(
+@query_budget(7)
+async def unfollow(
     user_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_principal),
+    db: SessionRunner = Depends(get_db),
 ):
     """
     Allows the current user to unfollow another user by user_id.
 
+    The unfollowed user's posts are pruned from the current user's home timeline.
+    With `WRITE_QUEUE` enabled, the unfollow goes through the write queue like
+    `follow`.
+
     Args:
         user_id (int): ID of the user to unfollow.
-        current_user (User): The authenticated user performing the unfollow.
-        db (Session): SQLAlchemy database session.
+        current_user (Principal): The authenticated user performing the unfollow.
+        db (SessionRunner): Database session.
 
     Returns:
         dict: Message indicating success and updated follower/following counts.
@@ -95,31 +158,205 @@ def unfollow(
         HTTPException:
             - 404 if the target user doesn't exist.
             - 400 if the user tries to unfollow themselves or someone they don’t follow.
+            - 503 if too many queued writes are waiting.
     """
-    user_to_unfollow = db.query(User).filter(User.id == user_id).first()
+    if not config.WRITE_QUEUE:
+        return await db.run_sync(_unfollow, user_id, current_user)
 
-    if not user_to_unfollow:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
-        )
+    username = await db.run_sync(_target, user_id, current_user, "unfollow")
+    outcome = await writequeue.submit("follow", current_user.id, user_id, False)
 
-    if current_user == user_to_unfollow:
+    if not outcome.changed:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="You cannot unfollow yourself",
+            detail="You are not following the user",
         )
 
-    if user_to_unfollow not in current_user.following:
+    return {"message": f"You are now not following {username}", **outcome.counts}
+
+
+def _unfollow(db: Session, user_id: int, current_user: Principal):
+    username = _target(db, user_id, current_user, "unfollow")
+
+    if not relations.remove_follow(db, current_user.id, user_id):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="You are not following the user",
         )
 
-    current_user.following.remove(user_to_unfollow)
     db.commit()
+    follow_graph.update(current_user.id, user_id, False)
 
     return {
-        "message": f"You are now not following {user_to_unfollow.username}",
-        "following_count": len(current_user.following),
-        "followers_count": len(current_user.followers),
+        "message": f"You are now not following {username}",
+        **_counts(db, current_user.id),
     }
+
+
+@router.post(
+    "/follow/bulk",
+    summary="Follows or unfollows several users",
+    response_model=bulkFollowResponse,
+)
+# Runs a few statements per id, bounded by MAX_BULK_FOLLOW
+@query_budget(None, repeats=None)
+@cost_class("expensive")
+async def bulkFollow(
+    request: bulkFollowRequest,
+    current_user: Principal = Depends(get_current_principal),
+    db: SessionRunner = Depends(get_db),
+):
+    """
+    Follows or unfollows a list of users in a single transaction.
+
+    Unlike the single-user routes, a target that cannot be changed does not
+    fail the request; its outcome is reported in the per-id results instead.
+    Duplicate ids are processed once. With shards, follows are committed in
+    one transaction per shard of the followed users.
+
+    Args:
+        request (bulkFollowRequest): The action and the ids of the target users.
+        current_user (Principal): The authenticated user.
+        db (SessionRunner): Database session.
+
+    Returns:
+        bulkFollowResponse: One status per distinct id, in request order
+        ("followed", "unfollowed", "already_following", "not_following",
+        "not_found" or "self"), and the updated counts of the current user.
+    """
+    user_ids = list(dict.fromkeys(request.user_ids))
+    if sharding.ENABLED and request.action == "follow":
+        statuses = {}
+        for shard, ids in sharding.group(user_ids, sharding.shard_of_author).items():
+            statuses.update(
+                await sharding.run(db, shard, _bulkFollow, ids, request, current_user)
+            )
+    else:
+        statuses = await db.run_sync(_bulkFollow, user_ids, request, current_user)
+
+    return {
+        "results": [{"user_id": id, "status": statuses[id]} for id in user_ids],
+        **await db.run_sync(_counts, current_user.id),
+    }
+
+
+def _bulkFollow(
+    db: Session, user_ids: list, request: bulkFollowRequest, current_user: Principal
+) -> dict:
+    existing = set(db.scalars(select(User.id).where(User.id.in_(user_ids))))
+
+    if request.action == "follow":
+        apply, changed, unchanged = (
+            relations.add_follow,
+            "followed",
+            "already_following",
+        )
+    else:
+        apply, changed, unchanged = (
+            relations.remove_follow,
+            "unfollowed",
+            "not_following",
+        )
+
+    statuses = {}
+    for user_id in user_ids:
+        if user_id == current_user.id:
+            outcome = "self"
+        elif user_id not in existing:
+            outcome = "not_found"
+        elif apply(db, current_user.id, user_id):
+            outcome = changed
+        else:
+            outcome = unchanged
+        statuses[user_id] = outcome
+
+    db.commit()
+    for user_id, outcome in statuses.items():
+        if outcome == changed:
+            follow_graph.update(current_user.id, user_id, request.action == "follow")
+
+    return statuses
+
+
+@router.get("/graph", summary="Follow graph statistics")
+@cost_class("cheap")
+def followGraphStats():
+    """
+    Returns the size and memory footprint of the in-memory follow graph for monitoring.
+
+    Returns:
+        dict: Users, edges and overlay edges, bytes per structure and build timings
+        (see `followgraph.py`).
+    """
+    return follow_graph.stats()
+
+
+@router.get(
+    "/{user_id}/suggestions",
+    summary="Suggests users to follow",
+    response_model=List[followSuggestion],
+)
+@query_budget(3)
+async def getSuggestions(
+    user_id: int,
+    limit: int = Query(10, ge=1, le=MAX_SUGGESTIONS),
+    db: SessionRunner = Depends(get_read_db),
+):
+    """
+    Suggests users to follow: the users followed by the people this user
+    follows, ranked by how many of them follow each one.
+
+    Suggestions are computed from the in-memory follow graph (see
+    `followgraph.py`), so the cost does not depend on the number of follows
+    in the database; only the returned users are loaded.
+
+    Args:
+        user_id (int): ID of the user to suggest follows to.
+        limit (int): Maximum number of suggestions.
+        db (SessionRunner): Database session.
+
+    Returns:
+        List[followSuggestion]: User summaries with their `mutual_count`, the
+        highest count first. Empty if the user follows nobody.
+
+    Raises:
+        HTTPException:
+            - 404 if the user doesn't exist.
+            - 503 until the follow graph has been built once.
+    """
+    return await db.run_sync(_getSuggestions, user_id, limit)
+
+
+def _getSuggestions(db: Session, user_id: int, limit: int):
+    _username(db, user_id)
+
+    follow_graph.ensure_fresh(ReadSessionLocal)
+    if not follow_graph.ready:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Follow suggestions are not available yet",
+            headers={"Retry-After": "5"},
+        )
+    ranked = follow_graph.suggestions(user_id, limit)
+    if not ranked:
+        return projections.json_response([])
+
+    users = {
+        user.id: user
+        for user in db.execute(
+            select(*projections.USER_SUMMARY_COLUMNS).where(
+                User.id.in_([id for id, _ in ranked])
+            )
+        )
+    }
+
+    return projections.json_response(
+        [
+            {
+                **dict(zip(projections.USER_SUMMARY_FIELDS, users[id])),
+                "mutual_count": count,
+            }
+            for id, count in ranked
+            if id in users
+        ]
+    )
@@ -2,19 +2,46 @@
 posts.py
 
 This module provides routes related to post management:
-- Creating, updating, and deleting posts
+- Creating (one at a time or in bulk), updating, and deleting posts
 - Liking and unliking posts
+- Looking up the like state of a batch of posts
+- Full-text search over posts
 
-All operations are authenticated and scoped to the current user.
+All operations except search are authenticated and scoped to the current user.
+
+With `SHARDS` set, each route runs on the shard of the post (from its id) or
+of the author (see `sharding.py`); like states and search fan out to the
+shards concurrently and merge the results.
 """
 
-from fastapi import APIRouter, Depends, HTTPException, status
+import math
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import insert, select
 from sqlalchemy.orm import Session
 
-from ..database import get_db
-from ..models import Post, User
-from ..schemas import postMetadata, postResponse
-from .auth import get_current_user
+from .. import (
+    conditional,
+    config,
+    counters,
+    feedcache,
+    projections,
+    relations,
+    search,
+    sharding,
+    timeline,
+    writequeue,
+)
+from ..admission import cost_class
+from ..database import SessionRunner, get_db, get_read_db
+from ..models import Post
+from ..pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, paginate
+from ..principal import Principal
+from ..queryguard import query_budget
+from ..schemas import bulkPostRequest, likeStates, postMetadata, postPage, postResponse
+from ..trending import trending
+from .auth import get_current_principal
 
 router = APIRouter(
     prefix="/posts",
@@ -22,48 +49,154 @@ router = APIRouter(
 )
 
 
+def _likedPost(db: Session, post_id: int):
+    post = db.execute(select(Post.title, Post.author).where(Post.id == post_id)).first()
+
+    if post is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Post not found",
+        )
+
+    return post
+
+
+def _likeCount(db: Session, post_id: int) -> int:
+    return db.scalar(select(Post.likesCount).where(Post.id == post_id))
+
+
 @router.post(
     "",
     summary="Creates a post",
     description="Creates a post for the current user",
     response_model=postResponse,
 )
-def createPost(
+@query_budget(7)
+async def createPost(
     postData: postMetadata,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: SessionRunner = Depends(get_db),
+    current_user: Principal = Depends(get_current_principal),
 ):
     """
     Creates a new post authored by the current user.
 
+    The post is fanned out to the home timelines of the author's followers
+    in the same transaction.
+
     Args:
         postData (postMetadata): Post content and title.
-        db (Session): SQLAlchemy session.
-        current_user (User): Authenticated user.
+        db (SessionRunner): Database session.
+        current_user (Principal): Authenticated user.
 
     Returns:
         postResponse: The created post object.
     """
+    return await sharding.run(
+        db,
+        sharding.shard_of_author(current_user.id),
+        _createPost,
+        postData,
+        current_user,
+    )
+
+
+def _createPost(db: Session, postData: postMetadata, current_user: Principal):
     post = Post(author=current_user.id, title=postData.title, content=postData.content)
+    id = sharding.new_post_id(current_user.id)  # type:ignore
+    if id is not None:
+        post.id = id
 
     db.add(post)
+    db.flush()
+    counters.adjust_posts(db, current_user.id, 1)  # type:ignore
+    timeline.fan_out_post(db, post)
+    search.index_posts(db, [post.id])
+    conditional.touch(db, current_user.id)
     db.commit()
+    feedcache.invalidate(current_user.id)
     db.refresh(post)
 
     return post
 
 
+@router.post(
+    "/bulk",
+    summary="Creates several posts",
+    description="Creates a batch of posts for the current user in one transaction",
+    response_model=List[postResponse],
+)
+@query_budget(8)
+@cost_class("expensive")
+async def createPosts(
+    postsData: bulkPostRequest,
+    db: SessionRunner = Depends(get_db),
+    current_user: Principal = Depends(get_current_principal),
+):
+    """
+    Creates a batch of posts authored by the current user.
+
+    All posts are written with a single `executemany` and fanned out with a
+    single statement, in one transaction: either every post is created or none is.
+
+    Args:
+        postsData (bulkPostRequest): Titles and contents of the posts, at most 1000.
+        db (SessionRunner): Database session.
+        current_user (Principal): Authenticated user.
+
+    Returns:
+        List[postResponse]: The created posts, in request order.
+    """
+    return await sharding.run(
+        db,
+        sharding.shard_of_author(current_user.id),
+        _createPosts,
+        postsData,
+        current_user,
+    )
+
+
+def _createPosts(db: Session, postsData: bulkPostRequest, current_user: Principal):
+    rows = [
+        {"author": current_user.id, "title": post.title, "content": post.content}
+        for post in postsData.posts
+    ]
+
+    statement = insert(Post)
+    id = sharding.new_post_id(current_user.id)  # type:ignore
+    if id is not None:
+        statement = statement.values(id=id)
+    db.execute(statement, rows)
+
+    # The insert holds SQLite's write lock until commit, so the author's newest
+    # posts are exactly the ones just inserted, with ids in insertion order.
+    ids = db.scalars(
+        select(Post.id)
+        .where(Post.author == current_user.id)
+        .order_by(Post.id.desc())
+        .limit(len(rows))
+    ).all()[::-1]
+    counters.adjust_posts(db, current_user.id, len(ids))
+    timeline.fan_out_posts(db, current_user.id, ids)
+    search.index_posts(db, ids)
+    conditional.touch(db, current_user.id)
+    db.commit()
+    feedcache.invalidate(current_user.id)
+
+    return [{"id": id, "likesCount": 0, **row} for id, row in zip(ids, rows)]
+
+
 @router.put(
     "/{post_id}",
     summary="Updates a post",
     description="Updates a post for the current user",
     response_model=postResponse,
 )
-def updatePost(
+@query_budget(7)
+async def updatePost(
     post_id: int,
     postData: postMetadata,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_principal),
+    db: SessionRunner = Depends(get_db),
 ):
     """
     Updates a post owned by the current user.
@@ -71,8 +204,8 @@ def updatePost(
     Args:
         post_id (int): ID of the post to update.
         postData (postMetadata): New title and content.
-        current_user (User): Authenticated user.
-        db (Session): SQLAlchemy session.
+        current_user (Principal): Authenticated user.
+        db (SessionRunner): Database session.
 
     Returns:
         postResponse: Updated post object.
@@ -82,6 +215,19 @@ def updatePost(
             - 400 if post not found.
             - 403 if the user is not the author.
     """
+    return await sharding.run(
+        db,
+        sharding.shard_of_post(post_id),
+        _updatePost,
+        post_id,
+        postData,
+        current_user,
+    )
+
+
+def _updatePost(
+    db: Session, post_id: int, postData: postMetadata, current_user: Principal
+):
     post = db.query(Post).filter(Post.id == post_id).first()
 
     if not post:
@@ -95,10 +241,15 @@ def updatePost(
             detail="You are not authorised to delete this post",
         )
 
+    search.unindex_post(db, post_id)
     post.title = postData.title  # type:ignore
-    post.content = postData.conten  # type:ignore
+    post.content = postData.content  # type:ignore
+    db.flush()
+    search.index_posts(db, [post_id])
+    conditional.touch(db, current_user.id)
 
     db.commit()
+    feedcache.invalidate(current_user.id)
     db.refresh(post)
 
     return post
@@ -109,18 +260,19 @@ def updatePost(
     summary="Deletes a post",
     description="Deletes a post for the current user",
 )
-def deletePost(
+@query_budget(8)
+async def deletePost(
     post_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: SessionRunner = Depends(get_db),
+    current_user: Principal = Depends(get_current_principal),
 ):
     """
     Deletes a post owned by the current user.
 
     Args:
         post_id (int): ID of the post to delete.
-        db (Session): SQLAlchemy session.
-        current_user (User): Authenticated user.
+        db (SessionRunner): Database session.
+        current_user (Principal): Authenticated user.
 
     Returns:
         str: Deletion confirmation message.
@@ -130,6 +282,12 @@ def deletePost(
             - 404 if post not found.
             - 403 if the user is not the author.
     """
+    return await sharding.run(
+        db, sharding.shard_of_post(post_id), _deletePost, post_id, current_user
+    )
+
+
+def _deletePost(db: Session, post_id: int, current_user: Principal):
     post = db.query(Post).filter(Post.id == post_id).first()
 
     if not post:
@@ -143,8 +301,14 @@ def deletePost(
             detail="You are not authorised to delete this post",
         )
 
+    timeline.remove_post(db, post_id)
+    search.unindex_post(db, post_id)
+    counters.adjust_posts(db, current_user.id, -1)  # type:ignore
+    conditional.touch(db, current_user.id)
     db.delete(post)
     db.commit()
+    feedcache.invalidate(current_user.id)
+    trending.discard(post_id)
 
     return "Post deleted successfully"
 
@@ -153,87 +317,253 @@ def deletePost(
     "/{post_id}/like",
     summary="Likes a post",
 )
-def likePost(
+@query_budget(6)
+async def likePost(
     post_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_principal),
+    db: SessionRunner = Depends(get_db),
 ):
     """
     Allows the current user to like a post.
 
+    With `WRITE_QUEUE` enabled, the like is committed in a batch with
+    concurrent likes and follows (see `writequeue.py`); the response is sent
+    once that batch is committed.
+
     Args:
         post_id (int): ID of the post to like.
-        current_user (User): Authenticated user.
-        db (Session): SQLAlchemy session.
+        current_user (Principal): Authenticated user.
+        db (SessionRunner): Database session.
 
     Returns:
-        dict: Success message.
+        dict: Success message and the updated like count of the post.
 
     Raises:
         HTTPException:
-            - 400 if post/user not found or already liked.
+            - 400 if the post is not found or already liked.
+            - 503 if too many queued writes are waiting.
     """
-    user = db.query(User).filter(User.id == current_user.id).first()
-    post = db.query(Post).filter(Post.id == post_id).first()
+    if not config.WRITE_QUEUE:
+        return await sharding.run(
+            db, sharding.shard_of_post(post_id), _likePost, post_id, current_user
+        )
 
-    if not user or not post:
+    post = await sharding.run(db, sharding.shard_of_post(post_id), _likedPost, post_id)
+    outcome = await writequeue.submit("like", current_user.id, post_id, True)
+
+    if not outcome.changed:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="User or post not found",
+            detail="You have already liked this post",
         )
 
-    if post in user.likedPosts:
+    return {"message": f"You have liked {post.title}", **outcome.counts}
+
+
+def _likePost(db: Session, post_id: int, current_user: Principal):
+    post = _likedPost(db, post_id)
+
+    if not relations.add_like(db, current_user.id, post_id):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="You have already liked this post",
         )
 
-    user.likedPosts.append(post)
     db.commit()
+    feedcache.invalidate(post.author)
+    trending.like(post_id)
 
-    return {"message": "You have liked {post.title}"}
+    return {
+        "message": f"You have liked {post.title}",
+        "like_count": _likeCount(db, post_id),
+    }
 
 
 @router.delete(
     "/{post_id}/like",
     summary="Unlikes a post",
 )
-def unlikePost(
+@query_budget(6)
+async def unlikePost(
     post_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_principal),
+    db: SessionRunner = Depends(get_db),
 ):
     """
     Allows the current user to unlike a previously liked post.
 
+    With `WRITE_QUEUE` enabled, the unlike goes through the write queue like
+    `likePost`.
+
     Args:
         post_id (int): ID of the post to unlike.
-        current_user (User): Authenticated user.
-        db (Session): SQLAlchemy session.
+        current_user (Principal): Authenticated user.
+        db (SessionRunner): Database session.
 
     Returns:
-        dict: Success message.
+        dict: Success message and the updated like count of the post.
 
     Raises:
         HTTPException:
-            - 400 if post/user not found or not liked yet.
+            - 400 if the post is not found or not liked yet.
+            - 503 if too many queued writes are waiting.
     """
-    user = db.query(User).filter(User.id == current_user.id).first()
-    post = db.query(Post).filter(Post.id == post_id).first()
+    if not config.WRITE_QUEUE:
+        return await sharding.run(
+            db, sharding.shard_of_post(post_id), _unlikePost, post_id, current_user
+        )
+
+    post = await sharding.run(db, sharding.shard_of_post(post_id), _likedPost, post_id)
+    outcome = await writequeue.submit("like", current_user.id, post_id, False)
 
-    if not user or not post:
+    if not outcome.changed:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="User or post not found",
+            detail="You have to like the post to unlike a post",
         )
 
-    if post not in user.likedPosts:
+    return {"message": f"You have unliked {post.title}", **outcome.counts}
+
+
+def _unlikePost(db: Session, post_id: int, current_user: Principal):
+    post = _likedPost(db, post_id)
+
+    if not relations.remove_like(db, current_user.id, post_id):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="You have to like the post to unlike a post",
         )
 
-    user.likedPosts.remove(post)
     db.commit()
+    feedcache.invalidate(post.author)
+    trending.unlike(post_id)
+
+    return {
+        "message": f"You have unliked {post.title}",
+        "like_count": _likeCount(db, post_id),
+    }
+
+
+@router.get(
+    "/likes",
+    summary="Fetches the like state of several posts",
+    response_model=likeStates,
+)
+@query_budget(2)
+async def getLikeStates(
+    ids: List[int] = Query(..., min_length=1, max_length=MAX_PAGE_SIZE),
+    current_user: Principal = Depends(get_current_principal),
+    db: SessionRunner = Depends(get_read_db),
+):
+    """
+    Reports, for a batch of posts, whether the current user liked each one.
+
+    Meant for rendering a page of posts: the whole batch is resolved with a
+    single query, whatever its size (one per shard, run concurrently).
+
+    Args:
+        ids (List[int]): IDs of the posts, passed as `?ids=1&ids=2...`.
+        current_user (Principal): Authenticated user.
+        db (SessionRunner): Database session.
+
+    Returns:
+        likeStates: Like state and like count of each existing post, in request
+        order. Unknown ids are left out.
+    """
+    groups = sharding.group(dict.fromkeys(ids), sharding.shard_of_post)
+    states = {}
+    for part in await sharding.run_grouped(db, _likeStates, groups, current_user.id):
+        states.update(
+            (id, {"post_id": id, "liked": liked, "like_count": count})
+            for id, count, liked in part
+        )
+
+    return projections.json_response(
+        {"posts": [states[id] for id in dict.fromkeys(ids) if id in states]}
+    )
+
+
+def _likeStates(db: Session, ids: list, user_id: int) -> list:
+    return relations.like_states(db, user_id, ids)
+
+
+@router.get(
+    "/search",
+    summary="Searches posts",
+    description="Full-text search over the title and content of posts",
+    response_model=postPage,
+)
+@query_budget(1)
+async def searchPosts(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    columns: tuple = Depends(projections.post_projection),
+    db: SessionRunner = Depends(get_read_db),
+):
+    """
+    Finds the posts containing every word of `q`, most relevant first.
+
+    Words match whole tokens, case-insensitively; end a word with `*` to
+    match it as a prefix. Relevance is the bm25 score over titles and contents.
+
+    With shards, every shard is searched concurrently and the pages are
+    merged on (rank, id). bm25 weighs terms by their frequency in the shard
+    rather than in all posts, so ranks can differ slightly from a single file.
+
+    Args:
+        q (str): Words to search for.
+        limit (int): Maximum number of posts to return.
+        cursor (Optional[str]): Opaque cursor returned as `next_cursor` by the previous page.
+        columns (tuple): Columns to return, from the `fields` and `view` parameters.
+        db (SessionRunner): Database session.
+
+    Returns:
+        postPage: The page of matching posts and the cursor of the next page.
+
+    Raises:
+        HTTPException:
+            - 400 if `q` contains no searchable word, the cursor is malformed
+              or a field is unknown.
+    """
+    match, after = _searchQuery(q, cursor)
+    pages = await sharding.run_all(db, search.search, match, limit + 1, after, columns)
+
+    rows = sorted(
+        (row for page in pages for row in page), key=lambda row: (row.rank, row.id)
+    )[: limit + 1]
+    page, next_cursor = paginate(
+        rows, limit, lambda row: {"rank": row.rank, "id": row.id}
+    )
+
+    return projections.json_response(
+        projections.post_page(page, next_cursor, projections.field_names(columns))
+    )
+
+
+def _searchQuery(q: str, cursor: Optional[str]) -> tuple:
+    match = search.to_match_query(q)
+
+    if match is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="The query contains no searchable word",
+        )
+
+    key = decode_cursor(cursor, "id")
+    if key and not _is_rank(key.get("rank")):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+        )
+    after = (key["rank"], key["id"]) if key else None
+
+    return match, after
+
 
-    return {"message": f"You have unliked {post.title}"}
+def _is_rank(value) -> bool:
+    # JSON decodes NaN and Infinity, and bool is an int subclass
+    return (
+        isinstance(value, (int, float))
+        and not isinstance(value, bool)
+        and math.isfinite(value)
+    )
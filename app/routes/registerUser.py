@@ -7,25 +7,28 @@ Routes:
 - POST /users — Register a new user
 
 Details:
-- Uses bcrypt for password hashing.
+- Uses bcrypt for password hashing, in a bounded process pool (see `hashing.py`).
 - Ensures unique usernames before creating a user.
+- Refuses the names of the fixed `/feed` paths (see `feed.RESERVED_USERNAMES`).
 """
 
 from fastapi import APIRouter, Depends, HTTPException, status
-from passlib.context import CryptContext
 from sqlalchemy.orm import Session
 
-from ..database import get_db
+from .. import hashing
+from ..admission import cost_class
+from ..database import SessionRunner, get_db
 from ..models import User
+from ..queryguard import query_budget
+from ..sampler import sampler
 from ..schemas import registrationResponse, userMetadata
+from .feed import RESERVED_USERNAMES
 
 router = APIRouter(
     prefix="/users",
     tags=["Users"],
 )
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 
 @router.post(
     "",
@@ -34,26 +37,38 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
     description="Creates a User in the datase with necessary hashing",
     response_model=registrationResponse,
 )
-def createUser(
+@query_budget(3)
+@cost_class("expensive")
+async def createUser(
     user: userMetadata,
-    db: Session = Depends(get_db),
+    db: SessionRunner = Depends(get_db),
 ):
     """
     Registers a new user in the system.
 
     Args:
         user (userMetadata): Pydantic model containing username, email, gender, and password.
-        db (Session): SQLAlchemy database session.
+        db (SessionRunner): Database session.
 
     Returns:
         registrationResponse: Contains the registered user's public information.
 
     Raises:
         HTTPException:
-            - 400 if a user with the given username already exists.
+            - 400 if a user with the given username already exists, or
+              the username is reserved.
+            - 503 if the password hashing pool is saturated.
     """
-    existingUsers = (
-        db.query(User.username).filter(User.username == user.username).first()
+    if user.username in RESERVED_USERNAMES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Username is reserved",
+        )
+
+    existingUsers = await db.run_sync(
+        lambda session: session.query(User.username)
+        .filter(User.username == user.username)
+        .first()
     )
     if existingUsers:
         raise HTTPException(
@@ -61,11 +76,19 @@ def createUser(
             detail="User already exists",
         )
 
+    password = await hashing.hash_password(user.password)
+    new_user = await db.run_sync(_createUser, user, password)
+    sampler.add(new_user.id)  # type:ignore
+
+    return new_user
+
+
+def _createUser(db: Session, user: userMetadata, password: str):
     new_user = User(
         username=user.username,
         email=user.email,
         gender=user.gender,
-        password=pwd_context.hash(user.password),
+        password=password,
     )
     db.add(new_user)
     db.commit()
@@ -0,0 +1,171 @@
+"""
+sampler.py
+
+This module picks random users for the discovery feed in roughly constant time.
+
+`ORDER BY random()` makes SQLite scan and sort the whole `Users` table on
+every call. Instead, the sampler keeps a pool of candidate user ids that is
+refreshed periodically by id-range probing: random ids between the smallest
+and largest user id are drawn and resolved in one primary-key lookup
+(`WHERE id IN (...)`), repeating for ids that fall into gaps. Requests then
+draw from the pool in memory and load only the chosen rows by primary key.
+
+Functionalities:
+- Maintain a periodically refreshed candidate pool of user ids.
+- Sample a configurable number of users from it.
+- Optionally exclude a user and everyone that user already follows.
+"""
+
+import random
+import threading
+import time
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from . import relations
+from .models import User
+from .projections import USER_SUMMARY_COLUMNS
+
+# Number of candidate ids kept in the pool between refreshes
+POOL_SIZE = 512
+
+# Seconds after which the pool is rebuilt to pick up new users and rotate candidates
+REFRESH_INTERVAL = 30.0
+
+# Probe batches per refresh; more than one is only needed when ids are sparse
+PROBE_ROUNDS = 4
+
+# Upper bound on the number of users a single request may ask for
+MAX_SAMPLE = 50
+
+
+class UserSampler:
+    """
+    Samples random users from a periodically refreshed pool of candidate ids.
+
+    Attributes:
+        pool_size (int): Number of candidate ids kept in the pool.
+        refresh_interval (float): Pool lifetime in seconds.
+    """
+
+    def __init__(
+        self, pool_size: int = POOL_SIZE, refresh_interval: float = REFRESH_INTERVAL
+    ):
+        self.pool_size = pool_size
+        self.refresh_interval = refresh_interval
+        self._pool: list[int] = []
+        self._refreshed_at = float("-inf")
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        """
+        Forces the pool to be rebuilt on the next sample.
+        """
+        self._refreshed_at = float("-inf")
+
+    def add(self, user_id: int):
+        """
+        Offers a newly registered user to the pool without waiting for a refresh.
+
+        The user is only added while the pool is not full, which keeps small
+        deployments' discovery feed current.
+
+        Args:
+            user_id (int): ID of the new user.
+        """
+        if len(self._pool) < self.pool_size:
+            self._pool = self._pool + [user_id]
+
+    def _refresh(self, db: Session):
+        """
+        Rebuilds the candidate pool by probing random points of the id range.
+
+        Each probe round is a single indexed lookup, so a refresh costs a few
+        queries whatever the size of the table.
+
+        Args:
+            db (Session): SQLAlchemy session.
+        """
+        # Separate queries: SQLite only resolves a lone min()/max() from the index
+        low = db.scalar(select(func.min(User.id)))
+        high = db.scalar(select(func.max(User.id)))
+
+        if low is None:
+            pool = []
+        elif high - low < self.pool_size:
+            # Small tables are cheaper to read whole than to probe
+            pool = list(db.scalars(select(User.id)))
+        else:
+            found: set[int] = set()
+            for _ in range(PROBE_ROUNDS):
+                wanted = self.pool_size - len(found)
+                if wanted <= 0:
+                    break
+                points = random.sample(
+                    range(low, high + 1), min(wanted * 2, high - low + 1)
+                )
+                found.update(db.scalars(select(User.id).where(User.id.in_(points))))
+            pool = list(found)[: self.pool_size]
+
+        self._pool = pool
+        self._refreshed_at = time.monotonic()
+
+    def candidates(self, db: Session) -> list[int]:
+        """
+        Returns the current candidate pool, refreshing it if it has expired.
+
+        Args:
+            db (Session): SQLAlchemy session.
+
+        Returns:
+            list[int]: Candidate user ids.
+        """
+        # Never wait for the lock: under DATABASE_MODE=async every request
+        # shares one thread, so a blocked waiter would stall the refresh it
+        # waits for. Concurrent callers keep serving the previous pool instead.
+        if time.monotonic() - self._refreshed_at > self.refresh_interval:
+            if self._lock.acquire(blocking=False):
+                try:
+                    self._refresh(db)
+                finally:
+                    self._lock.release()
+        return self._pool
+
+    def sample(self, db: Session, count: int, exclude_for: int | None = None) -> list:
+        """
+        Picks up to `count` distinct random users.
+
+        Args:
+            db (Session): SQLAlchemy session.
+            count (int): Number of users wanted.
+            exclude_for (int | None): If given, this user and the users they
+                already follow are left out of the sample.
+
+        Returns:
+            List[Row]: The sampled users projected with
+            `projections.USER_SUMMARY_COLUMNS`, fewer if not enough are available.
+        """
+        pool = self.candidates(db)
+        # Over-draw when excluding, so filtering still leaves enough users
+        draw = count * 3 if exclude_for is not None else count
+        picked = random.sample(pool, min(draw, len(pool)))
+
+        if exclude_for is not None:
+            followed = relations.following_among(db, exclude_for, picked)
+            picked = [id for id in picked if id != exclude_for and id not in followed]
+
+        picked = picked[:count]
+        if not picked:
+            return []
+
+        users = {
+            user.id: user
+            for user in db.execute(
+                select(*USER_SUMMARY_COLUMNS).where(User.id.in_(picked))
+            )
+        }
+        return [users[id] for id in picked if id in users]
+
+
+sampler = UserSampler()
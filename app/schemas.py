@@ -6,7 +6,15 @@ in the API. These models enforce data structure and type validation
 for operations related to users, authentication, and posts.
 """
 
-from pydantic import BaseModel, EmailStr
+from typing import List, Literal, Optional
+
+from pydantic import AliasChoices, BaseModel, EmailStr, Field
+
+# Maximum number of user ids accepted by one bulk follow request
+MAX_BULK_FOLLOW = 500
+
+# Maximum number of posts accepted by one bulk create request
+MAX_BULK_POSTS = 1000
 
 
 class userMetadata(BaseModel):
@@ -36,16 +44,46 @@ class postMetadata(BaseModel):
         orm_mode = True
 
 
+class bulkPostRequest(BaseModel):
+    posts: List[postMetadata] = Field(min_length=1, max_length=MAX_BULK_POSTS)
+
+
 class postResponse(BaseModel):
     id: int
     author: int
     title: str
     content: str
+    like_count: int = Field(
+        default=0, validation_alias=AliasChoices("like_count", "likesCount")
+    )
 
     class Config:
         orm_mode = True
 
 
+class postPage(BaseModel):
+    posts: List[postResponse]
+    next_cursor: Optional[str] = None
+
+
+class trendingPost(postResponse):
+    score: float
+
+
+class trendingPage(BaseModel):
+    posts: List[trendingPost]
+
+
+class likeState(BaseModel):
+    post_id: int
+    liked: bool
+    like_count: int
+
+
+class likeStates(BaseModel):
+    posts: List[likeState]
+
+
 class userSummary(BaseModel):
     id: int
     username: str
@@ -54,3 +92,30 @@ class userSummary(BaseModel):
 
     class Config:
         orm_mode = True
+
+
+class followSuggestion(userSummary):
+    mutual_count: int
+
+
+class bulkFollowRequest(BaseModel):
+    action: Literal["follow", "unfollow"]
+    user_ids: List[int] = Field(min_length=1, max_length=MAX_BULK_FOLLOW)
+
+
+class followResult(BaseModel):
+    user_id: int
+    status: Literal[
+        "followed",
+        "unfollowed",
+        "already_following",
+        "not_following",
+        "not_found",
+        "self",
+    ]
+
+
+class bulkFollowResponse(BaseModel):
+    results: List[followResult]
+    following_count: int
+    followers_count: int
@@ -0,0 +1,196 @@
+"""
+search.py
+
+This module maintains and queries the full-text index of posts.
+
+The index is an SQLite FTS5 table, `posts_fts`, over the title and content of
+`Posts`. It is an external-content table: it stores only the inverted index
+and reads the text back from `Posts`, so posts are not stored twice. Like the
+home timeline, the index is updated in the same transaction as the post:
+
+- `index_posts` after posts are inserted,
+- `unindex_post` before a post is updated or deleted (FTS5 needs the old
+  text to remove its terms), followed by `index_posts` after an update.
+
+Results are ranked with bm25 and paginated on (rank, id).
+
+The index is created with the other tables; on a database whose `Posts`
+table already existed, it is created and filled at startup. `rebuild`
+repopulates it from `Posts`, after a bulk load or if it was edited by hand:
+
+    python -m app.manage rebuild-search
+"""
+
+import re
+
+from sqlalchemy import (
+    DDL,
+    and_,
+    column,
+    event,
+    func,
+    inspect,
+    literal,
+    or_,
+    select,
+    table,
+)
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from .database import Base
+from .models import Post
+from .projections import POST_COLUMNS
+
+# The column named after the table is FTS5's hidden command column
+posts_fts = table(
+    "posts_fts",
+    column("rowid"),
+    column("title"),
+    column("content"),
+    column("posts_fts"),
+)
+
+_rank = func.bm25(posts_fts.c.posts_fts)
+
+
+_CREATE_INDEX = DDL(
+    "CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts "
+    "USING fts5(title, content, content='Posts', content_rowid='id')"
+)
+
+
+def create_index(connection: Connection):
+    """
+    Creates the index if it does not exist yet. It is left empty: fill it
+    with `rebuild`.
+
+    Args:
+        connection (Connection): Connection to a database holding `Posts`.
+    """
+    if connection.dialect.name == "sqlite":
+        connection.execute(_CREATE_INDEX)
+
+
+@event.listens_for(Base.metadata, "after_create")
+def _create_index(metadata, connection, tables=(), **kwargs):
+    # `tables` lists only the tables just created, so a database made before
+    # search existed would never get the index. Not in the directory of
+    # sharded posts, which holds no `Posts`.
+    if Post.__table__ in tables:
+        create_index(connection)
+        return
+
+    inspector = inspect(connection)
+    if inspector.has_table(Post.__tablename__) and not inspector.has_table(
+        posts_fts.name
+    ):
+        # Indexes the posts written before search existed
+        create_index(connection)
+        connection.execute(posts_fts.insert().values(posts_fts="rebuild"))
+
+
+# Words of a query, with an optional trailing * for prefix matches
+_TERM = re.compile(r"\w+\*?")
+
+
+def to_match_query(query: str) -> str | None:
+    """
+    Turns free text into an FTS5 query matching posts that contain every word.
+
+    Each word becomes a quoted phrase, so operators and punctuation typed by
+    users are never interpreted as FTS5 syntax. A trailing `*` is kept as a
+    prefix match.
+
+    Args:
+        query (str): Text typed by the user.
+
+    Returns:
+        str | None: The FTS5 query, or None if the text has no searchable word.
+    """
+    terms = []
+    for term in _TERM.findall(query):
+        prefix = term.endswith("*")
+        terms.append(f'"{term.rstrip("*")}"' + ("*" if prefix else ""))
+
+    return " ".join(terms) or None
+
+
+def index_posts(db: Session, post_ids: list):
+    """
+    Adds posts to the index. Call after the posts are flushed.
+
+    Args:
+        db (Session): SQLAlchemy session.
+        post_ids (list[int]): IDs of the posts to index.
+    """
+    db.execute(
+        posts_fts.insert().from_select(
+            ["rowid", "title", "content"],
+            select(Post.id, Post.title, Post.content).where(Post.id.in_(post_ids)),
+        )
+    )
+
+
+def unindex_post(db: Session, post_id: int):
+    """
+    Removes a post from the index. Call before the post row is changed or deleted.
+
+    Args:
+        db (Session): SQLAlchemy session.
+        post_id (int): ID of the post.
+    """
+    db.execute(
+        posts_fts.insert().from_select(
+            ["posts_fts", "rowid", "title", "content"],
+            select(literal("delete"), Post.id, Post.title, Post.content).where(
+                Post.id == post_id
+            ),
+        )
+    )
+
+
+def rebuild(db: Session):
+    """
+    Rebuilds the whole index from the `Posts` table. The caller owns the commit.
+
+    Args:
+        db (Session): SQLAlchemy session.
+    """
+    create_index(db.connection())
+    db.execute(posts_fts.insert().values(posts_fts="rebuild"))
+
+
+def search(
+    db: Session,
+    match: str,
+    limit: int,
+    after: tuple[float, int] | None = None,
+    columns: tuple = POST_COLUMNS,
+) -> list:
+    """
+    Returns the best matching posts, most relevant first.
+
+    Args:
+        db (Session): SQLAlchemy session.
+        match (str): FTS5 query, see `to_match_query`.
+        limit (int): Maximum number of posts to return.
+        after (tuple[float, int] | None): (rank, id) of the last post of the
+            previous page.
+        columns (tuple): Columns of `Posts` to select (see `projections.py`).
+
+    Returns:
+        list[Row]: Posts projected on `columns`, followed by their bm25
+        `rank` (lower is better).
+    """
+    query = (
+        select(*columns, _rank.label("rank"))
+        .select_from(Post)
+        .join(posts_fts, posts_fts.c.rowid == Post.id)
+        .where(posts_fts.c.posts_fts.op("MATCH")(match))
+    )
+    if after is not None:
+        rank, id = after
+        query = query.where(or_(_rank > rank, and_(_rank == rank, Post.id > id)))
+
+    return db.execute(query.order_by(_rank, Post.id).limit(limit)).all()
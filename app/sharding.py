@@ -0,0 +1,592 @@
+"""
+sharding.py
+
+This module partitions posts and likes by author across several SQLite files.
+
+A SQLite file has a single write lock, so one file caps the write throughput
+of the whole app. With `SHARDS=N`:
+- the `DATABASE_URL` database becomes the directory: users, follows and home
+  timelines;
+- each of the N shard files (`SHARD_URL`) holds the posts of its authors, the
+  likes of those posts, their search index and the authors' listing versions.
+
+Authors are mapped to `BUCKETS` logical buckets (`author % BUCKETS`) and
+buckets to shards (`bucket % SHARDS`). The bucket of a post is also stored in
+the low bits of its id, so a route taking a post id finds the shard without
+any lookup. Post ids are `(sequence << BUCKET_BITS) | bucket`, where a shard
+hands out sequences above both its largest id and the current time in
+centiseconds (shifted by `SEQUENCE_BITS`): ids are unique across shards and
+still sort by creation time, which keyset pagination and the home timeline
+rely on. They stay below 2**53, exact in JavaScript, until 2035.
+
+The directory is attached to every shard connection as `directory`. SQLite
+resolves unqualified table names in the main database first, then in the
+attached ones, so a shard session sees its own posts together with the
+directory's users, follows and timelines, and the helpers of `timeline.py`,
+`counters.py`, `relations.py` and `search.py` work unchanged on it. A
+transaction writing both files is atomic as a whole with the rollback
+journal, and per file in WAL mode. Likes only write to their shard; creating
+a post also writes the directory (counters and timelines).
+
+Routes run their sync helpers on one shard with `run`, on every shard
+concurrently with `run_all`, or on the shards of a set of ids with
+`run_grouped`. Without shards all three use the request's own session, so the
+single-file layout behaves exactly as before.
+
+Change the number of shards with the app stopped, and a backup at hand:
+
+    python -m app.manage reshard 4
+
+then restart it with `SHARDS=4`. Going from a single file to shards renumbers
+the posts into the id scheme above; likes and timelines follow.
+"""
+
+import asyncio
+import os
+import sys
+import time
+from collections import Counter, defaultdict
+from typing import Callable, Iterable
+
+from sqlalchemy import (
+    bindparam,
+    create_engine,
+    func,
+    insert,
+    select,
+    text,
+    true,
+    update,
+)
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+
+from . import config, counters, migrations, queryguard, search
+from .database import (
+    AsyncSessionLocal,
+    Base,
+    SessionLocal,
+    SessionRunner,
+    engine,
+    make_engine,
+    open_session,
+)
+from .models import Post, User, follow, likes, listing_versions, timeline
+from .timeline import rebuild as rebuild_timelines
+
+BUCKET_BITS = 8
+BUCKETS = 1 << BUCKET_BITS
+SEQUENCE_BITS = 10
+
+# 2025-01-01 UTC, in centiseconds
+ID_EPOCH = 173_568_960_000
+
+DIRECTORY_TABLES = (User.__table__, follow, timeline)
+SHARD_TABLES = (Post.__table__, likes, listing_versions)
+
+ENABLED = config.SHARDS > 0
+
+if not 0 <= config.SHARDS <= BUCKETS:
+    raise ValueError(f"SHARDS must be between 0 and {BUCKETS}, not {config.SHARDS}")
+
+
+def shard_url(shard: int) -> str:
+    """
+    Returns the database URL of a shard.
+    """
+    return config.SHARD_URL.format(shard=shard)
+
+
+def _directory_path() -> str:
+    url = engine.url
+    if url.get_backend_name() != "sqlite" or url.database in (None, "", ":memory:"):
+        raise ValueError("Sharding requires DATABASE_URL to be an SQLite file")
+    return url.database  # type:ignore
+
+
+SessionFactories = []
+AsyncSessionFactories = []
+
+if ENABLED:
+    for shard in range(config.SHARDS):
+        SessionFactories.append(
+            sessionmaker(
+                autocommit=False,
+                autoflush=False,
+                bind=make_engine(
+                    shard_url(shard), config.DB_POOL_SIZE, attach=_directory_path()
+                ),
+            )
+        )
+        AsyncSessionFactories.append(
+            async_sessionmaker(
+                make_engine(
+                    shard_url(shard).replace("sqlite://", "sqlite+aiosqlite://", 1),
+                    config.DB_POOL_SIZE,
+                    is_async=True,
+                    attach=_directory_path(),
+                ),
+                autoflush=False,
+                expire_on_commit=False,
+            )
+            if config.DATABASE_MODE == "async"
+            else None
+        )
+
+
+def shard_of_author(author_id: int) -> int:
+    """
+    Returns the shard holding the posts of an author (0 without shards).
+    """
+    return author_id % BUCKETS % max(config.SHARDS, 1)
+
+
+def shard_of_post(post_id: int) -> int:
+    """
+    Returns the shard holding a post, from the bucket stored in its id (0 without shards).
+    """
+    return (post_id & (BUCKETS - 1)) % max(config.SHARDS, 1)
+
+
+def group(ids: Iterable[int], shard_of: Callable[[int], int]) -> dict:
+    """
+    Groups ids by shard, keeping their order within each group.
+
+    Args:
+        ids (Iterable[int]): Post or author ids.
+        shard_of (Callable[[int], int]): `shard_of_post` or `shard_of_author`.
+
+    Returns:
+        dict[int, list[int]]: The ids of each shard.
+    """
+    groups = defaultdict(list)
+    for id in ids:
+        groups[shard_of(id)].append(id)
+    return dict(groups)
+
+
+def authors_of(shard: int, column):
+    """
+    Returns a SQL condition selecting the authors stored on a shard.
+
+    Args:
+        shard (int): Shard number.
+        column (ColumnElement): Column holding author ids.
+    """
+    if not ENABLED:
+        return true()
+    return column % BUCKETS % config.SHARDS == shard
+
+
+def new_post_id(author_id: int):
+    """
+    Returns the id to insert for a new post of an author.
+
+    The id is computed by SQLite in the INSERT itself, from the largest id of
+    the shard, so concurrent writers (even in other processes) never pick the
+    same one. Within a transaction, each inserted row sees the previous ones,
+    which makes the expression usable with `executemany` too.
+
+    Args:
+        author_id (int): Author of the post.
+
+    Returns:
+        ColumnElement | None: SQL expression of the id, or None without shards
+        (SQLite assigns it).
+    """
+    if not ENABLED:
+        return None
+
+    floor = (int(time.time() * 100) - ID_EPOCH) << SEQUENCE_BITS
+    after_last = select(
+        (func.coalesce(func.max(Post.id), 0).op(">>")(BUCKET_BITS)) + 1
+    ).scalar_subquery()
+    return (
+        func.max(floor, after_last).op("<<")(BUCKET_BITS).op("|")(author_id % BUCKETS)
+    )
+
+
+def session(shard: int):
+    """
+    Opens a session on a shard, as an `async with` block.
+
+    Args:
+        shard (int): Shard number; without shards, the directory session is opened.
+
+    Returns:
+        AsyncContextManager[SessionRunner]: The session, closed on exit.
+    """
+    if not ENABLED:
+        return open_session(AsyncSessionLocal, SessionLocal)
+    return open_session(AsyncSessionFactories[shard], SessionFactories[shard])
+
+
+async def _on_shard(shard: int, fn, args: tuple, counted: bool = True):
+    async with session(shard) as db:
+        if counted:
+            return await db.run_sync(fn, *args)
+        with queryguard.uncounted():
+            return await db.run_sync(fn, *args)
+
+
+async def run(db: SessionRunner, shard: int, fn, *args):
+    """
+    Runs `fn(session, *args)` on a shard and returns its result.
+
+    The shard session is opened and closed around the call, and `fn` owns the
+    commit, as with `db.run_sync`.
+
+    Args:
+        db (SessionRunner): Session of the request, used without shards.
+        shard (int): Shard number, see `shard_of_author` and `shard_of_post`.
+        fn (Callable): Sync helper taking a `Session` first.
+    """
+    if not ENABLED:
+        return await db.run_sync(fn, *args)
+    return await _on_shard(shard, fn, args)
+
+
+async def run_all(db: SessionRunner, fn, *args) -> list:
+    """
+    Runs `fn(session, *args)` on every shard concurrently.
+
+    Args:
+        db (SessionRunner): Session of the request, used without shards.
+        fn (Callable): Sync helper taking a `Session` first.
+
+    Returns:
+        list: The result of each shard, in shard order (one result without shards).
+    """
+    if not ENABLED:
+        return [await db.run_sync(fn, *args)]
+    return await asyncio.gather(
+        *(
+            _on_shard(shard, fn, args, counted=shard == 0)
+            for shard in range(config.SHARDS)
+        )
+    )
+
+
+async def run_grouped(db: SessionRunner, fn, groups: dict, *args) -> list:
+    """
+    Runs `fn(session, ids, *args)` on the shard of each group concurrently.
+
+    Args:
+        db (SessionRunner): Session of the request, used without shards.
+        fn (Callable): Sync helper taking a `Session` and the ids of the shard.
+        groups (dict[int, list[int]]): Ids per shard, see `group`.
+
+    Returns:
+        list: The result of each group, in the order of `groups`.
+    """
+    if not ENABLED:
+        return [await db.run_sync(fn, ids, *args) for ids in groups.values()]
+    return await asyncio.gather(
+        *(
+            _on_shard(shard, fn, (ids, *args), counted=number == 0)
+            for number, (shard, ids) in enumerate(groups.items())
+        )
+    )
+
+
+def _posts(db: Session, ids: list, columns: tuple) -> list:
+    return db.execute(select(*columns).where(Post.id.in_(ids))).all()
+
+
+async def fetch_posts(db: SessionRunner, ids: list, columns: tuple) -> list:
+    """
+    Loads posts by id from their shards, concurrently.
+
+    Args:
+        db (SessionRunner): Session of the request, used without shards.
+        ids (list[int]): Post ids; unknown ones are skipped.
+        columns (tuple): Columns to select, including `Post.id` (see `projections.py`).
+
+    Returns:
+        list[Row]: The posts, in the order of `ids`.
+    """
+    if not ids:
+        return []
+
+    rows = {}
+    for part in await run_grouped(db, _posts, group(ids, shard_of_post), columns):
+        rows.update((row.id, row) for row in part)
+    return [rows[id] for id in ids if id in rows]
+
+
+def sync_sessions() -> list:
+    """
+    Opens a blocking session per shard, for maintenance commands.
+
+    Returns:
+        list[Session]: One session per shard, or the directory session without shards.
+    """
+    if not ENABLED:
+        return [SessionLocal()]
+    return [factory() for factory in SessionFactories]
+
+
+def create_all():
+    """
+    Creates the missing tables of the directory and of every shard, adds the
+    columns and indexes missing from existing ones, and rebuilds the counters
+    and home timelines if their columns or table were just added (see
+    `migrations.py`).
+    """
+    if not ENABLED:
+        added = _create(engine, Base.metadata.sorted_tables)
+    else:
+        added = _create(engine, DIRECTORY_TABLES)
+        for shard in range(config.SHARDS):
+            added |= _create_shard(shard_url(shard))
+
+    if added & migrations.COUNTER_COLUMNS:
+        recompute_counters()
+    # Sharded layouts always had timelines, built as posts were moved to shards
+    if not ENABLED and "timeline" in added and "Users" not in added:
+        with SessionLocal() as db:
+            rebuild_timelines(db)
+            db.commit()
+
+
+def _create(bind, tables) -> set[str]:
+    with bind.begin() as connection:
+        added = migrations.add_missing(connection, tables)
+        Base.metadata.create_all(bind=connection, tables=tables)
+    return added
+
+
+def _create_shard(url: str) -> set[str]:
+    # Without the directory attached, so that its tables are not taken for the shard's
+    shard_engine = create_engine(url)
+    try:
+        return _create(shard_engine, SHARD_TABLES)
+    finally:
+        shard_engine.dispose()
+
+
+def recompute_counters():
+    """
+    Recomputes every denormalized counter: follows on the directory, posts and
+    likes on the shard of their posts.
+    """
+    db = SessionLocal()
+    try:
+        counters.recompute_follows(db)
+        db.commit()
+    finally:
+        db.close()
+
+    for shard, db in enumerate(sync_sessions()):
+        try:
+            counters.recompute_posts(db, authors_of(shard, User.id))
+            db.commit()
+        finally:
+            db.close()
+
+
+def _renumber(post_id: int, author_id: int) -> int:
+    # Id of a post of the single-file layout in the sharded layout, keeping the order
+    return (post_id << BUCKET_BITS) | (author_id % BUCKETS)
+
+
+def _copy(source, query, write: Callable, chunk_size: int):
+    # Streams the rows of `query` and hands them to `write` chunk by chunk
+    with source.connect() as connection:
+        result = connection.execution_options(yield_per=chunk_size).execute(query)
+        for rows in result.partitions():
+            write(rows)
+
+
+def reshard(target: int, chunk_size: int = 10000, out=sys.stderr) -> Counter:
+    """
+    Moves posts, likes and listing versions from the current layout to `target` shards.
+
+    The current layout is the one configured with `SHARDS`. The new shard
+    files are written next to the final ones and swapped in once complete,
+    then the directory is updated. Run it with the app stopped.
+
+    Args:
+        target (int): New number of shards, 0 for the single-file layout.
+        chunk_size (int): Rows read and written per transaction.
+        out (TextIO): Where progress lines are written.
+
+    Returns:
+        Counter: Number of posts written to each new shard.
+
+    Raises:
+        ValueError: If `target` is out of range or equal to the current layout.
+    """
+    source = config.SHARDS
+    if not 0 <= target <= BUCKETS or target == source:
+        raise ValueError(
+            f"Target must be between 0 and {BUCKETS} and differ from SHARDS={source}"
+        )
+
+    directory_path = _directory_path()
+    readers = (
+        [create_engine(shard_url(shard)) for shard in range(source)]
+        if source
+        else [engine]
+    )
+    renumber = source == 0
+
+    if target:
+        paths = [make_url(shard_url(shard)).database for shard in range(target)]
+        staged = [f"{path}.resharding" for path in paths]
+        for path in staged:
+            if os.path.exists(path):
+                os.remove(path)
+        writers = [create_engine(f"sqlite:///{path}") for path in staged]
+        for writer in writers:
+            Base.metadata.create_all(bind=writer, tables=SHARD_TABLES)
+    else:
+        Base.metadata.create_all(bind=engine)
+        writers = [engine]
+
+    def writer_of(author_id: int):
+        return writers[author_id % BUCKETS % len(writers)]
+
+    posts = Counter()
+    start = time.perf_counter()
+
+    def write_posts(rows):
+        batches = defaultdict(list)
+        for row in rows:
+            values = dict(row._mapping)
+            if renumber:
+                values["id"] = _renumber(row.id, row.author)
+            batches[writer_of(row.author)].append(values)
+        for writer, values in batches.items():
+            with writer.begin() as connection:
+                connection.execute(insert(Post), values)
+            posts[writers.index(writer)] += len(values)
+        print(
+            f"posts: {sum(posts.values())} rows "
+            f"({sum(posts.values()) / (time.perf_counter() - start):,.0f} rows/s)",
+            file=out,
+        )
+
+    def write_likes(rows):
+        batches = defaultdict(list)
+        for row in rows:
+            post_id = (
+                _renumber(row.likedPost, row.author) if renumber else row.likedPost
+            )
+            batches[writer_of(row.author)].append(
+                {
+                    "likedBy": row.likedBy,
+                    "likedPost": post_id,
+                    "createdAt": row.createdAt,
+                }
+            )
+        for writer, values in batches.items():
+            with writer.begin() as connection:
+                connection.execute(insert(likes), values)
+
+    def write_versions(rows):
+        if not target:
+            with engine.begin() as connection:
+                connection.execute(
+                    update(User)
+                    .where(User.id == bindparam("author_id"))
+                    .values(
+                        postsVersion=bindparam("version_number"),
+                        postsModified=bindparam("modified_at"),
+                    ),
+                    [
+                        {
+                            "author_id": row.author,
+                            "version_number": row.version,
+                            "modified_at": row.modified,
+                        }
+                        for row in rows
+                    ],
+                )
+            return
+        batches = defaultdict(list)
+        for row in rows:
+            batches[writer_of(row.author)].append(dict(row._mapping))
+        for writer, values in batches.items():
+            with writer.begin() as connection:
+                connection.execute(insert(listing_versions), values)
+
+    post_columns = (
+        Post.id,
+        Post.author,
+        Post.title,
+        Post.content,
+        Post.likesCount,
+        Post.createdAt,
+    )
+    for reader in readers:
+        _copy(reader, select(*post_columns), write_posts, chunk_size)
+        _copy(
+            reader,
+            select(
+                likes.c.likedBy, likes.c.likedPost, likes.c.createdAt, Post.author
+            ).join(Post, Post.id == likes.c.likedPost),
+            write_likes,
+            chunk_size,
+        )
+        versions = (
+            select(
+                User.id.label("author"),
+                User.postsVersion.label("version"),
+                User.postsModified.label("modified"),
+            ).where(User.postsVersion > 0)
+            if renumber
+            else select(listing_versions)
+        )
+        _copy(reader, versions, write_versions, chunk_size)
+
+    for writer in writers:
+        with Session(writer) as db:
+            search.rebuild(db)
+            db.commit()
+        print(f"search index of {writer.url.database} rebuilt", file=out)
+
+    for reader in readers:
+        if reader is not engine:
+            reader.dispose()
+    for writer in writers:
+        if writer is not engine:
+            writer.dispose()
+
+    if target:
+        for staged_path, path in zip(staged, paths):
+            _remove(path)
+            os.replace(staged_path, path)
+
+    with engine.begin() as connection:
+        if renumber:
+            # Through negative values, so that no intermediate id collides
+            connection.execute(
+                update(timeline).values(
+                    post=-(
+                        timeline.c.post.op("<<")(BUCKET_BITS).op("|")(
+                            timeline.c.author % BUCKETS
+                        )
+                    )
+                )
+            )
+            connection.execute(update(timeline).values(post=-timeline.c.post))
+            for table in ("posts_fts", "likes", "listing_versions", "Posts"):
+                connection.execute(text(f"DROP TABLE IF EXISTS {table}"))
+
+    for shard in range(target, source):
+        _remove(make_url(shard_url(shard)).database)
+
+    print(
+        f"{sum(posts.values())} posts moved to {target or directory_path} "
+        f"in {time.perf_counter() - start:.1f}s",
+        file=out,
+    )
+    return posts
+
+
+def _remove(path: str):
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
@@ -0,0 +1,192 @@
+"""
+timeline.py
+
+This module maintains the materialized home timeline of every user.
+
+Instead of merging the posts of every followee at read time, each post is
+written into the timeline of its author's followers when it is created
+(fan-out-on-write). Reading a home timeline is then a single indexed range
+read on the `timeline` table, independent of how many accounts a user follows.
+
+Functionalities:
+- Fan a new post, or a batch of posts, out to the timelines of the author's followers.
+- Remove a deleted post from every timeline.
+- Backfill a follower's timeline with recent posts when they follow someone.
+- Prune a followee's posts from a timeline on unfollow.
+- Read a page of a user's home timeline.
+- Rebuild every timeline from the follow and post tables after a bulk load.
+"""
+
+from sqlalchemy import delete, insert, literal, select
+from sqlalchemy.orm import Session
+
+from .models import Post, follow, timeline
+from .projections import POST_COLUMNS
+
+# Number of the followee's most recent posts copied into a timeline on follow
+BACKFILL_LIMIT = 200
+
+
+def fan_out_post(db: Session, post: Post):
+    """
+    Writes a freshly created post into the timeline of every follower of its author.
+
+    The insert is a single `INSERT ... SELECT` over the follow table, so the cost
+    is one statement regardless of the follower count. The caller owns the commit.
+
+    Args:
+        db (Session): SQLAlchemy session.
+        post (Post): The post that was just flushed (must have an id).
+    """
+    followers = select(follow.c.follower, literal(post.id), literal(post.author)).where(
+        follow.c.followee == post.author
+    )
+
+    db.execute(insert(timeline).from_select(["owner", "post", "author"], followers))
+
+
+def fan_out_posts(db: Session, author_id: int, post_ids: list):
+    """
+    Writes a batch of freshly created posts of one author into their followers' timelines.
+
+    Like `fan_out_post`, this is a single `INSERT ... SELECT`, joining the
+    follow table with the new posts. The caller owns the commit.
+
+    Args:
+        db (Session): SQLAlchemy session.
+        author_id (int): Author of every post in the batch.
+        post_ids (list[int]): IDs of the flushed posts.
+    """
+    entries = (
+        select(follow.c.follower, Post.id, Post.author)
+        .join(Post, Post.author == follow.c.followee)
+        .where(follow.c.followee == author_id, Post.id.in_(post_ids))
+    )
+
+    db.execute(insert(timeline).from_select(["owner", "post", "author"], entries))
+
+
+def remove_post(db: Session, post_id: int):
+    """
+    Removes a post from every timeline it was fanned out to.
+
+    Args:
+        db (Session): SQLAlchemy session.
+        post_id (int): ID of the post being deleted.
+    """
+    db.execute(delete(timeline).where(timeline.c.post == post_id))
+
+
+def backfill(db: Session, follower_id: int, followee_id: int):
+    """
+    Copies the followee's most recent posts into the follower's timeline.
+
+    Args:
+        db (Session): SQLAlchemy session.
+        follower_id (int): ID of the user who started following.
+        followee_id (int): ID of the user being followed.
+    """
+    recent = (
+        select(literal(follower_id), Post.id, Post.author)
+        .where(Post.author == followee_id)
+        .order_by(Post.id.desc())
+        .limit(BACKFILL_LIMIT)
+    )
+
+    db.execute(
+        insert(timeline)
+        .from_select(["owner", "post", "author"], recent)
+        .prefix_with("OR IGNORE")
+    )
+
+
+def prune(db: Session, follower_id: int, followee_id: int):
+    """
+    Removes every post of the followee from the follower's timeline.
+
+    Args:
+        db (Session): SQLAlchemy session.
+        follower_id (int): ID of the user who unfollowed.
+        followee_id (int): ID of the user being unfollowed.
+    """
+    db.execute(
+        delete(timeline).where(
+            timeline.c.owner == follower_id, timeline.c.author == followee_id
+        )
+    )
+
+
+def read_home(
+    db: Session,
+    user_id: int,
+    limit: int,
+    before: int | None = None,
+    columns: tuple = POST_COLUMNS,
+):
+    """
+    Reads a page of a user's home timeline, newest first.
+
+    Args:
+        db (Session): SQLAlchemy session.
+        user_id (int): Owner of the timeline.
+        limit (int): Maximum number of posts to return.
+        before (int | None): Only return posts with an id lower than this one.
+        columns (tuple): Columns of `Posts` to select (see `projections.py`).
+
+    Returns:
+        List[Row]: Posts in the timeline projected on `columns`, ordered by
+        descending id.
+    """
+    query = (
+        select(*columns)
+        .select_from(Post)
+        .join(timeline, timeline.c.post == Post.id)
+        .where(timeline.c.owner == user_id)
+    )
+    if before is not None:
+        query = query.where(timeline.c.post < before)
+
+    query = query.order_by(timeline.c.post.desc()).limit(limit)
+    return db.execute(query).all()
+
+
+def read_home_ids(db: Session, user_id: int, limit: int, before: int | None = None):
+    """
+    Reads the post ids of a page of a user's home timeline, newest first.
+
+    Used when posts are sharded: the timeline lives in the directory, and the
+    posts are then fetched from their shards (see `sharding.fetch_posts`).
+
+    Args:
+        db (Session): SQLAlchemy session.
+        user_id (int): Owner of the timeline.
+        limit (int): Maximum number of ids to return.
+        before (int | None): Only return ids lower than this one.
+
+    Returns:
+        list[int]: Post ids in descending order.
+    """
+    query = select(timeline.c.post).where(timeline.c.owner == user_id)
+    if before is not None:
+        query = query.where(timeline.c.post < before)
+
+    return db.scalars(query.order_by(timeline.c.post.desc()).limit(limit)).all()
+
+
+def rebuild(db: Session):
+    """
+    Rebuilds every home timeline from the follow and post tables.
+
+    Used after rows were loaded without going through the API (see
+    `app/loader.py`). Every post of every followee is included, as if each
+    follow had existed before the posts were written. The caller owns the commit.
+
+    Args:
+        db (Session): SQLAlchemy session.
+    """
+    entries = select(follow.c.follower, Post.id, Post.author).join(
+        Post, Post.author == follow.c.followee
+    )
+
+    db.execute(delete(timeline))
+    db.execute(insert(timeline).from_select(["owner", "post", "author"], entries))
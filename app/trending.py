@@ -0,0 +1,365 @@
+"""
+trending.py
+
+This module ranks posts by recent likes, for `GET /feed/trending`.
+
+Aggregating the `likes` table on every request would scan every recent like.
+Instead, each post has a score kept in memory and updated by the like and
+unlike routes after they commit: every like adds 1 to the score of its post,
+and that contribution halves every `HALF_LIFE` seconds. A post liked a lot an
+hour ago and a post liked a little just now can both trend.
+
+Decaying every score continuously would mean touching all of them on every
+tick. Scores are instead stored relative to a reference time `t0`: a like at
+time t adds `2 ** ((t - t0) / HALF_LIFE)`. All stored scores decay by the
+same factor, so their order never changes and only the scores returned are
+scaled down to the current time. `t0` moves forward at every rebuild, which
+keeps the exponents small.
+
+Only the `CAPACITY` best-scored posts are tracked: once twice as many have
+scores, the weakest are dropped, so memory stays bounded however many posts
+are liked. A dropped post that is liked again restarts from that like, and
+unlikes are removed as if the like had just happened; both drift, and so do
+likes committed by other processes. Every `REBUILD_INTERVAL` seconds the
+scores are therefore recomputed from the likes of the last `WINDOW` seconds
+(older likes weigh less than 1/256), on every shard. Changes are journaled
+from the start of a rebuild; the rebuild waits for the next whole second,
+reads the likes created before it and replays the journaled changes from it
+on, so a like committed meanwhile is counted once. The first rebuild
+runs at application startup, before requests are served (`startup`); later
+ones run in a background thread with their own sessions: the request that
+finds the scores expired starts it and, like every other request until it
+finishes, is served the current scores.
+
+Functionalities:
+- Add and remove the contribution of likes as they are committed.
+- Serve the top posts from memory.
+- Rebuild the scores periodically from the `likes` table.
+"""
+
+import heapq
+import logging
+import threading
+import time
+from typing import Iterable, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from . import sharding
+from .models import Post, likes
+
+# Seconds after which the contribution of a like is halved
+HALF_LIFE = 6 * 3600.0
+
+# Likes older than this are left out of rebuilds
+WINDOW = 8 * HALF_LIFE
+
+# Seconds after which the scores are rebuilt from the database
+REBUILD_INTERVAL = 600.0
+
+# Number of posts whose score is tracked between rebuilds
+CAPACITY = 1000
+
+# Upper bound on the number of posts a single request may ask for
+MAX_TRENDING = 100
+
+# Likes are grouped by post and by slot of this many seconds during rebuilds
+_SLOT = 60
+
+# Stored scores are rescaled once `t0` is this many half-lives old
+_MAX_EXPONENT = 64
+
+logger = logging.getLogger(__name__)
+
+
+class TrendingPosts:
+    """
+    Time-decayed like scores of the most liked posts.
+
+    Attributes:
+        half_life (float): Seconds after which a like counts half.
+        capacity (int): Number of posts tracked between rebuilds.
+        rebuild_interval (float): Lifetime of the scores in seconds.
+    """
+
+    def __init__(
+        self,
+        half_life: float = HALF_LIFE,
+        capacity: int = CAPACITY,
+        rebuild_interval: float = REBUILD_INTERVAL,
+    ):
+        self.half_life = half_life
+        self.capacity = capacity
+        self.rebuild_interval = rebuild_interval
+        self._t0 = time.time()
+        self._scores: dict[int, float] = {}
+        # Changes made while a rebuild reads the likes, replayed after it
+        self._journal: Optional[list] = None
+        self._rebuilt_at = float("-inf")
+        self._rebuild_started = 0.0
+        self._rebuild_seconds = 0.0
+        self._rebuilds = 0
+        self._build_lock = threading.Lock()
+        self._lock = threading.Lock()
+
+    def _weight(self, at: float) -> float:
+        return 2.0 ** ((at - self._t0) / self.half_life)
+
+    def like(self, post_id: int, at: Optional[float] = None):
+        """
+        Adds a like to the score of a post. Call after the commit.
+
+        Args:
+            post_id (int): ID of the liked post.
+            at (Optional[float]): Unix time of the like (default: now).
+        """
+        self._change(post_id, 1, time.time() if at is None else at)
+
+    def unlike(self, post_id: int):
+        """
+        Removes a like from the score of a post. Call after the commit.
+
+        Args:
+            post_id (int): ID of the unliked post.
+        """
+        self._change(post_id, -1, time.time())
+
+    def discard(self, post_id: int):
+        """
+        Forgets a deleted post until the next rebuild.
+
+        Args:
+            post_id (int): ID of the deleted post.
+        """
+        with self._lock:
+            if self._journal is not None:
+                self._journal.append((post_id, 0, 0.0))
+            self._scores.pop(post_id, None)
+
+    def _change(self, post_id: int, sign: int, at: float):
+        with self._lock:
+            if self._journal is not None:
+                self._journal.append((post_id, sign, at))
+            self._apply(post_id, sign, at)
+
+    def _apply(self, post_id: int, sign: int, at: float):
+        if sign == 0:
+            self._scores.pop(post_id, None)
+            return
+        if (at - self._t0) / self.half_life > _MAX_EXPONENT:
+            self._rescale(at)
+
+        score = self._scores.get(post_id, 0.0) + sign * self._weight(at)
+        if score > 0:
+            self._scores[post_id] = score
+        else:
+            self._scores.pop(post_id, None)
+
+        if len(self._scores) > 2 * self.capacity:
+            self._scores = dict(
+                heapq.nlargest(
+                    self.capacity, self._scores.items(), key=lambda item: item[1]
+                )
+            )
+
+    def _rescale(self, t0: float):
+        # Moves the reference time forward when no rebuild did for too long
+        factor = 2.0 ** ((self._t0 - t0) / self.half_life)
+        self._scores = {id: score * factor for id, score in self._scores.items()}
+        self._t0 = t0
+
+    def top(self, limit: int) -> list[tuple[int, float]]:
+        """
+        Returns the best-scored posts, with their score at the current time.
+
+        Args:
+            limit (int): Maximum number of posts.
+
+        Returns:
+            list[tuple[int, float]]: (post id, score) pairs, highest first.
+        """
+        # Copied in one step, as likes may change the scores meanwhile
+        scores, t0 = list(self._scores.items()), self._t0
+        scale = 2.0 ** ((t0 - time.time()) / self.half_life)
+        return [
+            (id, round(score * scale, 4))
+            for id, score in heapq.nlargest(
+                limit, scores, key=lambda item: (item[1], item[0])
+            )
+        ]
+
+    def due(self) -> bool:
+        """
+        Tells whether the scores expired and should be rebuilt.
+        """
+        return time.monotonic() - self._rebuilt_at > self.rebuild_interval
+
+    @property
+    def ready(self) -> bool:
+        """
+        Tells whether a rebuild completed since the process started.
+        """
+        return self._rebuilds > 0
+
+    def begin_rebuild(self) -> bool:
+        """
+        Claims the next rebuild and starts journaling changes.
+
+        Never waits: if another caller is rebuilding, returns False and the
+        current scores keep being served.
+
+        Returns:
+            bool: True if the caller must call `finish_rebuild` or `abort_rebuild`.
+        """
+        if not self._build_lock.acquire(blocking=False):
+            return False
+        with self._lock:
+            self._journal = []
+        self._rebuild_started = time.perf_counter()
+        return True
+
+    def finish_rebuild(self, counts: Iterable[tuple[int, int, int]], now: float):
+        """
+        Replaces the scores with the ones computed from the database, then
+        replays the changes journaled since `begin_rebuild` from `int(now)` on.
+
+        Args:
+            counts (Iterable[tuple[int, int, int]]): (post id, slot, likes)
+                rows of the likes created before `int(now)`, see `_recentLikes`.
+            now (float): Unix time the likes were read at, the new `t0`.
+        """
+        scores: dict[int, float] = {}
+        for post_id, slot, count in counts:
+            weight = 2.0 ** (((slot + 0.5) * _SLOT - now) / self.half_life)
+            scores[post_id] = scores.get(post_id, 0.0) + count * weight
+        best = heapq.nlargest(self.capacity, scores.items(), key=lambda item: item[1])
+
+        with self._lock:
+            journal, self._journal = self._journal or [], None
+            self._t0 = now
+            self._scores = dict(best)
+            for post_id, sign, at in journal:
+                # Earlier changes are in the counts already; deletions always apply
+                if sign == 0 or at >= int(now):
+                    self._apply(post_id, sign, at)
+            self._rebuilt_at = time.monotonic()
+            self._rebuilds += 1
+        self._rebuild_seconds = time.perf_counter() - self._rebuild_started
+        self._build_lock.release()
+
+    def abort_rebuild(self):
+        """
+        Gives up a rebuild claimed with `begin_rebuild`, keeping the current scores.
+        """
+        with self._lock:
+            self._journal = None
+        self._build_lock.release()
+
+    def stats(self) -> dict:
+        """
+        Returns the size and timings of the scores, for monitoring.
+
+        Returns:
+            dict: tracked posts, capacity, half-life, age of the scores, duration
+            of the last rebuild and number of rebuilds.
+        """
+        return {
+            "posts": len(self._scores),
+            "capacity": self.capacity,
+            "half_life_seconds": self.half_life,
+            "age_seconds": (
+                round(time.monotonic() - self._rebuilt_at, 1)
+                if self._rebuilds
+                else None
+            ),
+            "rebuild_seconds": round(self._rebuild_seconds, 3),
+            "rebuilds": self._rebuilds,
+        }
+
+
+trending = TrendingPosts()
+
+
+def _recentLikes(db: Session, since: int, until: int) -> list:
+    # Likes per post and per slot, so a rebuild reads one row per slot rather than per like
+    slot = (likes.c.createdAt // _SLOT).label("slot")
+    return db.execute(
+        select(likes.c.likedPost, slot, func.count())
+        .join(Post, Post.id == likes.c.likedPost)
+        .where(likes.c.createdAt >= since, likes.c.createdAt < until)
+        .group_by(likes.c.likedPost, slot)
+    ).all()
+
+
+# Thread of the rebuild in progress, or of the last one
+_refresher: Optional[threading.Thread] = None
+
+
+def refresh():
+    """
+    Starts rebuilding the scores from the likes of every shard in a
+    background thread if they expired. Returns at once.
+    """
+    global _refresher
+
+    if not trending.due() or not trending.begin_rebuild():
+        return
+
+    _refresher = threading.Thread(target=_rebuild, name="trending-rebuild", daemon=True)
+    _refresher.start()
+
+
+def ensure_built():
+    """
+    Rebuilds the scores unless a rebuild already completed. Blocks until
+    done: call it before serving requests, off the event loop.
+    """
+    if not trending.ready and trending.begin_rebuild():
+        _rebuild()
+
+
+async def startup():
+    """
+    Rebuilds the scores on the threadpool. Registered as an application startup
+    handler, so that trending posts are served from the recent likes at once.
+    """
+    await run_in_threadpool(ensure_built)
+
+
+def _rebuild():
+    # Cut at the first whole second after the journal opened: the likes
+    # created before it are read from the database, the later ones replayed
+    # from the journal
+    cut = int(time.time()) + 1
+    time.sleep(max(0.0, cut - time.time()))
+    now = float(cut)
+    counts = []
+    try:
+        for db in sharding.sync_sessions():
+            with db:
+                counts += _recentLikes(db, int(now - WINDOW), int(now))
+    except Exception:
+        # The current scores stay; the next request retries
+        trending.abort_rebuild()
+        logger.exception("Trending scores rebuild failed")
+        return
+    trending.finish_rebuild(counts, now)
+
+
+def wait(timeout: Optional[float] = None) -> bool:
+    """
+    Waits for the rebuild in progress, if any, to finish.
+
+    Args:
+        timeout (Optional[float]): Seconds to wait at most, None for no limit.
+
+    Returns:
+        bool: True if no rebuild is running anymore.
+    """
+    refresher = _refresher
+    if refresher is not None:
+        refresher.join(timeout)
+        return not refresher.is_alive()
+    return True
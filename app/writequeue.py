@@ -0,0 +1,314 @@
+"""
+writequeue.py
+
+This module is an optional group-commit queue for likes and follows.
+
+On SQLite every commit takes the database write lock and, with the default
+journal, waits for an fsync. When a popular post is liked by many users at
+once, one commit per request makes the writes queue up behind each other
+until they time out. With `WRITE_QUEUE` enabled the like, unlike, follow and
+unfollow routes hand their intent to this queue instead of committing
+themselves:
+
+- a single writer task on the event loop collects the intents that arrive
+  within `WRITE_QUEUE_INTERVAL_MS`, up to `WRITE_QUEUE_MAX_BATCH` of them;
+- it reads the current state of every (user, target) pair of the batch in
+  one query, then replays the intents in arrival order to decide which ones
+  succeed, exactly as if they had been committed one by one. Only the net
+  change of each pair is written, so a like followed by an unlike in the
+  same batch cancels out and writes nothing;
+- the net changes go through `relations.py` (counters, home timelines and
+  listing versions included) in a single transaction with a single commit;
+- once that commit returned, every caller gets its `Outcome`: the
+  acknowledgement is durable, it is sent only after the data is committed.
+
+With `SHARDS` set, a batch is split by shard (likes by the shard of the
+post, follows by the shard of the followed user, see `sharding.py`) and the
+parts are committed concurrently, each in its own transaction: a failing
+part does not fail the others.
+
+Callers wait for at most one batch interval plus one commit. If more than
+`WRITE_QUEUE_LIMIT` intents are waiting, new ones are refused with `503` and
+`Retry-After`, like the password hashing pool. If a batch fails, every
+caller in it gets the error and nothing of the batch is written.
+
+Compare the throughput of both paths with `python -m benchmarks.write_queue`.
+"""
+
+import asyncio
+import contextvars
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Literal, Optional
+
+from fastapi import HTTPException, status
+from sqlalchemy import select, tuple_
+from sqlalchemy.orm import Session
+
+from . import config, feedcache, relations, sharding
+from .followgraph import follow_graph
+from .models import Post, User, follow, likes
+from .trending import trending
+
+Kind = Literal["like", "follow"]
+
+
+@dataclass(frozen=True, slots=True)
+class Outcome:
+    """
+    Result of a queued write, available once its batch is committed.
+
+    Attributes:
+        changed (bool): False if the intent was a no-op (liking a post
+            already liked, unfollowing a user not followed...).
+        counts (dict): For likes, `like_count` of the post; for follows,
+            `following_count` and `followers_count` of the acting user.
+    """
+
+    changed: bool
+    counts: dict
+
+
+class _Intent:
+    __slots__ = ("kind", "actor", "target", "add", "future")
+
+    def __init__(self, kind: Kind, actor: int, target: int, add: bool, future):
+        self.kind = kind
+        self.actor = actor
+        self.target = target
+        self.add = add
+        self.future = future
+
+
+_pending: list = []
+_wakeup: Optional[asyncio.Event] = None
+_writer: Optional[asyncio.Task] = None
+_flushing = False
+
+# Batches and intents written, for monitoring
+_stats = {"batches": 0, "intents": 0, "writes": 0, "cancelled": 0, "failed": 0}
+
+
+def _ensure_writer(loop: asyncio.AbstractEventLoop):
+    # Started on first use, and again if the app now runs on another loop. The
+    # writer gets an empty context: it must not inherit the metrics and query
+    # guard state of the request that happened to start it.
+    global _wakeup, _writer
+    if _writer is None or _writer.done() or _writer.get_loop() is not loop:
+        _wakeup = asyncio.Event()
+        _writer = loop.create_task(_run(), context=contextvars.Context())
+
+
+async def submit(kind: Kind, actor: int, target: int, add: bool) -> Outcome:
+    """
+    Queues a like/unlike or follow/unfollow and waits until it is committed.
+
+    Validate the target before calling: the queue only decides whether the
+    relationship changes.
+
+    Args:
+        kind (Kind): "like" (target is a post) or "follow" (target is a user).
+        actor (int): ID of the user liking or following.
+        target (int): ID of the post or of the user followed.
+        add (bool): True to like/follow, False to unlike/unfollow.
+
+    Returns:
+        Outcome: Whether the relationship changed, and the updated counts.
+
+    Raises:
+        HTTPException: 503 with `Retry-After` if too many writes are waiting.
+    """
+    if len(_pending) >= config.WRITE_QUEUE_LIMIT:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many pending writes",
+            headers={"Retry-After": "1"},
+        )
+
+    loop = asyncio.get_running_loop()
+    _ensure_writer(loop)
+    future = loop.create_future()
+    _pending.append(_Intent(kind, actor, target, add, future))
+    _wakeup.set()  # type:ignore
+    return await future
+
+
+async def _run():
+    global _flushing
+    while True:
+        await _wakeup.wait()  # type:ignore
+        # Let concurrent requests join the batch
+        await asyncio.sleep(config.WRITE_QUEUE_INTERVAL)
+
+        batch = _pending[: config.WRITE_QUEUE_MAX_BATCH]
+        del _pending[: len(batch)]
+        if not _pending:
+            _wakeup.clear()  # type:ignore
+        if batch:
+            _flushing = True
+            try:
+                await _flush(batch)
+            finally:
+                _flushing = False
+
+
+async def _flush(batch: list):
+    parts = defaultdict(list)
+    for intent in batch:
+        shard_of = (
+            sharding.shard_of_post
+            if intent.kind == "like"
+            else sharding.shard_of_author
+        )
+        parts[shard_of(intent.target)].append(intent)
+
+    await asyncio.gather(*(_flush_part(shard, part) for shard, part in parts.items()))
+
+
+async def _flush_part(shard: int, batch: list):
+    specs = [(intent.kind, intent.actor, intent.target, intent.add) for intent in batch]
+    try:
+        async with sharding.session(shard) as db:
+            outcomes = await db.run_sync(apply, specs)
+    except Exception as error:
+        _stats["failed"] += len(batch)
+        for intent in batch:
+            if not intent.future.done():
+                intent.future.set_exception(error)
+        return
+
+    for intent, outcome in zip(batch, outcomes):
+        # The caller may have gone away; the write stands regardless
+        if not intent.future.done():
+            intent.future.set_result(outcome)
+
+
+def apply(db: Session, specs: list) -> list:
+    """
+    Applies a batch of intents in one transaction and commits it.
+
+    Args:
+        db (Session): SQLAlchemy session.
+        specs (list[tuple[Kind, int, int, bool]]): (kind, actor, target, add)
+            per intent, in arrival order.
+
+    Returns:
+        list[Outcome]: One outcome per intent, in the same order.
+    """
+    like_pairs = {(actor, target) for kind, actor, target, _ in specs if kind == "like"}
+    follow_pairs = {
+        (actor, target) for kind, actor, target, _ in specs if kind == "follow"
+    }
+
+    initial = {}
+    if like_pairs:
+        existing = set(
+            db.execute(
+                select(likes.c.likedBy, likes.c.likedPost).where(
+                    tuple_(likes.c.likedBy, likes.c.likedPost).in_(list(like_pairs))
+                )
+            ).tuples()
+        )
+        initial.update({("like", *pair): pair in existing for pair in like_pairs})
+    if follow_pairs:
+        existing = set(
+            db.execute(
+                select(follow.c.follower, follow.c.followee).where(
+                    tuple_(follow.c.follower, follow.c.followee).in_(list(follow_pairs))
+                )
+            ).tuples()
+        )
+        initial.update({("follow", *pair): pair in existing for pair in follow_pairs})
+
+    # Replay the intents in order, as if each had been committed alone
+    state = dict(initial)
+    changed = []
+    for kind, actor, target, add in specs:
+        key = (kind, actor, target)
+        changed.append(state[key] != add)
+        state[key] = add
+
+    writes = {
+        ("like", True): relations.add_like,
+        ("like", False): relations.remove_like,
+        ("follow", True): relations.add_follow,
+        ("follow", False): relations.remove_follow,
+    }
+    net = [key for key, final in state.items() if final != initial[key]]
+    for kind, actor, target in net:
+        writes[(kind, state[(kind, actor, target)])](db, actor, target)
+    liked_posts = {target for kind, _, target in net if kind == "like"}
+
+    like_counts, authors = {}, set()
+    post_ids = {target for _, target in like_pairs}
+    if post_ids:
+        for id, count, author in db.execute(
+            select(Post.id, Post.likesCount, Post.author).where(Post.id.in_(post_ids))
+        ):
+            like_counts[id] = count
+            if id in liked_posts:
+                authors.add(author)
+
+    follow_counts = {}
+    actors = {actor for actor, _ in follow_pairs}
+    if actors:
+        for id, following, followers in db.execute(
+            select(User.id, User.followingCount, User.followersCount).where(
+                User.id.in_(actors)
+            )
+        ):
+            follow_counts[id] = {
+                "following_count": following,
+                "followers_count": followers,
+            }
+
+    db.commit()
+    for author in authors:
+        feedcache.invalidate(author)
+    for kind, actor, target in net:
+        if kind == "follow":
+            follow_graph.update(actor, target, state[(kind, actor, target)])
+        elif state[(kind, actor, target)]:
+            trending.like(target)
+        else:
+            trending.unlike(target)
+
+    _stats["batches"] += 1
+    _stats["intents"] += len(specs)
+    _stats["writes"] += len(net)
+    # Successful intents whose effect was undone by a later one in the batch
+    _stats["cancelled"] += sum(changed) - len(net)
+
+    return [
+        Outcome(
+            changed=ok,
+            counts=(
+                {"like_count": like_counts.get(target, 0)}
+                if kind == "like"
+                else follow_counts.get(actor, {})
+            ),
+        )
+        for (kind, actor, target, _), ok in zip(specs, changed)
+    ]
+
+
+def stats() -> dict:
+    """
+    Returns the counters of the write queue, for monitoring.
+
+    Returns:
+        dict: pending intents, committed batches, intents and row writes,
+        intents cancelled out within their batch, and failed intents.
+    """
+    return {"pending": len(_pending), **_stats}
+
+
+async def shutdown():
+    """
+    Waits for the queued writes to be committed. Registered as an application
+    shutdown handler.
+    """
+    deadline = time.monotonic() + 10
+    while (_pending or _flushing) and time.monotonic() < deadline:
+        await asyncio.sleep(config.WRITE_QUEUE_INTERVAL)
@@ -0,0 +1,7 @@
+"""
+benchmarks
+
+Standalone performance benchmarks for the Bog API.
+
+Each module can be run directly, e.g. `python -m benchmarks.sampler`.
+"""
@@ -0,0 +1,85 @@
+"""
+compare.py (benchmark)
+
+Compares two JSON reports of `benchmarks.harness` and flags regressions.
+
+An endpoint regresses when its p95 latency grows, or its throughput drops, by
+more than `--threshold` (a fraction, 0.15 by default) against the baseline,
+or when it starts failing with errors. The exit status is 1 if any endpoint
+regressed, so the command can gate a CI job:
+
+    python -m benchmarks.harness --output current.json
+    python -m benchmarks.compare baseline.json current.json
+
+Usage:
+    python -m benchmarks.compare BASELINE CURRENT [--threshold 0.15]
+"""
+
+import argparse
+import json
+import sys
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list:
+    """
+    Lists the endpoints measured in both reports with their changes.
+
+    Args:
+        baseline (dict): Reference report.
+        current (dict): Report to check.
+        threshold (float): Tolerated relative change.
+
+    Returns:
+        list[dict]: transport, endpoint, p95 and rps change ratios, and
+        whether the endpoint regressed.
+    """
+    rows = []
+    for transport, endpoints in current["results"].items():
+        for endpoint, result in endpoints.items():
+            base = baseline["results"].get(transport, {}).get(endpoint)
+            if base is None:
+                continue
+
+            p95 = result["p95"] / base["p95"] if base["p95"] else 1.0
+            rps = result["rps"] / base["rps"] if base["rps"] else 1.0
+            rows.append(
+                {
+                    "transport": transport,
+                    "endpoint": endpoint,
+                    "p95": p95,
+                    "rps": rps,
+                    "regressed": p95 > 1 + threshold
+                    or rps < 1 - threshold
+                    or (result["errors"] > 0 and base["errors"] == 0),
+                }
+            )
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.compare")
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=0.15)
+    args = parser.parse_args()
+
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    with open(args.current) as file:
+        current = json.load(file)
+
+    rows = compare(baseline, current, args.threshold)
+
+    print(f"{'transport':>10} {'endpoint':>11} {'p95':>8} {'req/s':>8}")
+    for row in rows:
+        flag = "  REGRESSION" if row["regressed"] else ""
+        print(
+            f"{row['transport']:>10} {row['endpoint']:>11} "
+            f"{row['p95'] - 1:>+8.1%} {row['rps'] - 1:>+8.1%}{flag}"
+        )
+
+    sys.exit(1 if any(row["regressed"] for row in rows) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+db_mode.py (benchmark)
+
+Compares the sync (threadpool) and async (aiosqlite) database modes under
+high concurrency. For each mode a uvicorn server is started on a fresh
+seeded database and hammered with concurrent read requests; throughput and
+latency percentiles are reported per mode.
+
+Usage:
+    python -m benchmarks.db_mode [--concurrency 256] [--duration 10]
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+from sqlalchemy import create_engine
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def seed(directory: str, users: int, posts_per_user: int, password: str = "-"):
+    """
+    Creates `blog.db` in `directory` with the given number of users and posts.
+
+    Every user gets the same stored `password` value (a bcrypt hash if the
+    benchmark needs working logins).
+    """
+    from app.database import Base
+    from app.models import Post, User
+
+    engine = create_engine(f"sqlite:///{os.path.join(directory, 'blog.db')}")
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(
+            User.__table__.insert(),
+            [
+                {
+                    "username": f"user{i}",
+                    "email": f"user{i}@bog.test",
+                    "gender": "x",
+                    "password": password,
+                }
+                for i in range(users)
+            ],
+        )
+        conn.execute(
+            Post.__table__.insert(),
+            [
+                {"author": i + 1, "title": f"post {j}", "content": "lorem ipsum " * 20}
+                for i in range(users)
+                for j in range(posts_per_user)
+            ],
+        )
+    engine.dispose()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(directory: str, port: int, env: dict) -> subprocess.Popen:
+    """
+    Starts uvicorn serving `app.main:app` from `directory` and waits until it answers.
+    """
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "app.main:app",
+            "--port",
+            str(port),
+            "--log-level",
+            "warning",
+        ],
+        cwd=directory,
+        env={**os.environ, "PYTHONPATH": ROOT, **env},
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/", timeout=1)
+            return server
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("server did not start")
+
+
+async def hammer(base: str, paths: list, concurrency: int, duration: float) -> dict:
+    """
+    Sends requests from `concurrency` workers for `duration` seconds.
+
+    Returns:
+        dict: Request count, error count, throughput and latency percentiles (ms).
+    """
+    latencies = []
+    errors = 0
+    stop = time.monotonic() + duration
+    limits = httpx.Limits(max_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base, limits=limits, timeout=30) as client:
+
+        async def worker(offset):
+            nonlocal errors
+            i = offset
+            while time.monotonic() < stop:
+                start = time.perf_counter()
+                try:
+                    response = await client.get(paths[i % len(paths)])
+                    if response.status_code >= 400:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append((time.perf_counter() - start) * 1000)
+                i += 1
+
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+
+    latencies.sort()
+    quantiles = statistics.quantiles(latencies, n=100)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / duration,
+        "p50": quantiles[49],
+        "p99": quantiles[98],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.db_mode")
+    parser.add_argument("--concurrency", type=int, default=256)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--posts", type=int, default=20)
+    args = parser.parse_args()
+
+    paths = [f"/feed/user{i}" for i in range(0, args.users, 7)] + ["/feed"]
+
+    print(
+        f"{'mode':>6} {'requests':>9} {'errors':>7} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8}"
+    )
+    for mode in ("sync", "async"):
+        with tempfile.TemporaryDirectory() as tmp:
+            seed(tmp, args.users, args.posts)
+            port = free_port()
+            server = start_server(tmp, port, {"DATABASE_MODE": mode})
+            try:
+                result = asyncio.run(
+                    hammer(
+                        f"http://127.0.0.1:{port}",
+                        paths,
+                        args.concurrency,
+                        args.duration,
+                    )
+                )
+            finally:
+                server.terminate()
+                server.wait()
+
+        print(
+            f"{mode:>6} {result['requests']:>9} {result['errors']:>7} "
+            f"{result['rps']:>9.1f} {result['p50']:>8.2f} {result['p99']:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+db_profile.py (benchmark)
+
+Compares SQLite engine profiles under concurrent mixed read/write traffic.
+
+For each profile a uvicorn server is started on a fresh seeded database.
+Concurrent clients then send `GET /feed/{username}` reads and authenticated
+`POST /posts` writes in the configured ratio. Throughput, error count and
+latency percentiles are reported per profile and per request kind.
+
+Usage:
+    python -m benchmarks.db_profile [--concurrency 64] [--write-ratio 0.2] [--duration 10]
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import tempfile
+import time
+
+import httpx
+
+from app.routes.auth import create_access_token
+
+from .db_mode import free_port, seed, start_server
+
+PROFILES = {
+    "default": {"DATABASE_PROFILE": "default"},
+    "production": {"DATABASE_PROFILE": "production"},
+    "production+read-pool": {"DATABASE_PROFILE": "production", "DB_READ_POOL": "1"},
+}
+
+
+async def mixed(base: str, users: int, args) -> dict:
+    """
+    Sends a mix of reads and writes from `args.concurrency` workers.
+
+    Returns:
+        dict: Latencies (ms) and error counts keyed by "read" and "write".
+    """
+    latencies = {"read": [], "write": []}
+    errors = {"read": 0, "write": 0}
+    stop = time.monotonic() + args.duration
+    limits = httpx.Limits(max_connections=args.concurrency)
+    rng = random.Random(0)
+
+    async with httpx.AsyncClient(base_url=base, limits=limits, timeout=60) as client:
+
+        async def worker():
+            while time.monotonic() < stop:
+                user = rng.randrange(users)
+                if rng.random() < args.write_ratio:
+                    kind = "write"
+                    token = create_access_token(f"user{user}", user + 1)
+                    request = client.post(
+                        "/posts",
+                        json={"title": "benchmark", "content": "lorem ipsum " * 20},
+                        headers={"Authorization": f"Bearer {token}"},
+                    )
+                else:
+                    kind = "read"
+                    request = client.get(f"/feed/user{user}")
+
+                start = time.perf_counter()
+                try:
+                    response = await request
+                    if response.status_code >= 400:
+                        errors[kind] += 1
+                except httpx.HTTPError:
+                    errors[kind] += 1
+                latencies[kind].append((time.perf_counter() - start) * 1000)
+
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+
+    return {"latencies": latencies, "errors": errors}
+
+
+def summarize(latencies: list) -> tuple:
+    if len(latencies) < 2:
+        return 0.0, 0.0
+    quantiles = statistics.quantiles(latencies, n=100)
+    return quantiles[49], quantiles[98]
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.db_profile")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--mode", choices=["sync", "async"], default="sync")
+    args = parser.parse_args()
+
+    print(
+        f"{'profile':>22} {'kind':>6} {'req/s':>8} {'errors':>7} "
+        f"{'p50 ms':>8} {'p99 ms':>8}"
+    )
+    for name, env in PROFILES.items():
+        with tempfile.TemporaryDirectory() as tmp:
+            seed(tmp, args.users, 20)
+            port = free_port()
+            server = start_server(tmp, port, {**env, "DATABASE_MODE": args.mode})
+            try:
+                result = asyncio.run(
+                    mixed(f"http://127.0.0.1:{port}", args.users, args)
+                )
+            finally:
+                server.terminate()
+                server.wait()
+
+        for kind in ("read", "write"):
+            samples = result["latencies"][kind]
+            p50, p99 = summarize(samples)
+            print(
+                f"{name:>22} {kind:>6} {len(samples) / args.duration:>8.1f} "
+                f"{result['errors'][kind]:>7} {p50:>8.2f} {p99:>8.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+export.py (benchmark)
+
+Measures the memory use and throughput of `GET /users/{id}/export` (see
+`app/routes/export.py`) against the size of the exported account.
+
+For each size, a database holding one account with that many posts (plus a
+like for every tenth post and `--follows` follows in each direction) is
+generated in a temporary directory and served by uvicorn. The export is
+downloaded while the resident set size of the server process is sampled
+from `/proc` (Linux only). Memory growth is the peak RSS during the download
+minus the RSS before it; with a streamed export it should stay flat however
+many posts the account has.
+
+The run fails (exit status 1) if the growth of any size exceeds
+`--max-growth-mb`, so it can serve as a memory-ceiling check in CI.
+
+Usage:
+    python -m benchmarks.export [--posts 10000 100000 1000000]
+        [--max-growth-mb 64] [--database-mode sync]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+from sqlalchemy import create_engine
+
+from .db_mode import free_port, start_server
+
+# Rows inserted per statement while generating
+_CHUNK = 50000
+
+
+def seed_account(directory: str, posts: int, follows: int):
+    """
+    Creates `blog.db` in `directory` with user 1 owning `posts` posts, liking
+    one post in ten, and following and followed by `follows` other users.
+    """
+    from app.database import Base
+    from app.models import Post, User, follow, likes
+
+    engine = create_engine(f"sqlite:///{os.path.join(directory, 'blog.db')}")
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(
+            User.__table__.insert(),
+            [
+                {
+                    "username": f"user{i}",
+                    "email": f"user{i}@bog.test",
+                    "gender": "x",
+                    "password": "-",
+                }
+                for i in range(1, follows + 2)
+            ],
+        )
+        for start in range(0, posts, _CHUNK):
+            conn.execute(
+                Post.__table__.insert(),
+                [
+                    {
+                        "author": 1,
+                        "title": f"post {j}",
+                        "content": "lorem ipsum " * 20,
+                        "likesCount": int(j % 10 == 0),
+                    }
+                    for j in range(start, min(posts, start + _CHUNK))
+                ],
+            )
+        for start in range(0, posts, _CHUNK * 10):
+            conn.execute(
+                likes.insert(),
+                [
+                    {"likedBy": 1, "likedPost": j + 1}
+                    for j in range(start, min(posts, start + _CHUNK * 10), 10)
+                ],
+            )
+        conn.execute(
+            follow.insert(),
+            [{"follower": 1, "followee": i} for i in range(2, follows + 2)]
+            + [{"follower": i, "followee": 1} for i in range(2, follows + 2)],
+        )
+        conn.execute(
+            User.__table__.update()
+            .where(User.id == 1)
+            .values(postsCount=posts, followersCount=follows, followingCount=follows)
+        )
+    engine.dispose()
+
+
+def rss(pid: int) -> int:
+    """
+    Returns the resident set size of a process in bytes, from `/proc`.
+    """
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    raise RuntimeError(f"no VmRSS for process {pid}")
+
+
+def download(base: str, token: str, pid: int) -> dict:
+    """
+    Streams the export of user 1 while sampling the server's RSS.
+
+    Returns:
+        dict: Lines and bytes received, seconds taken, RSS before the download
+        and peak RSS during it, and whether the final `end` line was received.
+    """
+    before = rss(pid)
+    peak = before
+    done = threading.Event()
+
+    def sample():
+        nonlocal peak
+        while not done.is_set():
+            peak = max(peak, rss(pid))
+            time.sleep(0.02)
+
+    sampler = threading.Thread(target=sample)
+    sampler.start()
+    lines = size = 0
+    last = b""
+    start = time.perf_counter()
+    try:
+        with httpx.stream(
+            "GET",
+            f"{base}/users/1/export",
+            headers={"Authorization": f"Bearer {token}"},
+            timeout=60,
+        ) as response:
+            response.raise_for_status()
+            for chunk in response.iter_bytes():
+                lines += chunk.count(b"\n")
+                size += len(chunk)
+                last = (last + chunk)[-200:]
+    finally:
+        seconds = time.perf_counter() - start
+        done.set()
+        sampler.join()
+
+    return {
+        "lines": lines,
+        "bytes": size,
+        "seconds": seconds,
+        "before": before,
+        "peak": peak,
+        "complete": b'"type":"end"' in last.rstrip(b"\n").rsplit(b"\n", 1)[-1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.export")
+    parser.add_argument(
+        "--posts", type=int, nargs="+", default=[10_000, 100_000, 1_000_000]
+    )
+    parser.add_argument("--follows", type=int, default=1000)
+    parser.add_argument("--max-growth-mb", type=float, default=64)
+    parser.add_argument("--database-mode", choices=("sync", "async"), default="sync")
+    args = parser.parse_args()
+
+    print(
+        f"{'posts':>9} {'lines':>9} {'MB':>8} {'seconds':>8} {'rows/s':>9} "
+        f"{'RSS MB':>7} {'peak MB':>8} {'growth MB':>10}"
+    )
+    failed = False
+    for posts in args.posts:
+        with tempfile.TemporaryDirectory() as tmp:
+            # Imported once the database location is known, like the harness
+            os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'blog.db')}"
+            from app.routes.auth import create_access_token
+
+            seed_account(tmp, posts, args.follows)
+            port = free_port()
+            server = start_server(
+                tmp, port, {"DATABASE_MODE": args.database_mode, "SHARDS": "0"}
+            )
+            try:
+                result = download(
+                    f"http://127.0.0.1:{port}",
+                    create_access_token("user1", 1),
+                    server.pid,
+                )
+            finally:
+                server.terminate()
+                server.wait()
+
+        growth = (result["peak"] - result["before"]) / 2**20
+        failed |= growth > args.max_growth_mb or not result["complete"]
+        print(
+            f"{posts:>9} {result['lines']:>9} {result['bytes'] / 2**20:>8.1f} "
+            f"{result['seconds']:>8.2f} {result['lines'] / result['seconds']:>9.0f} "
+            f"{result['before'] / 2**20:>7.1f} {result['peak'] / 2**20:>8.1f} "
+            f"{growth:>10.1f}" + ("" if result["complete"] else "  (incomplete)")
+        )
+
+    if failed:
+        print(f"Memory growth above {args.max_growth_mb} MB or incomplete export")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
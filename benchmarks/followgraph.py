@@ -0,0 +1,135 @@
+"""
+followgraph.py (benchmark)
+
+Measures the in-memory follow graph (see `app/followgraph.py`) against the
+number of follows: build time, memory footprint and suggestion latency.
+
+For each size, a power-law follow graph is generated directly as edges (the
+same Zipf popularity as `graph.py`) and loaded with `FollowGraph.build`. The
+memory column is the growth of the traced Python heap while building, which
+includes the arrays; `arrays MB` is their own payload. Suggestion latency is
+measured for users drawn uniformly, so most of them follow few people and a
+few follow many. Pass `--from-db` to also time a rebuild from an SQLite
+`follow` table, the way the app builds the index.
+
+Usage:
+    python -m benchmarks.followgraph [--edges 100000 1000000 5000000]
+        [--follows-per-user 20] [--runs 1000] [--from-db]
+"""
+
+import argparse
+import bisect
+import itertools
+import os
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app.database import Base
+from app.followgraph import FollowGraph
+from app.models import follow
+
+
+def edges(users: int, count: int, alpha: float, seed: int) -> list:
+    """
+    Draws about `count` distinct follows between `users` users, sorted by follower.
+
+    Returns:
+        list[tuple[int, int]]: (follower, followee) pairs.
+    """
+    rng = random.Random(seed)
+    popularity = list(
+        itertools.accumulate(1 / rank**alpha for rank in range(1, users + 1))
+    )
+    total = popularity[-1]
+    pairs = set()
+    while len(pairs) < count:
+        follower = rng.randint(1, users)
+        followee = bisect.bisect(popularity, rng.random() * total) + 1
+        if followee != follower:
+            pairs.add((follower, followee))
+    return sorted(pairs)
+
+
+def from_db(pairs: list) -> float:
+    """
+    Writes the edges to an SQLite `follow` table and times a rebuild from it.
+
+    Returns:
+        float: Rebuild time in seconds.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'graph.db')}")
+        Base.metadata.create_all(bind=engine, tables=[follow])
+        with engine.begin() as conn:
+            conn.execute(
+                follow.insert(), [{"follower": a, "followee": b} for a, b in pairs]
+            )
+        graph = FollowGraph()
+        with Session(engine) as db:
+            start = time.perf_counter()
+            graph._rebuild(db)
+            seconds = time.perf_counter() - start
+        engine.dispose()
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.followgraph")
+    parser.add_argument(
+        "--edges", type=int, nargs="+", default=[100_000, 1_000_000, 5_000_000]
+    )
+    parser.add_argument("--follows-per-user", type=int, default=20)
+    parser.add_argument("--alpha", type=float, default=1.1)
+    parser.add_argument("--runs", type=int, default=1000)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--from-db", action="store_true")
+    args = parser.parse_args()
+
+    print(
+        f"{'edges':>10} {'users':>9} {'build s':>8} {'arrays MB':>10} "
+        f"{'heap MB':>8} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}"
+        + (f" {'db build s':>10}" if args.from_db else "")
+    )
+    for count in args.edges:
+        users = max(2, count // args.follows_per_user)
+        pairs = edges(users, count, args.alpha, args.seed)
+
+        graph = FollowGraph()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        graph.build(pairs)
+        build = time.perf_counter() - start
+        heap = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        stats = graph.stats()
+
+        rng = random.Random(args.seed)
+        samples = []
+        for _ in range(args.runs):
+            user_id = rng.randint(1, users)
+            start = time.perf_counter()
+            graph.suggestions(user_id, args.limit)
+            samples.append((time.perf_counter() - start) * 1000)
+        quantiles = statistics.quantiles(samples, n=100)
+
+        line = (
+            f"{len(pairs):>10} {users:>9} {build:>8.2f} "
+            f"{(stats['offsets_bytes'] + stats['targets_bytes']) / 2**20:>10.1f} "
+            f"{heap / 2**20:>8.1f} {quantiles[49]:>8.3f} {quantiles[98]:>8.3f} "
+            f"{max(samples):>8.3f}"
+        )
+        if args.from_db:
+            line += f" {from_db(pairs):>10.2f}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
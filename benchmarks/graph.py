@@ -0,0 +1,173 @@
+"""
+graph.py (benchmark)
+
+Seeded generator of synthetic social-graph databases.
+
+Builds users, a power-law follow graph, posts and likes through the tables of
+`app.models`, then rebuilds the derived data (counters, home timelines and
+search index) the same way the bulk loader does. The same arguments and seed
+always produce the same database, so benchmark runs are comparable.
+
+Popularity follows a Zipf distribution over user ids: user 1 is the most
+followed and most prolific author, and the follower count of the user of
+rank r is proportional to 1 / r^alpha. Likes are skewed the same way towards
+the posts of popular authors.
+
+Usage:
+    python -m benchmarks.graph blog.db [--users 10000] [--seed 0]
+"""
+
+import argparse
+import itertools
+import random
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app import counters, search, timeline
+from app.database import Base
+from app.models import Post, User, follow, likes
+
+WORDS = (
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor "
+    "incididunt ut labore et dolore magna aliqua fastapi sqlite python feed post"
+).split()
+
+
+def generate(
+    url: str,
+    users: int = 1000,
+    follows_per_user: int = 20,
+    posts_per_user: int = 10,
+    likes_per_user: int = 20,
+    alpha: float = 1.1,
+    seed: int = 0,
+    password: str = "-",
+) -> dict:
+    """
+    Creates and fills a database with a synthetic social graph.
+
+    Args:
+        url (str): SQLAlchemy URL of an empty database.
+        users (int): Number of users.
+        follows_per_user (int): Average number of users each user follows.
+        posts_per_user (int): Average number of posts per user.
+        likes_per_user (int): Average number of likes each user gives.
+        alpha (float): Exponent of the popularity distribution.
+        seed (int): Seed of the random generator.
+        password (str): Stored password of every user (a bcrypt hash if logins are needed).
+
+    Returns:
+        dict: Number of users, follows, posts and likes created, and the build time.
+    """
+    start = time.perf_counter()
+    rng = random.Random(seed)
+    ids = range(1, users + 1)
+    popularity = list(
+        itertools.accumulate(1 / rank**alpha for rank in range(1, users + 1))
+    )
+
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+
+    follows = set()
+    for follower in ids:
+        count = min(users - 1, int(rng.expovariate(1 / follows_per_user)) + 1)
+        for followee in rng.choices(ids, cum_weights=popularity, k=count):
+            if followee != follower:
+                follows.add((follower, followee))
+
+    authors = rng.choices(ids, cum_weights=popularity, k=users * posts_per_user)
+    authors.sort()
+
+    # Posts of popular authors get most likes: pick an author by popularity,
+    # then one of their posts uniformly
+    posts_of = {}
+    for post_id, author in enumerate(authors, start=1):
+        posts_of.setdefault(author, []).append(post_id)
+    liked = set()
+    for liker, author in zip(
+        rng.choices(ids, k=users * likes_per_user),
+        rng.choices(ids, cum_weights=popularity, k=users * likes_per_user),
+    ):
+        if author in posts_of:
+            liked.add((liker, rng.choice(posts_of[author])))
+
+    with engine.begin() as conn:
+        conn.execute(
+            User.__table__.insert(),
+            [
+                {
+                    "id": id,
+                    "username": f"user{id}",
+                    "email": f"user{id}@bog.test",
+                    "gender": rng.choice(("f", "m", "x")),
+                    "password": password,
+                }
+                for id in ids
+            ],
+        )
+        conn.execute(
+            Post.__table__.insert(),
+            [
+                {
+                    "id": post_id,
+                    "author": author,
+                    "title": " ".join(rng.choices(WORDS, k=4)),
+                    "content": " ".join(rng.choices(WORDS, k=rng.randint(10, 60))),
+                }
+                for post_id, author in enumerate(authors, start=1)
+            ],
+        )
+        conn.execute(
+            follow.insert(),
+            [{"follower": a, "followee": b} for a, b in sorted(follows)],
+        )
+        conn.execute(
+            likes.insert(),
+            [{"likedBy": a, "likedPost": b} for a, b in sorted(liked)],
+        )
+
+    with Session(engine) as db:
+        counters.recompute(db)
+        timeline.rebuild(db)
+        search.rebuild(db)
+        db.commit()
+    engine.dispose()
+
+    return {
+        "users": users,
+        "follows": len(follows),
+        "posts": len(authors),
+        "likes": len(liked),
+        "seconds": round(time.perf_counter() - start, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.graph")
+    parser.add_argument("path", help="SQLite file to create")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--follows", type=int, default=20)
+    parser.add_argument("--posts", type=int, default=10)
+    parser.add_argument("--likes", type=int, default=20)
+    parser.add_argument("--alpha", type=float, default=1.1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(
+        generate(
+            f"sqlite:///{args.path}",
+            args.users,
+            args.follows,
+            args.posts,
+            args.likes,
+            args.alpha,
+            args.seed,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""
+harness.py (benchmark)
+
+Load-test harness reporting throughput and latency percentiles per endpoint.
+
+A synthetic social graph is generated with `graph.py`, then the FastAPI `app`
+is driven with a weighted mix of requests, both in-process (through
+`httpx.ASGITransport`, measuring the application alone) and over HTTP against
+a local uvicorn server (measuring the full stack):
+
+- getUsers: GET /feed?count=5
+- getPosts: GET /feed/{username}, authors picked by popularity
+- follow / unfollow: POST /users/{id}/follow then DELETE /users/{id}/unfollow
+- likePost / unlikePost: POST then DELETE /posts/{id}/like
+
+Requests are authenticated with tokens signed locally, so no bcrypt work is
+involved. Responses with a 4xx status (following someone already followed)
+are counted as rejected; 5xx responses and transport failures as errors.
+
+Results can be written as JSON with `--output` and compared between runs with
+`python -m benchmarks.compare`.
+
+Usage:
+    python -m benchmarks.harness [--transports inprocess uvicorn] [--duration 10]
+        [--concurrency 32] [--users 2000] [--seed 0] [--output results.json]
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
+
+from .db_mode import ROOT, free_port, start_server
+
+# Relative frequency of each scenario in the request mix
+MIX = {"getUsers": 1, "getPosts": 6, "follow": 1, "likePost": 2}
+
+
+def summarize(samples: list, duration: float) -> dict:
+    """
+    Reduces the samples of one endpoint to throughput and percentiles.
+
+    Args:
+        samples (list[tuple[int, float]]): (status, latency in ms) per request.
+        duration (float): Length of the run in seconds.
+
+    Returns:
+        dict: requests, errors, rejected, rps, p50, p95 and p99 (ms).
+    """
+    latencies = sorted(latency for _, latency in samples)
+    quantiles = (
+        statistics.quantiles(latencies, n=100)
+        if len(latencies) > 1
+        else latencies * 99 or [0.0] * 99
+    )
+    return {
+        "requests": len(samples),
+        "errors": sum(1 for status, _ in samples if status == 0 or status >= 500),
+        "rejected": sum(1 for status, _ in samples if 400 <= status < 500),
+        "rps": round(len(samples) / duration, 1),
+        "p50": round(quantiles[49], 3),
+        "p95": round(quantiles[94], 3),
+        "p99": round(quantiles[98], 3),
+    }
+
+
+async def drive(
+    client: httpx.AsyncClient, graph: dict, concurrency: int, duration: float, seed: int
+) -> dict:
+    """
+    Sends the request mix from `concurrency` workers for `duration` seconds.
+
+    Args:
+        client (httpx.AsyncClient): Client bound to the application.
+        graph (dict): Summary returned by `graph.generate`.
+        concurrency (int): Number of concurrent workers.
+        duration (float): Length of the run in seconds.
+        seed (int): Seed of the request generator.
+
+    Returns:
+        dict: Summary of every endpoint, see `summarize`.
+    """
+    from app.routes.auth import create_access_token
+
+    users, posts = graph["users"], graph["posts"]
+    popularity = list(
+        itertools.accumulate(1 / rank**1.1 for rank in range(1, users + 1))
+    )
+    ids = range(1, users + 1)
+    scenarios, weights = zip(*MIX.items())
+    samples = defaultdict(list)
+    stop = time.monotonic() + duration
+
+    async def request(name: str, method: str, url: str, headers=None):
+        start = time.perf_counter()
+        try:
+            status = (await client.request(method, url, headers=headers)).status_code
+        except httpx.HTTPError:
+            status = 0
+        samples[name].append((status, (time.perf_counter() - start) * 1000))
+
+    async def worker(number: int):
+        rng = random.Random(seed * 1000 + number)
+        # Each worker acts as its own user, so follow/like pairs never collide
+        me = number % users + 1
+        auth = {"Authorization": f"Bearer {create_access_token(f'user{me}', me)}"}
+
+        while time.monotonic() < stop:
+            scenario = rng.choices(scenarios, weights)[0]
+            if scenario == "getUsers":
+                await request("getUsers", "GET", "/feed?count=5")
+            elif scenario == "getPosts":
+                author = rng.choices(ids, cum_weights=popularity)[0]
+                await request("getPosts", "GET", f"/feed/user{author}")
+            elif scenario == "follow":
+                target = rng.choices(ids, cum_weights=popularity)[0]
+                await request("follow", "POST", f"/users/{target}/follow", auth)
+                await request("unfollow", "DELETE", f"/users/{target}/unfollow", auth)
+            else:
+                post = rng.randint(1, posts)
+                await request("likePost", "POST", f"/posts/{post}/like", auth)
+                await request("unlikePost", "DELETE", f"/posts/{post}/like", auth)
+
+    await asyncio.gather(*(worker(number) for number in range(concurrency)))
+    return {name: summarize(samples[name], duration) for name in sorted(samples)}
+
+
+async def run_inprocess(graph: dict, args) -> dict:
+    from app.main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+        return await drive(client, graph, args.concurrency, args.duration, args.seed)
+
+
+async def run_uvicorn(base: str, graph: dict, args) -> dict:
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base, limits=limits, timeout=60) as client:
+        return await drive(client, graph, args.concurrency, args.duration, args.seed)
+
+
+def _commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True
+        ).stdout.strip()
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.harness")
+    parser.add_argument(
+        "--transports",
+        nargs="+",
+        choices=["inprocess", "uvicorn"],
+        default=["inprocess", "uvicorn"],
+    )
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--follows", type=int, default=20)
+    parser.add_argument("--posts", type=int, default=10)
+    parser.add_argument("--likes", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    report = {
+        "meta": {
+            "commit": _commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "database_mode": os.getenv("DATABASE_MODE", "sync"),
+            **{
+                name: getattr(args, name)
+                for name in ("duration", "concurrency", "seed")
+            },
+        },
+        "results": {},
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Must be set before anything imports `app.database`
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'blog.db')}"
+        from .graph import generate
+
+        graph = generate(
+            os.environ["DATABASE_URL"],
+            args.users,
+            args.follows,
+            args.posts,
+            args.likes,
+            seed=args.seed,
+        )
+        report["meta"]["graph"] = graph
+        print(f"graph: {graph}")
+
+        for transport in args.transports:
+            if transport == "inprocess":
+                results = asyncio.run(run_inprocess(graph, args))
+            else:
+                port = free_port()
+                server = start_server(tmp, port, {})
+                try:
+                    results = asyncio.run(
+                        run_uvicorn(f"http://127.0.0.1:{port}", graph, args)
+                    )
+                finally:
+                    server.terminate()
+                    server.wait()
+            report["results"][transport] = results
+
+            print(
+                f"\n{transport}\n{'endpoint':>11} {'requests':>9} {'errors':>7} "
+                f"{'rejected':>9} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+            )
+            for name, result in results.items():
+                print(
+                    f"{name:>11} {result['requests']:>9} {result['errors']:>7} "
+                    f"{result['rejected']:>9} {result['rps']:>8.1f} {result['p50']:>8.2f} "
+                    f"{result['p95']:>8.2f} {result['p99']:>8.2f}"
+                )
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+login_storm.py (benchmark)
+
+Checks that a burst of logins does not slow down unrelated endpoints.
+
+A uvicorn server is started on a seeded database with working passwords.
+Read traffic on `GET /feed/{username}` is measured first on its own, then
+again while `--logins` concurrent clients hammer `POST /auth/token`. With
+bcrypt running in the hashing process pool, the read p99 should be about the
+same in both phases; excess logins are shed with 503.
+
+Usage:
+    python -m benchmarks.login_storm [--logins 64] [--readers 16] [--duration 10]
+"""
+
+import argparse
+import asyncio
+import tempfile
+import time
+from collections import Counter
+
+import httpx
+from passlib.context import CryptContext
+
+from .db_mode import free_port, hammer, seed, start_server
+
+
+async def storm(base: str, clients: int, duration: float) -> Counter:
+    """
+    Sends login requests from `clients` workers for `duration` seconds.
+
+    Returns:
+        Counter: Number of responses per status code.
+    """
+    statuses = Counter()
+    stop = time.monotonic() + duration
+    limits = httpx.Limits(max_connections=clients)
+
+    async with httpx.AsyncClient(base_url=base, limits=limits, timeout=60) as client:
+
+        async def worker(offset):
+            i = offset
+            while time.monotonic() < stop:
+                try:
+                    response = await client.post(
+                        "/auth/token",
+                        data={"username": f"user{i % 100}", "password": "password"},
+                    )
+                    statuses[response.status_code] += 1
+                except httpx.HTTPError:
+                    statuses["error"] += 1
+                i += 1
+
+        await asyncio.gather(*(worker(i) for i in range(clients)))
+
+    return statuses
+
+
+async def run(base: str, args) -> tuple:
+    paths = [f"/feed/user{i}" for i in range(100)]
+    quiet = await hammer(base, paths, args.readers, args.duration)
+    loaded, logins = await asyncio.gather(
+        hammer(base, paths, args.readers, args.duration),
+        storm(base, args.logins, args.duration),
+    )
+    return quiet, loaded, logins
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.login_storm")
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--readers", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10)
+    args = parser.parse_args()
+
+    password = CryptContext(schemes=["bcrypt"]).hash("password")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        seed(tmp, 100, 20, password)
+        port = free_port()
+        server = start_server(tmp, port, {})
+        try:
+            quiet, loaded, logins = asyncio.run(run(f"http://127.0.0.1:{port}", args))
+        finally:
+            server.terminate()
+            server.wait()
+
+    print(f"{'phase':>12} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for phase, result in (("reads only", quiet), ("login storm", loaded)):
+        print(
+            f"{phase:>12} {result['rps']:>9.1f} "
+            f"{result['p50']:>8.2f} {result['p99']:>8.2f}"
+        )
+    print("login responses:", dict(logins))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+metrics_overhead.py (benchmark)
+
+Measures the cost of the request and SQL instrumentation (`app/metrics.py`).
+
+Runs the in-process harness (`benchmarks.harness`) alternately with
+`METRICS_ENABLED=0` and `METRICS_ENABLED=1`, in fresh processes since the
+setting is read at import, and reports the change in throughput and median
+latency per endpoint, averaged over the rounds. Alternating the runs spreads
+machine noise evenly between both sides.
+
+End-to-end numbers on a busy machine vary by a few percent between runs, so
+the benchmark first measures the instrumentation in isolation: the time the
+middleware adds around a no-op ASGI app, and the time the cursor listeners
+add to a `SELECT 1`.
+
+Usage:
+    python -m benchmarks.metrics_overhead [--rounds 3] [--duration 5] [--users 500]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+from sqlalchemy import create_engine, text
+
+from app import metrics
+
+from .db_mode import ROOT
+
+
+def per_call(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def isolated(repeat: int = 20000):
+    """
+    Prints the cost of instrumenting one request and one SQL statement, in µs.
+    """
+
+    async def noop(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def send(message):
+        pass
+
+    async def requests(app):
+        scope = {"type": "http", "method": "GET", "path": "/"}
+        start = time.perf_counter()
+        for _ in range(repeat):
+            await app(dict(scope), None, send)
+        return (time.perf_counter() - start) / repeat * 1e6
+
+    bare = asyncio.run(requests(noop))
+    wrapped = asyncio.run(requests(metrics.MetricsMiddleware(noop)))
+    print(f"middleware: {wrapped - bare:.2f} µs per request")
+
+    plain, instrumented = create_engine("sqlite://"), create_engine("sqlite://")
+    metrics.instrument_engine(instrumented)
+    with plain.connect() as a, instrumented.connect() as b:
+        statement = text("SELECT 1")
+        bare = per_call(lambda: a.execute(statement), repeat)
+        timed = per_call(lambda: b.execute(statement), repeat)
+    print(f"SQL listeners: {timed - bare:.2f} µs per statement ({bare:.1f} µs bare)")
+
+
+def run(enabled: bool, args, output: str) -> dict:
+    subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "benchmarks.harness",
+            "--transports",
+            "inprocess",
+            "--duration",
+            str(args.duration),
+            "--concurrency",
+            str(args.concurrency),
+            "--users",
+            str(args.users),
+            "--output",
+            output,
+        ],
+        cwd=ROOT,
+        env={**os.environ, "METRICS_ENABLED": "1" if enabled else "0"},
+        stdout=subprocess.DEVNULL,
+        check=True,
+    )
+    with open(output) as file:
+        return json.load(file)["results"]["inprocess"]
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.metrics_overhead")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--duration", type=float, default=5)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--users", type=int, default=500)
+    args = parser.parse_args()
+
+    isolated()
+
+    # endpoint -> enabled -> [(rps, p50)]
+    samples = defaultdict(lambda: defaultdict(list))
+    with tempfile.TemporaryDirectory() as tmp:
+        for round in range(args.rounds):
+            for enabled in (False, True):
+                results = run(enabled, args, os.path.join(tmp, "results.json"))
+                for endpoint, result in results.items():
+                    samples[endpoint][enabled].append((result["rps"], result["p50"]))
+            print(f"round {round + 1}/{args.rounds} done")
+
+    print(
+        f"\n{'endpoint':>11} {'req/s off':>10} {'req/s on':>10} {'change':>8} "
+        f"{'p50 off':>9} {'p50 on':>9} {'change':>8}"
+    )
+    for endpoint, runs in sorted(samples.items()):
+        rps_off, p50_off = (sum(values) / len(values) for values in zip(*runs[False]))
+        rps_on, p50_on = (sum(values) / len(values) for values in zip(*runs[True]))
+        print(
+            f"{endpoint:>11} {rps_off:>10.1f} {rps_on:>10.1f} "
+            f"{rps_on / rps_off - 1:>+8.1%} {p50_off:>9.2f} {p50_on:>9.2f} "
+            f"{p50_on / p50_off - 1:>+8.1%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+sampler.py (benchmark)
+
+Measures the latency of the discovery-feed user sampler against the size of
+the `Users` table, next to the `ORDER BY random()` query it replaces.
+
+Usage:
+    python -m benchmarks.sampler [--sizes 1000 10000 100000 1000000] [--runs 200]
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.models import User
+from app.sampler import UserSampler
+
+
+def populate(engine, size: int):
+    """
+    Inserts `size` users with a single executemany.
+
+    Args:
+        engine (Engine): Engine of an empty database.
+        size (int): Number of users to insert.
+    """
+    Base.metadata.create_all(bind=engine)
+    rows = [
+        {
+            "username": f"user{i}",
+            "email": f"user{i}@bog.test",
+            "gender": "x",
+            "password": "-",
+        }
+        for i in range(size)
+    ]
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert(), rows)
+
+
+def timed(fn, runs: int) -> float:
+    """
+    Returns the median wall time of `fn` in milliseconds.
+    """
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.sampler")
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000]
+    )
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--count", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'users':>10} {'sample ms':>10} {'refresh ms':>11} {'random() ms':>12}")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+            populate(engine, size)
+            db = sessionmaker(bind=engine)()
+
+            sampler = UserSampler()
+            sampler.candidates(db)
+            sample = timed(lambda: sampler.sample(db, args.count), args.runs)
+            refresh = timed(lambda: sampler._refresh(db), max(args.runs // 20, 3))
+            baseline = timed(
+                lambda: db.scalars(
+                    select(User).order_by(func.random()).limit(args.count)
+                ).all(),
+                max(args.runs // 20, 3),
+            )
+
+            db.close()
+            engine.dispose()
+
+        print(f"{size:>10} {sample:>10.3f} {refresh:>11.3f} {baseline:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+search.py (benchmark)
+
+Measures full-text search latency against the size of the `Posts` table, next
+to the `LIKE '%term%'` scan it replaces.
+
+Post contents are drawn from a Zipf-distributed vocabulary, so the queries
+cover a frequent word, a rare word, two words and a prefix. Note that the LIKE
+baseline is unranked: it stops at the first `limit` hits, which is cheap for
+frequent words, but scans the whole table for rare ones. Ranked search has
+to score every match, so its cost follows the number of matching posts.
+
+Usage:
+    python -m benchmarks.search [--sizes 10000 100000 1000000] [--runs 50]
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from app import search
+from app.database import Base
+from app.models import Post
+
+from .sampler import timed
+
+VOCABULARY = [f"w{i}" for i in range(20_000)]
+
+QUERIES = {
+    "frequent": "w1",
+    "rare": "w15000",
+    "two words": "w2 w40",
+    "prefix": "w123*",
+}
+
+
+def populate(engine, size: int, seed: int = 0):
+    """
+    Inserts `size` posts of 30 words each and builds the search index.
+
+    Args:
+        engine (Engine): Engine of an empty database.
+        size (int): Number of posts to insert.
+        seed (int): Seed of the word generator.
+    """
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(len(VOCABULARY))]
+
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        for start in range(0, size, 50_000):
+            count = min(50_000, size - start)
+            words = rng.choices(VOCABULARY, weights, k=count * 30)
+            conn.execute(
+                Post.__table__.insert(),
+                [
+                    {
+                        "author": 1,
+                        "title": " ".join(words[i * 30 : i * 30 + 5]),
+                        "content": " ".join(words[i * 30 + 5 : i * 30 + 30]),
+                    }
+                    for i in range(count)
+                ],
+            )
+
+    db = sessionmaker(bind=engine)()
+    search.rebuild(db)
+    db.commit()
+    db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.search")
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000]
+    )
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'posts':>10} {'query':>10} {'fts ms':>9} {'LIKE ms':>9}")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+            start = time.perf_counter()
+            populate(engine, size)
+            print(f"{size:>10} {'(build)':>10} {(time.perf_counter() - start):>8.1f}s")
+
+            db = sessionmaker(bind=engine)()
+            for name, query in QUERIES.items():
+                match = search.to_match_query(query)
+                fts = timed(lambda: search.search(db, match, args.limit), args.runs)
+
+                term = f"%{query.split()[0].rstrip('*')}%"
+                like = timed(
+                    lambda: db.scalars(
+                        select(Post)
+                        .where(Post.title.like(term) | Post.content.like(term))
+                        .limit(args.limit)
+                    ).all(),
+                    max(args.runs // 10, 3),
+                )
+                print(f"{size:>10} {name:>10} {fts:>9.3f} {like:>9.3f}")
+
+            db.close()
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
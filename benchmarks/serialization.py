@@ -0,0 +1,125 @@
+"""
+serialization.py (benchmark)
+
+Measures the cost of loading and encoding 1,000 posts as a JSON page, for the
+response pipelines the post listings have used:
+
+- orm+jsonable: ORM `Post` objects encoded by FastAPI's `jsonable_encoder`
+  and the standard `json` module (routes without a response model).
+- orm+pydantic: ORM objects validated into `schemas.postPage`, then dumped
+  with pydantic (routes with a response model).
+- rows+orjson: the columns of `projections.POST_COLUMNS` selected as plain
+  rows and encoded with orjson (the current pipeline).
+
+Each pipeline is timed end to end (query, object construction and encoding)
+and for the encoding step alone, on a fresh session every run.
+
+Usage:
+    python -m benchmarks.serialization [--posts 1000] [--runs 50]
+"""
+
+import argparse
+import json
+import os
+import tempfile
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from app import projections
+from app.database import Base
+from app.models import Post, User
+from app.schemas import postPage
+
+from .sampler import timed
+
+
+def load_orm(db, count: int) -> list:
+    return db.scalars(select(Post).order_by(Post.id.desc()).limit(count)).all()
+
+
+def load_rows(db, count: int) -> list:
+    return db.execute(
+        select(*projections.POST_COLUMNS).order_by(Post.id.desc()).limit(count)
+    ).all()
+
+
+def encode_jsonable(posts: list) -> bytes:
+    return json.dumps(
+        jsonable_encoder({"posts": posts, "next_cursor": None}),
+        ensure_ascii=False,
+        separators=(",", ":"),
+    ).encode()
+
+
+def encode_pydantic(posts: list) -> bytes:
+    page = postPage.model_validate(
+        {"posts": posts, "next_cursor": None}, from_attributes=True
+    )
+    return page.model_dump_json().encode()
+
+
+def encode_orjson(rows: list) -> bytes:
+    return projections.post_page(rows, None)
+
+
+PIPELINES = {
+    "orm+jsonable": (load_orm, encode_jsonable),
+    "orm+pydantic": (load_orm, encode_pydantic),
+    "rows+orjson": (load_rows, encode_orjson),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.serialization")
+    parser.add_argument("--posts", type=int, default=1000)
+    parser.add_argument("--runs", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(bind=engine)
+        with engine.begin() as conn:
+            conn.execute(
+                User.__table__.insert(),
+                [{"username": "author", "email": "a@bog.test", "password": "-"}],
+            )
+            conn.execute(
+                Post.__table__.insert(),
+                [
+                    {
+                        "author": 1,
+                        "title": f"Post number {i}",
+                        "content": "Lorem ipsum dolor sit amet, consectetur. " * 8,
+                        "likesCount": i % 50,
+                    }
+                    for i in range(args.posts)
+                ],
+            )
+        Session = sessionmaker(bind=engine)
+
+        def end_to_end(load, encode):
+            def run():
+                with Session() as db:
+                    encode(load(db, args.posts))
+
+            return timed(run, args.runs)
+
+        def encoding_only(load, encode):
+            with Session() as db:
+                loaded = load(db, args.posts)
+                return timed(lambda: encode(loaded), args.runs)
+
+        print(f"{args.posts} posts, median of {args.runs} runs (ms)")
+        print(f"{'pipeline':>14} {'end to end':>11} {'encoding':>9}")
+        for name, (load, encode) in PIPELINES.items():
+            print(
+                f"{name:>14} {end_to_end(load, encode):>11.2f} "
+                f"{encoding_only(load, encode):>9.2f}"
+            )
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+sharding.py (benchmark)
+
+Measures sustained write throughput against the number of post shards (see
+`app/sharding.py`).
+
+For each shard count the same seeded social graph (`graph.py`) is generated
+in a single file, split with `python -m app.manage reshard`, and served by a
+uvicorn server started with `SHARDS` set accordingly (0 is the single-file
+layout). Every worker acts as its own user and keeps creating a post, then
+liking and unliking a post drawn from a Zipf distribution. Throughput counts
+the three kinds of writes together; responses with a 5xx status, transport
+failures and timeouts are errors.
+
+Shards only pay off when commits, not the CPU, are the bottleneck: run it
+with `--profile production` (synchronous commits) on a machine with several
+cores to see the write lock being spread.
+
+Usage:
+    python -m benchmarks.sharding [--shards 0 1 2 4] [--concurrency 64]
+        [--duration 10] [--profile default] [--write-queue]
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+from sqlalchemy import create_engine, select
+
+from .db_mode import ROOT, free_port, start_server
+from .harness import summarize
+
+
+def post_ids(directory: str, shards: int) -> list:
+    """
+    Reads the ids of the generated posts from the database files.
+
+    Resharding renumbers posts but keeps their order, so the result is in
+    generation order, like the ids 1..n of the single file.
+
+    Args:
+        directory (str): Directory holding `blog.db` and its shards.
+        shards (int): Number of shards, 0 for the single file.
+
+    Returns:
+        list[int]: Post ids, oldest first.
+    """
+    from app.models import Post
+
+    files = (
+        [f"blog.shard{shard}.db" for shard in range(shards)] if shards else ["blog.db"]
+    )
+    ids = []
+    for name in files:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, name)}")
+        with engine.connect() as connection:
+            ids.extend(connection.scalars(select(Post.id)))
+        engine.dispose()
+    return sorted(ids)
+
+
+async def write_mix(base: str, graph: dict, ids: list, args) -> dict:
+    """
+    Creates posts and likes then unlikes Zipf-distributed posts from
+    `args.concurrency` users.
+
+    Returns:
+        dict: Summary of all write requests, see `harness.summarize`.
+    """
+    from app.routes.auth import create_access_token
+
+    popularity = list(
+        itertools.accumulate(1 / rank**args.alpha for rank in range(1, len(ids) + 1))
+    )
+    samples = []
+    stop = time.monotonic() + args.duration
+    limits = httpx.Limits(max_connections=args.concurrency)
+
+    async with httpx.AsyncClient(base_url=base, limits=limits, timeout=30) as client:
+
+        async def request(method: str, url: str, headers: dict, json=None):
+            start = time.perf_counter()
+            try:
+                status = (
+                    await client.request(method, url, headers=headers, json=json)
+                ).status_code
+            except httpx.HTTPError:
+                status = 0
+            samples.append((status, (time.perf_counter() - start) * 1000))
+
+        async def worker(number: int):
+            rng = random.Random(args.seed * 1000 + number)
+            me = number % graph["users"] + 1
+            auth = {"Authorization": f"Bearer {create_access_token(f'user{me}', me)}"}
+            while time.monotonic() < stop:
+                post = rng.choices(ids, cum_weights=popularity)[0]
+                await request(
+                    "POST",
+                    "/posts",
+                    auth,
+                    {"title": f"post of worker {number}", "content": "sharded write"},
+                )
+                await request("POST", f"/posts/{post}/like", auth)
+                await request("DELETE", f"/posts/{post}/like", auth)
+
+        await asyncio.gather(*(worker(number) for number in range(args.concurrency)))
+
+    return summarize(samples, args.duration)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.sharding")
+    parser.add_argument("--shards", type=int, nargs="+", default=[0, 1, 2, 4])
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--alpha", type=float, default=1.1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--profile", choices=("default", "production"), default="default"
+    )
+    parser.add_argument(
+        "--write-queue", action="store_true", help="Also enable WRITE_QUEUE"
+    )
+    args = parser.parse_args()
+
+    print(
+        f"{'shards':>6} {'requests':>9} {'errors':>7} {'rejected':>9} "
+        f"{'writes/s':>9} {'p50 ms':>8} {'p99 ms':>8}"
+    )
+    for shards in args.shards:
+        with tempfile.TemporaryDirectory() as tmp:
+            # Imported once the database location is known, like the harness.
+            # The graph is generated in a single file, then split.
+            os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'blog.db')}"
+            os.environ["SHARDS"] = "0"
+            from .graph import generate
+
+            graph = generate(
+                os.environ["DATABASE_URL"],
+                users=args.users,
+                posts_per_user=2,
+                likes_per_user=5,
+                seed=args.seed,
+            )
+            if shards:
+                subprocess.run(
+                    [sys.executable, "-m", "app.manage", "reshard", str(shards)],
+                    cwd=tmp,
+                    env={**os.environ, "PYTHONPATH": ROOT},
+                    check=True,
+                    stderr=subprocess.DEVNULL,
+                    stdout=subprocess.DEVNULL,
+                )
+
+            port = free_port()
+            server = start_server(
+                tmp,
+                port,
+                {
+                    "SHARDS": str(shards),
+                    "WRITE_QUEUE": "1" if args.write_queue else "0",
+                    "DATABASE_PROFILE": args.profile,
+                },
+            )
+            try:
+                result = asyncio.run(
+                    write_mix(
+                        f"http://127.0.0.1:{port}",
+                        graph,
+                        post_ids(tmp, shards),
+                        args,
+                    )
+                )
+            finally:
+                server.terminate()
+                server.wait()
+
+        print(
+            f"{shards:>6} {result['requests']:>9} {result['errors']:>7} "
+            f"{result['rejected']:>9} {result['rps']:>9.1f} "
+            f"{result['p50']:>8.2f} {result['p99']:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+write_queue.py (benchmark)
+
+Compares sustained like throughput with and without the group-commit write
+queue (see `app/writequeue.py`).
+
+For each setting of `WRITE_QUEUE` a uvicorn server is started on the same
+seeded social graph (`graph.py`). Every worker acts as its own user and keeps
+liking then unliking posts drawn from a Zipf distribution, so most writes
+land on a few viral posts. Without the queue each request commits on its
+own; with it, the writes of concurrent requests share one commit. Throughput
+counts likes and unlikes together; responses with a 5xx status, transport
+failures and timeouts are errors.
+
+Usage:
+    python -m benchmarks.write_queue [--concurrency 64] [--duration 10]
+        [--profile default] [--interval-ms 2]
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import tempfile
+import time
+
+import httpx
+
+from .db_mode import free_port, start_server
+from .harness import summarize
+
+
+async def like_storm(base: str, graph: dict, args) -> dict:
+    """
+    Likes and unlikes Zipf-distributed posts from `args.concurrency` users.
+
+    Returns:
+        dict: Summary of all like and unlike requests, see `harness.summarize`.
+    """
+    from app.routes.auth import create_access_token
+
+    posts = graph["posts"]
+    popularity = list(
+        itertools.accumulate(1 / rank**args.alpha for rank in range(1, posts + 1))
+    )
+    ids = range(1, posts + 1)
+    samples = []
+    stop = time.monotonic() + args.duration
+    limits = httpx.Limits(max_connections=args.concurrency)
+
+    async with httpx.AsyncClient(base_url=base, limits=limits, timeout=30) as client:
+
+        async def request(method: str, url: str, headers: dict):
+            start = time.perf_counter()
+            try:
+                status = (
+                    await client.request(method, url, headers=headers)
+                ).status_code
+            except httpx.HTTPError:
+                status = 0
+            samples.append((status, (time.perf_counter() - start) * 1000))
+
+        async def worker(number: int):
+            rng = random.Random(args.seed * 1000 + number)
+            me = number % graph["users"] + 1
+            auth = {"Authorization": f"Bearer {create_access_token(f'user{me}', me)}"}
+            while time.monotonic() < stop:
+                post = rng.choices(ids, cum_weights=popularity)[0]
+                await request("POST", f"/posts/{post}/like", auth)
+                await request("DELETE", f"/posts/{post}/like", auth)
+
+        await asyncio.gather(*(worker(number) for number in range(args.concurrency)))
+
+    return summarize(samples, args.duration)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.write_queue")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--alpha", type=float, default=1.1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--profile", choices=("default", "production"), default="default"
+    )
+    parser.add_argument("--interval-ms", type=float, default=2)
+    args = parser.parse_args()
+
+    print(
+        f"{'write queue':>11} {'requests':>9} {'errors':>7} {'rejected':>9} "
+        f"{'ops/s':>9} {'p50 ms':>8} {'p99 ms':>8}"
+    )
+    for enabled in ("0", "1"):
+        with tempfile.TemporaryDirectory() as tmp:
+            # Imported once the database location is known, like the harness
+            os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'blog.db')}"
+            from .graph import generate
+
+            graph = generate(
+                os.environ["DATABASE_URL"],
+                users=args.users,
+                posts_per_user=2,
+                likes_per_user=5,
+                seed=args.seed,
+            )
+            port = free_port()
+            server = start_server(
+                tmp,
+                port,
+                {
+                    "WRITE_QUEUE": enabled,
+                    "WRITE_QUEUE_INTERVAL_MS": str(args.interval_ms),
+                    "DATABASE_PROFILE": args.profile,
+                },
+            )
+            try:
+                result = asyncio.run(
+                    like_storm(f"http://127.0.0.1:{port}", graph, args)
+                )
+            finally:
+                server.terminate()
+                server.wait()
+
+        print(
+            f"{'on' if enabled == '1' else 'off':>11} {result['requests']:>9} "
+            f"{result['errors']:>7} {result['rejected']:>9} {result['rps']:>9.1f} "
+            f"{result['p50']:>8.2f} {result['p99']:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
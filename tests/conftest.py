@@ -0,0 +1,64 @@
+"""
+conftest.py
+
+Configures the application for the test suite and provides a client and
+registered users.
+
+The configuration is read from the environment when `app` is first imported,
+so it is set here, before any test module imports it: a fresh database in a
+temporary directory, the query guard in raise mode (a route exceeding its
+`query_budget` fails the test that called it) and cheap password hashing.
+Other settings are left to the environment, e.g. `SHARDS=2 pytest` runs the
+suite against sharded posts.
+"""
+
+import os
+import tempfile
+
+_directory = tempfile.mkdtemp(prefix="bog-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_directory, 'blog.db')}"
+os.environ["QUERY_GUARD"] = "raise"
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ.setdefault("HASH_WORKERS", "1")
+
+import pytest  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.main import app  # noqa: E402
+
+PASSWORD = "password"
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture(scope="session")
+def register(client):
+    """
+    Registers users and logs them in.
+
+    Returns:
+        Callable[[str], tuple[int, dict]]: Takes a username, returns the id of
+        the new user and the headers authenticating as them.
+    """
+
+    def register(username: str) -> tuple[int, dict]:
+        response = client.post(
+            "/users",
+            json={
+                "username": username,
+                "email": f"{username}@example.com",
+                "gender": "x",
+                "password": PASSWORD,
+            },
+        )
+        assert response.status_code == 201, response.text
+        token = client.post(
+            "/auth/token", data={"username": username, "password": PASSWORD}
+        ).json()["access_token"]
+        return response.json()["id"], {"Authorization": f"Bearer {token}"}
+
+    return register
@@ -0,0 +1,129 @@
+"""
+test_export.py
+
+Checks the NDJSON export of `GET /users/{user_id}/export` (see
+`routes/export.py`): every section is complete, and the memory it takes
+stays within a few chunks of rows on an account far larger than that. The
+million-post check is `python -m benchmarks.export`.
+"""
+
+import tracemalloc
+
+import orjson
+from sqlalchemy import insert
+
+from app import sharding
+from app.database import ReadSessionLocal, SessionLocal
+from app.models import Post
+from app.routes import export
+
+POSTS = 100 * export.EXPORT_CHUNK
+BATCH = 10000
+
+# Generous heap cost of one row being exported: the fetched row, its dict and
+# its line (about 5 MB per chunk of 1000 posts is measured)
+ROW_BYTES = 4096
+
+
+def test_export(client, register):
+    author_id, author_headers = register("export_author")
+    follower_id, headers = register("export_follower")
+    client.post(f"/users/{author_id}/follow", headers=headers)
+    post = client.post(
+        "/posts", json={"title": "liked", "content": "text"}, headers=author_headers
+    ).json()
+    client.post(f"/posts/{post['id']}/like", headers=headers)
+
+    response = client.get(f"/users/{follower_id}/export", headers=headers)
+
+    assert response.status_code == 200
+    lines = [orjson.loads(line) for line in response.content.splitlines()]
+    assert lines[0]["type"] == "user"
+    assert lines[0]["username"] == "export_follower"
+    assert [line["post_id"] for line in lines if line["type"] == "like"] == [post["id"]]
+    assert [line["user_id"] for line in lines if line["type"] == "following"] == [
+        author_id
+    ]
+    assert lines[-1] == {
+        "type": "end",
+        "posts": 0,
+        "likes": 1,
+        "following": 1,
+        "followers": 0,
+    }
+
+
+def test_export_of_another_user(client, register):
+    user_id, _ = register("export_owner")
+    _, headers = register("export_other")
+
+    response = client.get(f"/users/{user_id}/export", headers=headers)
+
+    assert response.status_code == 403
+
+
+def add_posts(user_id: int, count: int):
+    """
+    Inserts posts straight into the author's shard, far faster than the bulk
+    route. Counters, timelines and the search index are left as they are; the
+    export does not read them.
+    """
+    statement = insert(Post)
+    id = sharding.new_post_id(user_id)
+    if id is not None:
+        statement = statement.values(id=id)
+
+    shard = sharding.shard_of_author(user_id) if sharding.ENABLED else None
+    factory = SessionLocal if shard is None else sharding.SessionFactories[shard]
+    with factory() as db:
+        for start in range(0, count, BATCH):
+            db.execute(
+                statement,
+                [
+                    {"author": user_id, "title": f"post {n}", "content": "lorem " * 40}
+                    for n in range(start, min(count, start + BATCH))
+                ],
+            )
+        db.commit()
+
+
+def measure(client, user_id: int) -> tuple[int, int, int]:
+    """
+    Runs the export of a user through `export_lines` and measures the Python
+    heap meanwhile. The test client buffers whole responses, so the body is
+    counted and dropped here instead, as the server would send it.
+
+    Returns:
+        tuple[int, int, int]: Bytes exported, posts exported and peak heap size.
+    """
+    with ReadSessionLocal() as db:
+        profile = export._profile(db, user_id)
+
+    async def drain():
+        size = 0
+        async for chunk in export.export_lines(profile):
+            size += len(chunk)
+        return size, orjson.loads(chunk.splitlines()[-1])["posts"]
+
+    # On the client's event loop, which the async engine's connections belong to
+    tracemalloc.start()
+    try:
+        size, posts = client.portal.call(drain)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return size, posts, peak
+
+
+def test_export_memory_does_not_grow_with_the_account(client, register):
+    user_id, _ = register("export_prolific")
+    add_posts(user_id, POSTS)
+
+    size, posts, peak = measure(client, user_id)
+
+    assert posts == POSTS
+    # A few chunks in memory at once; the whole export would not fit
+    ceiling = 3 * export.EXPORT_CHUNK * ROW_BYTES
+    assert size > ceiling
+    assert peak < ceiling, (peak, ceiling)
@@ -0,0 +1,30 @@
+"""
+test_loader.py
+
+Checks how `loader._prepare` fills the optional columns of a row: missing and
+empty values are left to the database or stamped, zeros are kept.
+"""
+
+from app.loader import _prepare
+
+
+def test_prepare_keeps_zeros():
+    row = {"author": "1", "title": "old", "content": "text", "createdAt": "0"}
+
+    values = _prepare("posts", row, 1, hash_passwords=False)
+
+    assert values == {
+        "author": 1,
+        "title": "old",
+        "content": "text",
+        "id": None,
+        "createdAt": 0,
+    }
+
+
+def test_prepare_fills_missing_values():
+    row = {"likedBy": 1, "likedPost": 2, "createdAt": ""}
+
+    values = _prepare("likes", row, 1, hash_passwords=False)
+
+    assert values["createdAt"] > 0
@@ -0,0 +1,74 @@
+"""
+test_migrations.py
+
+Checks that `migrations.add_missing` upgrades the tables of a database
+created by the first version of the application, and leaves an up-to-date
+database alone.
+"""
+
+from sqlalchemy import create_engine, inspect, text
+
+from app.database import Base
+from app.migrations import add_missing
+from app.models import Post, User, follow, likes
+
+# Schema of the first release
+OLD_SCHEMA = (
+    'CREATE TABLE "Users" (id INTEGER NOT NULL PRIMARY KEY, username VARCHAR, '
+    "email VARCHAR NOT NULL, gender VARCHAR, password VARCHAR NOT NULL)",
+    'CREATE TABLE "Posts" (id INTEGER NOT NULL PRIMARY KEY, author INTEGER, '
+    "title TEXT NOT NULL, content TEXT)",
+    "CREATE TABLE follow (follower INTEGER NOT NULL, followee INTEGER NOT NULL, "
+    "PRIMARY KEY (follower, followee))",
+    'CREATE TABLE likes ("likedBy" INTEGER NOT NULL, "likedPost" INTEGER NOT NULL, '
+    'PRIMARY KEY ("likedBy", "likedPost"))',
+    "INSERT INTO \"Users\" VALUES (1, 'old', 'old@example.com', 'x', '-')",
+    "INSERT INTO \"Posts\" VALUES (1, 1, 'old post', 'text')",
+    "INSERT INTO likes VALUES (1, 1)",
+)
+
+
+def test_add_missing(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as connection:
+        for statement in OLD_SCHEMA:
+            connection.execute(text(statement))
+
+    with engine.begin() as connection:
+        added = add_missing(connection, Base.metadata.sorted_tables)
+        Base.metadata.create_all(bind=connection)
+
+    assert {
+        "Users.followersCount",
+        "Users.followingCount",
+        "Users.postsCount",
+        "Users.postsVersion",
+        "Users.postsModified",
+        "Posts.likesCount",
+        "Posts.createdAt",
+        "likes.createdAt",
+        "timeline",
+        "listing_versions",
+    } <= added
+    assert not any(name.startswith("follow.") for name in added)
+
+    inspector = inspect(engine)
+    for table in (User.__table__, Post.__table__, follow, likes):
+        assert {column["name"] for column in inspector.get_columns(table.name)} == {
+            column.name for column in table.columns
+        }
+    assert "ix_likes_createdAt" in {
+        index["name"] for index in inspector.get_indexes("likes")
+    }
+
+    with engine.connect() as connection:
+        assert connection.execute(
+            text('SELECT "postsCount", "postsVersion" FROM "Users"')
+        ).one() == (0, 0)
+        assert connection.execute(
+            text('SELECT "likesCount", "createdAt" FROM "Posts"')
+        ).one() == (0, 0)
+
+    with engine.begin() as connection:
+        assert add_missing(connection, Base.metadata.sorted_tables) == set()
+    engine.dispose()
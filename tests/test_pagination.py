@@ -0,0 +1,172 @@
+"""
+test_pagination.py
+
+Checks that post listings page with keyset cursors (see `pagination.py`):
+every page is read with a seek on the sort key, never by skipping rows with
+`OFFSET`, and malformed or out-of-range cursors are refused with 400.
+"""
+
+import base64
+import json
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+POSTS = 7
+PAGE = 3
+
+
+@contextmanager
+def captured_sql():
+    """
+    Records the statements and parameters sent to every database, shards included.
+
+    Yields:
+        list[tuple[str, tuple]]: (statement, parameters) pairs, filled as they run.
+    """
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(Engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(Engine, "before_cursor_execute", record)
+
+
+def assert_no_offset(statements: list):
+    # SQLite renders a LIMIT without OFFSET as `LIMIT ? OFFSET ?` bound to 0
+    limited = [
+        (statement, parameters)
+        for statement, parameters in statements
+        if "LIMIT" in statement
+    ]
+    assert limited, "no page was read from the database"
+    for statement, parameters in statements:
+        if "OFFSET" in statement:
+            assert statement.rstrip().endswith("LIMIT ? OFFSET ?"), statement
+            assert statement.count("OFFSET") == 1, statement
+            assert parameters[-1] == 0, (statement, parameters)
+
+
+def walk(client, path: str, headers: dict | None = None) -> list[int]:
+    # Follows `next_cursor` to the last page, returning the post ids in order
+    ids = []
+    cursor = None
+    while True:
+        query = f"{path}?limit={PAGE}" + (f"&cursor={cursor}" if cursor else "")
+        response = client.get(query, headers=headers)
+        assert response.status_code == 200, response.text
+        ids += [post["id"] for post in response.json()["posts"]]
+        cursor = response.json()["next_cursor"]
+        if cursor is None:
+            return ids
+
+
+@pytest.fixture(scope="module")
+def author(register, client):
+    """
+    A user with `POSTS` posts, created in one bulk request.
+
+    Returns:
+        tuple[str, dict, list[int]]: Username, headers and post ids, newest first.
+    """
+    _, headers = register("paging_author")
+    response = client.post(
+        "/posts/bulk",
+        json={
+            "posts": [{"title": f"page {n}", "content": "text"} for n in range(POSTS)]
+        },
+        headers=headers,
+    )
+    assert response.status_code in (200, 201), response.text
+    ids = sorted((post["id"] for post in response.json()), reverse=True)
+    return "paging_author", headers, ids
+
+
+def test_user_posts_seek_without_offset(client, author):
+    username, _, ids = author
+
+    with captured_sql() as statements:
+        assert walk(client, f"/feed/{username}") == ids
+
+    assert_no_offset(statements)
+
+
+def test_home_timeline_seeks_without_offset(client, register):
+    _, headers = register("paging_reader")
+    user_id, author_headers = register("paging_followed")
+    assert client.post(f"/users/{user_id}/follow", headers=headers).status_code == 200
+    response = client.post(
+        "/posts/bulk",
+        json={
+            "posts": [{"title": f"home {n}", "content": "text"} for n in range(POSTS)]
+        },
+        headers=author_headers,
+    )
+    assert response.status_code in (200, 201), response.text
+    ids = sorted((post["id"] for post in response.json()), reverse=True)
+
+    with captured_sql() as statements:
+        assert walk(client, "/feed/home", headers) == ids
+
+    assert_no_offset(statements)
+
+
+def cursor_of(key) -> str:
+    raw = json.dumps(key).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "not a cursor",
+        cursor_of([1]),
+        cursor_of({"id": "1"}),
+        cursor_of({"id": True}),
+        cursor_of({"id": 2**63}),
+        cursor_of({"id": -(2**63) - 1}),
+        cursor_of({"id": 10**30}),
+    ],
+)
+def test_invalid_cursor(client, author, cursor):
+    username, _, _ = author
+
+    response = client.get(f"/feed/{username}?cursor={cursor}")
+
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Invalid cursor"}
+
+
+def test_largest_cursor(client, author):
+    username, _, ids = author
+
+    response = client.get(f"/feed/{username}?cursor={cursor_of({'id': 2**63 - 1})}")
+
+    assert response.status_code == 200
+    assert [post["id"] for post in response.json()["posts"]] == ids
+
+
+@pytest.mark.parametrize(
+    "rank", [None, "1.5", True, float("nan"), float("inf"), float("-inf")]
+)
+def test_invalid_search_cursor(client, author, rank):
+    cursor = cursor_of({"rank": rank, "id": 1})
+
+    response = client.get(f"/posts/search?q=page&cursor={cursor}")
+
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Invalid cursor"}
+
+
+def test_search_cursor(client, author):
+    cursor = cursor_of({"rank": -1.5, "id": 2**63 - 1})
+
+    response = client.get(f"/posts/search?q=page&cursor={cursor}")
+
+    assert response.status_code == 200
@@ -0,0 +1,201 @@
+"""
+test_query_budgets.py
+
+Drives the main routes with the query guard in raise mode (see
+`conftest.py`), so that every `query_budget` declared in `app/routes/` is
+checked: a route running more statements than its budget, or one statement
+shape once per row, raises `QueryBudgetExceeded` in the test.
+
+The data is sized so that an N+1 query would show: pages of several posts,
+users following and followed by several others, posts liked by several users.
+"""
+
+import pytest
+
+AUTHORS = 5
+POSTS_PER_AUTHOR = 4
+
+
+@pytest.fixture(scope="module")
+def network(register, client):
+    """
+    A reader following every author, authors following each other and the
+    reader, each author's posts and the reader's likes on them. The writes
+    go through the routes, so their budgets are checked too.
+
+    Returns:
+        dict: `reader` and `authors` as (id, headers, username), and `posts`,
+        the ids of every post.
+    """
+    reader = ("budget_reader", *register("budget_reader"))
+    authors = [
+        (f"budget_author{i}", *register(f"budget_author{i}")) for i in range(AUTHORS)
+    ]
+
+    posts = []
+    for username, user_id, headers in authors:
+        response = client.post(
+            "/posts",
+            json={"title": f"first post by {username}", "content": "hello bog"},
+            headers=headers,
+        )
+        assert response.status_code in (200, 201), response.text
+        posts.append(response.json()["id"])
+
+        response = client.post(
+            "/posts/bulk",
+            json={
+                "posts": [
+                    {"title": f"post {n} by {username}", "content": "hello again"}
+                    for n in range(POSTS_PER_AUTHOR - 1)
+                ]
+            },
+            headers=headers,
+        )
+        assert response.status_code in (200, 201), response.text
+        posts += [post["id"] for post in response.json()]
+
+    for _, user_id, _ in authors:
+        response = client.post(f"/users/{user_id}/follow", headers=reader[2])
+        assert response.status_code == 200, response.text
+
+    for _, _, headers in authors:
+        response = client.post(
+            "/users/follow/bulk",
+            json={
+                "action": "follow",
+                "user_ids": [user_id for _, user_id, _ in authors] + [reader[1]],
+            },
+            headers=headers,
+        )
+        assert response.status_code == 200, response.text
+
+    for post_id in posts[::2]:
+        response = client.post(f"/posts/{post_id}/like", headers=reader[2])
+        assert response.status_code == 200, response.text
+
+    return {
+        "reader": (reader[1], reader[2], reader[0]),
+        "authors": [(user_id, headers, name) for name, user_id, headers in authors],
+        "posts": posts,
+    }
+
+
+def test_current_user(client, network):
+    _, headers, username = network["reader"]
+
+    response = client.get("/user", headers=headers)
+
+    assert response.status_code == 200
+    assert response.json()["user"]["username"] == username
+
+
+def test_home_timeline(client, network):
+    _, headers, _ = network["reader"]
+
+    first = client.get("/feed/home?limit=10", headers=headers)
+    assert first.status_code == 200
+    assert len(first.json()["posts"]) == 10
+
+    cursor = first.json()["next_cursor"]
+    second = client.get(f"/feed/home?limit=10&cursor={cursor}", headers=headers)
+    assert second.status_code == 200
+    assert len(second.json()["posts"]) == AUTHORS * POSTS_PER_AUTHOR - 10
+
+
+def test_user_posts(client, network):
+    _, _, username = network["authors"][0]
+
+    first = client.get(f"/feed/{username}?limit=2")
+    assert first.status_code == 200
+    assert len(first.json()["posts"]) == 2
+
+    cursor = first.json()["next_cursor"]
+    second = client.get(f"/feed/{username}?limit=10&cursor={cursor}")
+    assert second.status_code == 200
+    assert len(second.json()["posts"]) == POSTS_PER_AUTHOR - 2
+
+
+def test_random_users(client, network):
+    reader_id, headers, _ = network["reader"]
+    followed = {author_id for author_id, _, _ in network["authors"]}
+
+    assert client.get("/feed?count=5").status_code == 200
+
+    response = client.get("/feed?count=5&exclude_followed=true", headers=headers)
+    assert response.status_code == 200
+    assert not {user["id"] for user in response.json()} & (followed | {reader_id})
+
+
+def test_trending(client, network):
+    response = client.get("/feed/trending?limit=10")
+
+    assert response.status_code == 200
+
+
+def test_suggestions(client, network):
+    user_id, _, _ = network["authors"][0]
+
+    response = client.get(f"/users/{user_id}/suggestions?limit=10")
+
+    assert response.status_code == 200
+
+
+def test_like_states(client, network):
+    _, headers, _ = network["reader"]
+    posts = network["posts"][:10]
+
+    response = client.get(
+        "/posts/likes?" + "&".join(f"ids={id}" for id in posts), headers=headers
+    )
+
+    assert response.status_code == 200
+    assert [state["liked"] for state in response.json()["posts"]] == [
+        index % 2 == 0 for index in range(len(posts))
+    ]
+
+
+def test_search(client, network):
+    response = client.get("/posts/search?q=hello&limit=5")
+
+    assert response.status_code == 200
+    assert len(response.json()["posts"]) == 5
+
+
+def test_update_unlike_and_delete(client, network):
+    _, reader_headers, _ = network["reader"]
+    _, headers, _ = network["authors"][-1]
+    post_id = network["posts"][-POSTS_PER_AUTHOR]
+
+    response = client.put(
+        f"/posts/{post_id}", json={"title": "edited", "content": "bye"}, headers=headers
+    )
+    assert response.status_code == 200, response.text
+
+    response = client.delete(f"/posts/{post_id}/like", headers=reader_headers)
+    assert response.status_code == 200, response.text
+
+    response = client.delete(f"/posts/{post_id}", headers=headers)
+    assert response.status_code == 200, response.text
+
+
+def test_unfollow(client, register, network):
+    user_id, headers = register("budget_unfollower")
+    targets = [author_id for author_id, _, _ in network["authors"]]
+
+    response = client.post(
+        "/users/follow/bulk",
+        json={"action": "follow", "user_ids": targets},
+        headers=headers,
+    )
+    assert response.status_code == 200, response.text
+
+    response = client.delete(f"/users/{targets[0]}/unfollow", headers=headers)
+    assert response.status_code == 200, response.text
+
+    response = client.post(
+        "/users/follow/bulk",
+        json={"action": "unfollow", "user_ids": targets[1:]},
+        headers=headers,
+    )
+    assert response.status_code == 200, response.text
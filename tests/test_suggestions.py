@@ -0,0 +1,64 @@
+"""
+test_suggestions.py
+
+Checks `GET /users/{user_id}/suggestions` (see `followgraph.py`): friends of
+friends ranked by mutual-follow count, the same before and after the arrays
+are rebuilt, and 503 while the follow graph has never been built.
+"""
+
+from app.followgraph import FollowGraph, follow_graph
+from app.routes import follow
+
+
+def ranking(response) -> list[tuple[int, int]]:
+    return [(user["id"], user["mutual_count"]) for user in response.json()]
+
+
+def test_suggestions_rank_friends_of_friends(client, register):
+    me, headers = register("suggest_me")
+    friends = [register(f"suggest_friend{n}") for n in range(3)]
+    x, y, z = (register(f"suggest_{name}")[0] for name in "xyz")
+
+    for friend_id, _ in friends:
+        response = client.post(f"/users/{friend_id}/follow", headers=headers)
+        assert response.status_code == 200, response.text
+    # x is followed by three friends, y by two, z by one. Me and the friends
+    # I already follow are never suggested.
+    follows = [
+        [x, y, z, me, friends[1][0]],
+        [x, y, friends[2][0]],
+        [x],
+    ]
+    for (_, friend_headers), targets in zip(friends, follows):
+        response = client.post(
+            "/users/follow/bulk",
+            json={"action": "follow", "user_ids": targets},
+            headers=friend_headers,
+        )
+        assert response.status_code == 200, response.text
+
+    expected = [(x, 3), (y, 2), (z, 1)]
+
+    response = client.get(f"/users/{me}/suggestions")
+    assert response.status_code == 200
+    assert ranking(response) == expected
+
+    # From the rebuilt arrays rather than the overlay
+    follow_graph._built_at = float("-inf")
+    client.get(f"/users/{me}/suggestions")
+    assert follow_graph.wait(10)
+    response = client.get(f"/users/{me}/suggestions?limit=2")
+    assert ranking(response) == expected[:2]
+
+
+def test_suggestions_before_the_first_build(client, register, monkeypatch):
+    user_id, _ = register("suggest_early")
+    graph = FollowGraph()
+    # A first build that has not completed yet
+    monkeypatch.setattr(graph, "ensure_fresh", lambda session_factory: None)
+    monkeypatch.setattr(follow, "follow_graph", graph)
+
+    response = client.get(f"/users/{user_id}/suggestions")
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"]
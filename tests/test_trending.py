@@ -0,0 +1,42 @@
+"""
+test_trending.py
+
+Checks the time-decayed like scores of `trending.py`: a rebuild counts the
+likes committed while it runs once, and the scores are built before the
+application serves requests.
+"""
+
+import time
+
+from app import trending
+from app.trending import _SLOT, TrendingPosts
+
+
+def slot(at: float) -> int:
+    return int(at) // _SLOT
+
+
+def test_rebuild_counts_concurrent_likes_once():
+    scores = TrendingPosts()
+    now = time.time()
+
+    assert scores.begin_rebuild()
+    # Committed before the rebuild took its time: read from the database too
+    scores.like(1, at=int(now) - 1)
+    # Committed after it: left out of the database counts
+    scores.like(2, at=int(now) + 1)
+    scores.discard(3)
+    scores.finish_rebuild(
+        [(1, slot(now - 1), 1), (3, slot(now - 1), 1), (4, slot(now - 1), 2)], now
+    )
+
+    top = dict(scores.top(10))
+    assert set(top) == {1, 2, 4}
+    assert 0.99 < top[1] < 1.01
+    assert 0.99 < top[2] < 1.01
+    assert 1.98 < top[4] < 2.02
+
+
+def test_scores_are_built_at_startup(client):
+    assert trending.trending.ready
+    assert client.get("/feed/trending/stats").json()["rebuilds"] >= 1